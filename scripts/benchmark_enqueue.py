@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models import Job
+from queue_manager import ThreadSafePriorityQueue
+from workload import generate_jobs
+
+
+def make_jobs(specs: list[dict]) -> list[Job]:
+    return [Job(id=s["id"], material=s["material"], est_time=s["est_time"], priority=s["priority"]) for s in specs]
+
+
+async def per_job(jobs: list[Job]) -> float:
+    queue = ThreadSafePriorityQueue()
+    start = time.perf_counter()
+    for job in jobs:
+        await queue.put(job)
+    return time.perf_counter() - start
+
+
+async def bulk(jobs: list[Job]) -> float:
+    queue = ThreadSafePriorityQueue()
+    start = time.perf_counter()
+    await queue.put_many(jobs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-job put with put_many on the job queue')
+    parser.add_argument('--count', '-n', type=int, default=1_000_000, help='Number of jobs (default: 1000000)')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Runs per method, the best is reported (default: 3)')
+    parser.add_argument('--seed', '-s', type=int, default=1)
+    args = parser.parse_args()
+
+    specs = list(generate_jobs(args.count, seed=args.seed))
+    results = {}
+    for name, method in (("put", per_job), ("put_many", bulk)):
+        #fresh Job objects per run, queueing sets their queued_at
+        results[name] = min(asyncio.run(method(make_jobs(specs))) for _ in range(args.repeat))
+        print(f"{name:<10}{results[name]:>10.3f} s  {args.count / results[name]:>14,.0f} jobs/s")
+    print(f"Speed-up: {results['put'] / results['put_many']:.1f}x")
+
+if __name__ == "__main__":
+    main()
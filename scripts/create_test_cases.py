@@ -1,38 +1,53 @@
-
-import json 
-import random
+import argparse
+import sys
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-MATERIALS = ["PLA", "PETG", "ABS", "TPU"]
-
-def create_test_job(count: int) -> list[dict]:
-    jobs = []
-    for i in range(count):
-        jobs.append({
-            "id": f"P{i}",
-            "material": random.choice(MATERIALS),
-            "est_time": random.randint(10,40),
-            "priority": random.randint(0,5)
-        })
-    return jobs
+from workload import ARRIVAL_PROCESSES, generate_jobs, write_workload
 
 
 def main():
-    jobs = create_test_job(10)
-    data = {"jobs": jobs}
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"test_case_report_{timestamp}.json"
-
-    dirpath = Path("test_data")
-    dirpath.mkdir(exist_ok=True)
-
-    filepath = dirpath / filename
+    parser = argparse.ArgumentParser(
+        description='Generate a reproducible synthetic workload',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+    Examples:
+            python scripts/create_test_cases.py
+            python scripts/create_test_cases.py --count 1000000 --seed 7 --arrival poisson --rate 50 --format ndjson
+            python scripts/create_test_cases.py --count 5000 --arrival bursty --burst-size 25 --cancel-fraction 0.05
+            """
+    )
+    parser.add_argument('--count', '-n', type=int, default=10, help='Number of jobs (default: 10)')
+    parser.add_argument('--seed', '-s', type=int, default=None, help='Random seed for a reproducible workload')
+    parser.add_argument('--arrival', '-a', choices=ARRIVAL_PROCESSES, default="none",
+                        help='Arrival process (default: none, every job is available at start)')
+    parser.add_argument('--rate', '-r', type=float, default=1.0, help='Mean arrivals per simulated second (default: 1.0)')
+    parser.add_argument('--burst-size', type=float, default=10.0, help='Mean jobs per burst for bursty arrivals (default: 10)')
+    parser.add_argument('--cancel-fraction', type=float, default=0.0, help='Share of jobs that get a cancel_at time (default: 0)')
+    parser.add_argument('--mean-patience', type=float, default=60.0,
+                        help='Mean time between arrival and cancellation (default: 60)')
+    parser.add_argument('--format', '-f', choices=("json", "ndjson"), default="json", help='Output format (default: json)')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Output file (default: test_data/test_case_report_<timestamp>)')
+    args = parser.parse_args()
+
+    filepath = args.output
+    if filepath is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = Path("test_data") / f"test_case_report_{timestamp}.{args.format}"
+
+    jobs = generate_jobs(
+        count=args.count,
+        seed=args.seed,
+        arrival=args.arrival,
+        rate=args.rate,
+        burst_size=args.burst_size,
+        cancel_fraction=args.cancel_fraction,
+        mean_patience=args.mean_patience
+    )
+    written = write_workload(jobs, filepath, fmt=args.format)
+    print(f"Wrote {written} jobs to {filepath}")
 
-    with open(filepath,'w', encoding='utf-8') as f:
-        json.dump(data,f, indent=2)
-            
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,83 @@
+import math
+from collections import OrderedDict
+from typing import Optional
+from models import clock
+
+POLICIES = ("reject", "shed", "block")
+
+
+class Overloaded(Exception):
+    """
+    Jobs refused by admission control (queue full or client over its rate), retry_after
+    is the suggested wait in whole seconds
+    """
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """rate tokens per second up to burst, starts full"""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = clock()
+
+    def take(self, count: int = 1) -> float:
+        """Take count tokens, 0 when granted or the seconds until they are available (nothing taken)"""
+        now = clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if count <= self.tokens:
+            self.tokens -= count
+            return 0.0
+        if count > self.burst:
+            return math.inf # can never be granted at once
+        return (count - self.tokens) / self.rate
+
+
+class AdmissionControl:
+    """
+    Limits of job ingest: a bound on the backlog (queued jobs plus jobs waiting for their
+    arrival time) and a token bucket per client
+
+    Over the backlog bound a batch is rejected whole (reject), trimmed to its most urgent
+    jobs that fit (shed) or queued in chunks as room opens, up to block_timeout seconds
+    (block). Client buckets are kept for the max_clients most recently seen clients.
+    Refused jobs are counted per reason
+    """
+    def __init__(self, max_queue: Optional[int] = None, policy: str = "reject", rate: Optional[float] = None,
+                 burst: Optional[float] = None, block_timeout: Optional[float] = None, max_clients: int = 10000):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown admission policy {policy}, expected one of {', '.join(POLICIES)}")
+        if max_queue is not None and max_queue < 1:
+            raise ValueError("Queue limit must be at least 1")
+        if rate is not None and rate <= 0:
+            raise ValueError("Rate limit must be positive")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.block_timeout = block_timeout
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.counts = {"rejected": 0, "shed": 0, "rate_limited": 0, "blocked": 0}
+
+    def check_rate(self, client: Optional[str], count: int) -> None:
+        """Take count tokens from the client's bucket, raises Overloaded when it is short"""
+        if self.rate is None or client is None:
+            return
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take(count)
+        if math.isinf(wait):
+            raise ValueError(f"Batch of {count} jobs exceeds the burst of {self.burst:g} jobs per client")
+        if wait:
+            self.counts["rate_limited"] += count
+            raise Overloaded(f"Client {client} is over its rate of {self.rate:g} jobs/s", retry_after=wait)
@@ -1,26 +1,34 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from pathlib import Path
 import asyncio
+import json
+import os
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Any, Literal, Optional
 from simulator import Simulator
-from models import Job
+from queue_service import LocalQueue, RemoteQueue, QueueServiceError
+from admission import AdmissionControl, Overloaded
+from autoscaler import Autoscaler, parse_bounds
+from simulation_service import SimulationService, ServiceBusy
+from result_cache import ResultCache
+from response_cache import ResponseCache, etag_matches
+from json_manager import load_fleet_from_json
+from instrumentation import PROFILE_KINDS
+from event_log import setup_logging, log_event
 import logging
 
 log_dir = Path(__file__).parent.parent / "logs"
 log_dir.mkdir(exist_ok=True)
-logging.basicConfig(
-    filename= log_dir /'simulation.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s'
-)
+setup_logging(log_dir)
 
 class JobCreate(BaseModel):
     id: str
     material: str
     est_time: float = Field(gt=0)
     priority: int = Field(ge=0)
+    tag: Optional[str] = None
 
 class JobResponse(BaseModel):
     id: str
@@ -28,24 +36,222 @@ class JobResponse(BaseModel):
     est_time: float
     priority: int
     status: str
+    tag: Optional[str] = None
+    preemptions: int = 0
+
+class JobUpdate(BaseModel):
+    priority: int = Field(ge=0)
+
+class EtaResponse(BaseModel):
+    job_id: str
+    status: str
+    printer_id: Optional[int] = None
+    position: Optional[int] = None
+    start_in: Optional[float] = None
+    finish_in: Optional[float] = None
+    start_at: Optional[float] = None
+    finish_at: Optional[float] = None
+    arrives_in: Optional[float] = None
+    arrives_at: Optional[float] = None
+    beyond_horizon: bool = False
+
+class BulkCancelResponse(BaseModel):
+    cancelled: int
+    job_ids: list[str]
+
+class Distribution(BaseModel):
+    avg: float
+    max: float
+    p50: float
+    p90: float
+    p95: float
+    p99: float
+
+class GroupStats(BaseModel):
+    completed: int
+    cancelled: int
+    wait_time: Distribution
+    run_time: Distribution
+
+class PriorityStats(GroupStats):
+    priority: int
+
+class MaterialStats(GroupStats):
+    material: str
+
+class ThroughputWindow(BaseModel):
+    start: float
+    end: float
+    completed: int
+    throughput: float
+
+class AdmissionStats(BaseModel):
+    rejected: int
+    shed: int
+    rate_limited: int
+    blocked: int
+
+class PreemptionStats(BaseModel):
+    preemptions: int
+    lost_time: float
 
 class StatsResponse(BaseModel):
     avg_wait_time: float
     median_wait_time: float
     throughput: float
     total_completed: int
+    overall: GroupStats
+    by_priority: list[PriorityStats]
+    by_material: list[MaterialStats]
+    window: float
+    throughput_windows: list[ThroughputWindow]
+    admission: AdmissionStats
+    preemption: PreemptionStats
 
-#Global sim instance
+class PrinterResponse(BaseModel):
+    id: int
+    printer_class: str
+    speed: float
+    materials: Optional[list[str]]
+    busy: bool
+    current_job: Optional[str]
+    state: str = "online"
+
+class PrinterCreate(BaseModel):
+    printer_class: str = "standard"
+    speed: float = Field(1.0, gt=0)
+    materials: Optional[list[str]] = Field(None, min_length=1) # None prints any material
+    count: int = Field(1, ge=1, le=100)
+
+class RunResponse(BaseModel):
+    run_id: int
+    started_at: float
+    finished_at: Optional[float]
+    duration: Optional[float]
+    num_printers: Optional[int]
+    time_scale: Optional[float]
+    job_count: Optional[int]
+
+class RunStatsResponse(BaseModel):
+    run_id: int
+    total_jobs: int
+    completed: int
+    cancelled: int
+    avg_wait_time: float
+    max_wait_time: float
+    p50_wait_time: float
+    p90_wait_time: float
+    p95_wait_time: float
+    p99_wait_time: float
+    avg_run_time: float
+    throughput: float
+    duration: Optional[float]
+    preemptions: int = 0
+
+class SimulationJob(BaseModel):
+    id: str
+    material: str
+    est_time: float = Field(gt=0)
+    priority: int = Field(ge=0)
+    arrival_time: Optional[float] = Field(None, ge=0)
+    cancel_at: Optional[float] = Field(None, ge=0)
+    tag: Optional[str] = None
+
+class SimulationCreate(BaseModel):
+    jobs: list[SimulationJob] = Field(min_length=1)
+    engine: Literal["virtual", "realtime"] = "virtual"
+    num_printers: int = Field(2, ge=1, le=1000)
+    policy: Literal["priority", "fifo", "sjf"] = "priority" # virtual engine only
+    fleet: Optional[list[dict]] = None # realtime engine only, printer specs as in SIMULATOR_FLEET
+    time_scale: float = Field(0.01, gt=0) # realtime engine only
+    preemption: Optional[Literal["resume", "restart"]] = None # realtime engine only
+    preempt_priority: int = Field(0, ge=0) # realtime engine only, jobs this urgent preempt less urgent ones
+    timeout: float = Field(300.0, gt=0) # realtime engine only, running jobs are cancelled after it
+
+class SimulationResponse(BaseModel):
+    id: str
+    engine: str
+    status: str
+    submitted_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    result: Optional[dict[str, Any]]
+    error: Optional[str]
+    cached: bool = False
+
+#Global sim instance, None when the queue lives in the queue service
 sim: Optional[Simulator] = None
+#Queue operations, on sim or forwarded to the queue service (SIMULATOR_QUEUE_SOCKET)
+queue: Optional[LocalQueue | RemoteQueue] = None
+#Serialized /jobs and /stats bodies of this worker, valid while the simulator version is unchanged
+responses = ResponseCache()
+#stats also depend on the clock (throughput over the elapsed time), seconds a cached body is served
+STATS_MAX_AGE = float(os.environ.get("SIMULATOR_STATS_MAX_AGE", "1.0"))
+#What-if simulations, run in worker processes
+simulations: Optional[SimulationService] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global sim
-    sim = Simulator(num_printers=2,time_scale=0.1)
-    await sim.start()
+    global sim, queue, simulations
+    socket_path = os.environ.get("SIMULATOR_QUEUE_SOCKET") # shared queue service, needed with several workers
+    fleet_file = os.environ.get("SIMULATOR_FLEET") # JSON printer specs, default is 2 standard printers
+    max_records = os.environ.get("SIMULATOR_MAX_RECORDS") # finished records kept in memory, older ones go to SQLite
+    max_record_age = os.environ.get("SIMULATOR_MAX_RECORD_AGE") # seconds
+    output_dir = os.environ.get("SIMULATOR_OUTPUT_DIR", "logs")
+    autoscaler_task = None
+    max_queue = os.environ.get("SIMULATOR_MAX_QUEUE") # queued + pending jobs
+    rate_limit = os.environ.get("SIMULATOR_RATE_LIMIT") # jobs/s per client
+    rate_burst = os.environ.get("SIMULATOR_RATE_BURST")
+    preemption = os.environ.get("SIMULATOR_PREEMPTION") # resume or restart, off by default
+    if socket_path:
+        sim = None
+        queue = RemoteQueue(socket_path)
+        await queue.connect()
+    else:
+        sim = Simulator(
+            num_printers=2,
+            time_scale=0.1,
+            output_dir=output_dir,
+            instrument=os.environ.get("SIMULATOR_INSTRUMENT") == "1",
+            fleet=load_fleet_from_json(fleet_file) if fleet_file else None,
+            max_records=int(max_records) if max_records else None,
+            max_record_age=float(max_record_age) if max_record_age else None,
+            admission=AdmissionControl(
+                max_queue=int(max_queue) if max_queue else None,
+                policy=os.environ.get("SIMULATOR_ADMISSION", "reject"), # reject, shed or block
+                rate=float(rate_limit) if rate_limit else None,
+                burst=float(rate_burst) if rate_burst else None,
+                block_timeout=float(os.environ.get("SIMULATOR_ADMISSION_TIMEOUT", "30"))
+            ),
+            preemption=preemption or None,
+            preempt_priority=int(os.environ.get("SIMULATOR_PREEMPT_PRIORITY", "0"))
+        )
+        await sim.start()
+        queue = LocalQueue(sim)
+        autoscale = os.environ.get("SIMULATOR_AUTOSCALE") # MIN:MAX printers
+        if autoscale:
+            low, high = parse_bounds(autoscale)
+            target_wait = os.environ.get("SIMULATOR_AUTOSCALE_WAIT") # simulated seconds
+            target_depth = os.environ.get("SIMULATOR_AUTOSCALE_DEPTH") # queued jobs per printer
+            autoscaler = Autoscaler(sim, min_printers=low, max_printers=high,
+                                    target_wait=float(target_wait) if target_wait else None,
+                                    target_depth=float(target_depth) if target_depth else None)
+            autoscaler_task = asyncio.create_task(autoscaler.run())
+    cache_size = float(os.environ.get("SIMULATOR_CACHE_SIZE_MB", "500")) # 0 disables the result cache
+    simulations = SimulationService(
+        max_workers=int(os.environ.get("SIMULATOR_SIM_WORKERS", "2")),
+        max_pending=int(os.environ.get("SIMULATOR_SIM_PENDING", "16")),
+        output_dir=output_dir,
+        cache=ResultCache(str(Path(output_dir) / "cache"), max_bytes=int(cache_size * 2**20)) if cache_size > 0 else None
+    )
     print("Simulation started")
     yield
-    await sim.stop()
+    await simulations.shutdown()
+    if autoscaler_task is not None:
+        autoscaler_task.cancel()
+    await queue.close()
+    if sim is not None:
+        await sim.stop()
 
 app = FastAPI(
     title='3D Printing Queue API',
@@ -53,75 +259,249 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+#the queue service is down or failed, the request may be retried
+@app.exception_handler(QueueServiceError)
+async def queue_service_error(request, exc: QueueServiceError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+#refused by admission control, the client should back off
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc: Overloaded):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
 #create a new job
 @app.post("/jobs", response_model=JobResponse, status_code=201)
-async def create_job(job_data: JobCreate):
+async def create_job(job_data: JobCreate, request: Request):
+    #rate limits apply per X-Client-Id, or per address without one
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else None)
     try:
-        job = Job(
-            id=job_data.id,
-            material=job_data.material,
-            est_time=job_data.est_time,
-            priority=job_data.priority
-        )
-        await sim.add_job(job)
-        logging.info(f"Job {job_data.id} created successfully")
-        return JobResponse(
-            id=job.id,
-            material=job.material,
-            est_time=job.est_time,
-            priority=job.priority,
-            status=job.status.value
-        )
+        job = await queue.add_job(job=job_data.model_dump(), client=client)
+        log_event("job_created", "Job %s created successfully", job["id"], job_id=job["id"], priority=job["priority"], material=job["material"])
+        return JobResponse(**job)
     except ValueError as e:
-        logging.info(f"Error: Create job {job_data.id}, with error:{e}")
+        logging.info("Error: Create job %s, with error:%s", job_data.id, e)
         raise HTTPException(status_code=400, detail=str(e))
 
-#list all the jobs in queue    
+async def cached_json(request: Request, key: tuple, build, max_age: Optional[float] = None) -> Response:
+    """
+    Body of key from the response cache, built by the build coroutine (a JSON payload) when
+    the simulator version changed. 304 when the client's If-None-Match has the ETag
+    """
+    version = tuple(await queue.version())
+    cached = responses.lookup(key, version, max_age)
+    if cached is None:
+        cached = responses.store(key, version, await build())
+    body, etag = cached
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+#list all the jobs in queue, filters only match queued and not yet arrived jobs
+#the job dicts already have the JobResponse fields, they are encoded as they are
 @app.get("/jobs", response_model=list[JobResponse], status_code=200)
-async def list_jobs():
-    jobs = sim.get_active_jobs()
-    return [
-        JobResponse(
-            id=j.id,
-            material=j.material,
-            est_time=j.est_time,
-            priority=j.priority,
-            status=j.status.value
-        )
-        for j in jobs
-    ]
+async def list_jobs(request: Request, material: Optional[str] = None, priority: Optional[int] = None,
+                    min_priority: Optional[int] = None, tag: Optional[str] = None):
+    async def build():
+        return await queue.list_jobs(material=material, priority=priority, min_priority=min_priority, tag=tag)
+    return await cached_json(request, ("jobs", material, priority, min_priority, tag), build)
+
+#cancel every queued job matching the filters (min_priority: priority value >= min_priority)
+@app.delete("/jobs", response_model=BulkCancelResponse)
+async def cancel_jobs(material: Optional[str] = None, priority: Optional[int] = None,
+                      min_priority: Optional[int] = None, tag: Optional[str] = None):
+    try:
+        job_ids = await queue.cancel_jobs(material=material, priority=priority, min_priority=min_priority, tag=tag)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    log_event("jobs_cancelled", "Cancelled %s jobs (material=%s priority=%s min_priority=%s tag=%s)",
+              len(job_ids), material, priority, min_priority, tag,
+              count=len(job_ids), material=material, priority=priority, min_priority=min_priority, tag=tag)
+    return BulkCancelResponse(cancelled=len(job_ids), job_ids=job_ids)
 
-#get global stats
+#get global stats, with percentiles per priority and material and throughput per window (seconds)
 @app.get("/stats", response_model=StatsResponse, status_code=200)
-async def list_stats():
-    stats = sim.get_global_stats()
-    return StatsResponse(
-            avg_wait_time=stats['avg_wait_time'],
-            median_wait_time=stats['median_wait_time'],
-            throughput=stats['throughput'],
-            total_completed=stats['total_completed']
-        )
+async def list_stats(request: Request, window: Optional[float] = Query(None, gt=0)):
+    async def build():
+        try:
+            stats = await queue.global_stats(window=window)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        breakdown = stats['breakdown']
+        return {
+            "avg_wait_time": stats['avg_wait_time'],
+            "median_wait_time": stats['median_wait_time'],
+            "throughput": stats['throughput'],
+            "total_completed": stats['total_completed'],
+            "overall": breakdown['overall'],
+            "by_priority": breakdown['by_priority'],
+            "by_material": breakdown['by_material'],
+            "window": breakdown['window'],
+            "throughput_windows": breakdown['throughput'],
+            "admission": stats['admission'],
+            "preemption": stats['preemption']
+        }
+    return await cached_json(request, ("stats", window), build, max_age=STATS_MAX_AGE)
 
 #get queue status
 @app.get("/health")
 async def health():
-    stats = sim.get_queue_stats()
+    stats = await queue.health()
     return {
         "status": "healthy",
-        "printers": sim.num_printers,
+        "printers": stats['printers'],
         "active_jobs": stats['active_jobs'],
+        "queued": stats['queued'],
+        "running": stats['running'],
         "completed": stats['completed'],
         "cancelled": stats['cancelled'],
-        "total_processed": stats['total_processed']
+        "total_processed": stats['total_processed'],
+        "records_in_memory": stats['records_in_memory'],
+        "records_spilled": stats['records_spilled'],
+        "rejected": stats['rejected'],
+        "shed": stats['shed'],
+        "rate_limited": stats['rate_limited'],
+        "blocked": stats['blocked'],
+        "preemptions": stats['preemptions']
     }
 
+#list the printers of the fleet
+@app.get("/printers", response_model=list[PrinterResponse], status_code=200)
+async def list_printers():
+    return [PrinterResponse(**p) for p in await queue.printers()]
+
+#add printers to the running fleet
+@app.post("/printers", response_model=list[PrinterResponse], status_code=201)
+async def add_printers(printer: PrinterCreate):
+    spec = {"class": printer.printer_class, "speed": printer.speed, "materials": printer.materials, "count": printer.count}
+    printers = await queue.add_printers(spec=spec)
+    log_event("printers_requested", "Added %s printers", len(printers), count=len(printers), printer_class=printer.printer_class)
+    return printers
+
+#drain a printer: it finishes its current job, then leaves the fleet
+@app.delete("/printers/{printer_id}", response_model=PrinterResponse, status_code=202)
+async def drain_printer(printer_id: int):
+    try:
+        printer = await queue.drain_printer(printer_id=printer_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if printer is None:
+        raise HTTPException(status_code=404, detail=f"Printer {printer_id} is not in the fleet")
+    return printer
+
+#projected start/finish of a queued or running job (seconds from now and epoch seconds)
+@app.get("/jobs/{job_id}/eta", response_model=EtaResponse, status_code=200)
+async def job_eta(job_id: str):
+    eta = await queue.get_eta(job_id=job_id)
+    if eta is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} is not active")
+    return eta
+
+#change the priority of a waiting job in place
+@app.patch("/jobs/{job_id}", response_model=JobResponse)
+async def update_job(job_id: str, update: JobUpdate):
+    job = await queue.reprioritize(job_id=job_id, priority=update.priority)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} is not queued")
+    log_event("job_reprioritized", "Job %s priority set to %s", job_id, update.priority, job_id=job_id, priority=update.priority)
+    return JobResponse(**job)
+
 #cancel a job
 @app.delete("/jobs/{job_id}")
 async def cancel_job(job_id: str):
-    success = sim.cancel_job(job_id)
+    success = await queue.cancel_job(job_id=job_id)
     if not success:
-        logging.info(f"Error: Canceling {job_id} ")
+        logging.info("Error: Canceling %s ", job_id)
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
     
-    logging.info(f"Job {job_id} cancelled successfully")
+    log_event("job_cancelled", "Job %s cancelled successfully", job_id, job_id=job_id)
     return {"message": f"Job {job_id} cancelled"}
+
+#list past simulation runs
+@app.get("/history", response_model=list[RunResponse], status_code=200)
+async def list_history(limit: int = Query(50, ge=1, le=1000), offset: int = Query(0, ge=0)):
+    return await queue.list_runs(limit=limit, offset=offset)
+
+#aggregated stats of one run, computed in SQL
+@app.get("/history/{run_id}/stats", response_model=RunStatsResponse, status_code=200)
+async def history_stats(run_id: int):
+    stats = await queue.run_stats(run_id=run_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return stats
+
+#hot-path timers
+@app.get("/metrics")
+async def get_metrics():
+    return await queue.metrics()
+
+#turn the hot-path timers on/off, optionally clearing them
+@app.put("/metrics")
+async def set_metrics(enabled: bool, reset: bool = False):
+    return await queue.set_metrics(enabled=enabled, reset=reset)
+
+#capture a cProfile/tracemalloc profile over a window
+@app.post("/profile")
+async def capture_profile(kind: str = Query("cprofile", enum=list(PROFILE_KINDS)), seconds: float = Query(5.0, gt=0, le=300)):
+    try:
+        filepath = await queue.profile(kind=kind, seconds=seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logging.info("Profile %s saved to %s", kind, filepath)
+    return {"kind": kind, "seconds": seconds, "file": filepath}
+
+#submit a what-if simulation, it runs in a worker process and never touches the live queue
+@app.post("/simulations", response_model=SimulationResponse, status_code=202)
+async def create_simulation(request: SimulationCreate):
+    if request.fleet is not None and request.engine != "realtime":
+        raise HTTPException(status_code=400, detail="A fleet needs the realtime engine")
+    if request.preemption is not None and request.engine != "realtime":
+        raise HTTPException(status_code=400, detail="Preemption needs the realtime engine")
+    ids = [job.id for job in request.jobs]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Job ids must be unique")
+    try:
+        simulation = simulations.submit(request.model_dump())
+    except ServiceBusy as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    log_event("simulation_submitted", "Simulation %s submitted with %s jobs", simulation["id"], len(request.jobs),
+              simulation_id=simulation["id"], engine=request.engine, jobs=len(request.jobs))
+    return simulation
+
+#list submitted simulations, most recent first (results are left out)
+@app.get("/simulations", response_model=list[SimulationResponse], status_code=200)
+async def list_simulations():
+    return simulations.list()
+
+#poll a simulation, wait > 0 holds the request until its state changes (long polling)
+@app.get("/simulations/{simulation_id}", response_model=SimulationResponse, status_code=200)
+async def get_simulation(simulation_id: str, wait: float = Query(0.0, ge=0, le=60)):
+    simulation = simulations.get(simulation_id)
+    if simulation is None:
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+    if wait and simulation["status"] in ("queued", "running"):
+        await simulations.wait_change(simulation_id, timeout=wait)
+    return simulation
+
+#stream the state of a simulation as NDJSON, one line per change until it finishes
+@app.get("/simulations/{simulation_id}/stream")
+async def stream_simulation(simulation_id: str):
+    if simulations.get(simulation_id) is None:
+        raise HTTPException(status_code=404, detail=f"Simulation {simulation_id} not found")
+
+    async def events():
+        last = None
+        while True:
+            simulation = simulations.get(simulation_id)
+            if simulation is None:
+                return
+            line = json.dumps(simulation)
+            if line != last:
+                #check again after the client took the line, the state may have changed meanwhile
+                yield line + "\n"
+                last = line
+                continue
+            if simulation["status"] not in ("queued", "running"):
+                return
+            await simulations.wait_change(simulation_id, timeout=15.0)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
@@ -0,0 +1,181 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from models import JobRecord, JobStatus
+
+ARCHIVE_VERSION = 1
+MANIFEST = "manifest.json"
+
+#Fixed-width little-endian columns, one row per job record
+COLUMNS = {
+    "job_index": "<u4",  # position of the job id in the id dictionary
+    "priority": "<i4",
+    "created": "<f8",    # seconds since the start of the run
+    "start": "<f8",      # NaN for jobs cancelled before they started
+    "end": "<f8",
+    "status": "u1",      # code of STATUS_CODES
+}
+STATUS_CODES = {status.value: code for code, status in enumerate(JobStatus)}
+
+
+def write_archive(records: list[JobRecord], directory: str, origin: float = 0.0, started_at: Optional[float] = None,
+                  run_id: Optional[int] = None) -> Path:
+    """
+    Write records as a columnar archive: one raw binary file per column, the id dictionary
+    (ids.bin with the UTF-8 ids back to back, ids.offsets with n + 1 byte offsets) and a
+    manifest describing them. Timestamps are stored relative to origin (the start of the
+    run); started_at is the epoch time the run started, when known. The manifest is
+    written last, an archive without it is incomplete
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST
+    manifest_path.unlink(missing_ok=True)
+    rows = len(records)
+
+    columns = {
+        "job_index": np.arange(rows, dtype=COLUMNS["job_index"]),
+        "priority": np.fromiter((r.priority for r in records), dtype=COLUMNS["priority"], count=rows),
+        "created": np.fromiter((r.created_time for r in records), dtype=COLUMNS["created"], count=rows) - origin,
+        "start": np.fromiter((r.start_time if r.start_time > 0 else np.nan for r in records), dtype=COLUMNS["start"], count=rows) - origin,
+        "end": np.fromiter((r.end_time for r in records), dtype=COLUMNS["end"], count=rows) - origin,
+        "status": np.fromiter((STATUS_CODES[r.status] for r in records), dtype=COLUMNS["status"], count=rows),
+    }
+    for name, values in columns.items():
+        values.astype(COLUMNS[name], copy=False).tofile(directory / f"{name}.bin")
+
+    encoded = [r.job_id.encode("utf-8") for r in records]
+    offsets = np.zeros(rows + 1, dtype="<u8")
+    np.cumsum(np.fromiter((len(e) for e in encoded), dtype="<u8", count=rows), out=offsets[1:])
+    (directory / "ids.bin").write_bytes(b"".join(encoded))
+    offsets.tofile(directory / "ids.offsets")
+
+    manifest = {
+        "version": ARCHIVE_VERSION,
+        "rows": rows,
+        "run_id": run_id,
+        "started_at": started_at,
+        "created_at": time.time(),
+        "columns": {name: {"file": f"{name}.bin", "dtype": dtype} for name, dtype in COLUMNS.items()},
+        "ids": {"data": "ids.bin", "offsets": "ids.offsets", "offsets_dtype": "<u8"},
+        "status_codes": STATUS_CODES
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    return directory
+
+
+class RunArchive:
+    """
+    Read-only view of a columnar archive, columns are memory-mapped on first use
+    """
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        with open(self.directory / MANIFEST, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version {self.manifest['version']}")
+        self._columns: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def _map(self, filename: str, dtype: str, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0, dtype=dtype) # an empty file cannot be mapped
+        return np.memmap(self.directory / filename, dtype=dtype, mode="r", shape=(rows,))
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            spec = self.manifest["columns"].get(name)
+            if spec is None:
+                raise KeyError(f"Unknown column {name}")
+            self._columns[name] = self._map(spec["file"], spec["dtype"], len(self))
+        return self._columns[name]
+
+    __getitem__ = column
+
+    def job_id(self, index: int) -> str:
+        """Id of the job at a position of the id dictionary"""
+        ids = self.manifest["ids"]
+        offsets = self._map(ids["offsets"], ids["offsets_dtype"], len(self) + 1)
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        with open(self.directory / ids["data"], "rb") as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8")
+
+    def job_ids(self) -> list[str]:
+        """The whole id dictionary"""
+        ids = self.manifest["ids"]
+        offsets = self._map(ids["offsets"], ids["offsets_dtype"], len(self) + 1)
+        data = (self.directory / ids["data"]).read_bytes()
+        offsets = offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    def mask(self, status: str) -> np.ndarray:
+        return self.column("status") == self.manifest["status_codes"][status]
+
+    def summary(self) -> dict:
+        """Counts, wait/run time aggregates and throughput, computed on the mapped columns"""
+        completed = self.mask("completed")
+        wait = (self.column("start") - self.column("created"))[completed]
+        run = (self.column("end") - self.column("start"))[completed]
+        duration = float(self.column("end").max()) if len(self) else 0.0 # times start at the run start
+        summary = {
+            "rows": len(self),
+            "completed": int(completed.sum()),
+            "cancelled": int(self.mask("cancelled").sum()),
+            "avg_wait_time": float(wait.mean()) if wait.size else 0.0,
+            "max_wait_time": float(wait.max()) if wait.size else 0.0,
+            "avg_run_time": float(run.mean()) if run.size else 0.0,
+            "duration": duration,
+            "throughput": float(completed.sum()) / duration if duration > 0 else 0.0
+        }
+        for p in (50, 90, 95, 99):
+            summary[f"p{p}_wait_time"] = float(np.percentile(wait, p)) if wait.size else 0.0
+        return summary
+
+
+def export_run(db_path: str, run_id: int, directory: str) -> Path:
+    """
+    Archive a run saved in the job history database
+
+    The database keeps no monotonic start time, so the first job creation is the origin
+    """
+    from database import JobDatabase
+    db = JobDatabase(db_path=db_path)
+    run = db.get_run(run_id)
+    if run is None:
+        raise ValueError(f"Run {run_id} not found")
+    records = db.load_records(run_id)
+    origin = min((r.created_time for r in records), default=0.0)
+    return write_archive(records, directory, origin=origin, started_at=run["started_at"], run_id=run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar archives of simulation runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Archive a run from the job history database")
+    export.add_argument("--db", default="logs/job_history.db", help="SQLite job history (default: logs/job_history.db)")
+    export.add_argument("--run", type=int, required=True, help="Run id")
+    export.add_argument("--output", "-o", required=True, help="Archive directory")
+    summary = sub.add_parser("summary", help="Aggregate an archive")
+    summary.add_argument("directory", help="Archive directory")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        try:
+            directory = export_run(args.db, args.run, args.output)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        print(f"Run {args.run} archived to {directory}")
+    else:
+        print(json.dumps(RunArchive(args.directory).summary(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Optional
+from models import clock
+from simulator import Simulator
+from event_log import log_event
+
+
+class Autoscaler:
+    """
+    Grows and shrinks the printer fleet of a running simulator
+
+    Every interval seconds the load is compared to the targets: target_wait is the
+    predicted wait of the last queued job in simulated seconds (from the ETA projection),
+    target_depth the queued jobs per printer. Over a target one printer of spec is added
+    (up to max_printers); under half of every target an idle printer is drained, the most
+    recently added first (down to min_printers). After a change the autoscaler waits
+    cooldown seconds so the effect shows before the next decision
+    """
+    def __init__(self, sim: Simulator, min_printers: int = 1, max_printers: int = 10,
+                 target_wait: Optional[float] = None, target_depth: Optional[float] = None,
+                 spec: Optional[dict] = None, interval: float = 1.0, cooldown: float = 5.0):
+        if min_printers < 1 or max_printers < min_printers:
+            raise ValueError("Autoscaler needs 1 <= min_printers <= max_printers")
+        if target_wait is None and target_depth is None:
+            raise ValueError("Autoscaler needs a target wait or a target queue depth")
+        self.sim = sim
+        self.min_printers = min_printers
+        self.max_printers = max_printers
+        self.target_wait = target_wait
+        self.target_depth = target_depth
+        self.spec = spec or {}
+        self.interval = interval
+        self.cooldown = cooldown
+        self._last_change: Optional[float] = None
+        self.added = 0
+        self.drained = 0
+
+    def predicted_wait(self) -> float:
+        """
+        Simulated seconds until the last queued job starts, 0 with an empty queue. Only the
+        first eta.HORIZON queued jobs are projected, so a longer queue gives a lower bound
+        """
+        now = clock()
+        starts = [eta.start for eta in self.sim.predict_schedule().values() if eta.position is not None]
+        return max(0.0, max(starts, default=now) - now) / self.sim.time_scale
+
+    def decide(self) -> int:
+        """+1 to add a printer, -1 to drain one, 0 to keep the fleet"""
+        printers = [p for p in self.sim.printers if p.accepts_jobs]
+        queued = self.sim.get_queue_stats()["queued"]
+        loads = []
+        if self.target_depth is not None:
+            loads.append(queued / len(printers) / self.target_depth)
+        if self.target_wait is not None:
+            loads.append(self.predicted_wait() / self.target_wait)
+        if max(loads) > 1 and len(printers) < self.max_printers:
+            return 1
+        if max(loads) < 0.5 and len(printers) > self.min_printers and any(not p.is_busy for p in printers):
+            return -1
+        return 0
+
+    def step(self) -> int:
+        """Apply one decision, returns it (0 during the cooldown or when no printer could be drained)"""
+        if self._last_change is not None and clock() - self._last_change < self.cooldown:
+            return 0
+        decision = self.decide()
+        if decision > 0:
+            self.sim.add_printers({**self.spec, "count": 1})
+            self.added += 1
+        elif decision < 0:
+            idle = sorted((p for p in self.sim.printers if p.accepts_jobs and not p.is_busy), key=lambda p: -p.id)
+            for printer in idle:
+                try:
+                    self.sim.drain_printer(printer.id)
+                except ValueError: # last printer of a waiting material
+                    continue
+                self.drained += 1
+                break
+            else:
+                return 0
+        if decision:
+            self._last_change = clock()
+            log_event("autoscaled", "Autoscaler %s a printer, fleet of %s", "added" if decision > 0 else "drained",
+                      self.sim.num_printers, decision=decision, printers=self.sim.num_printers)
+        return decision
+
+    async def run(self) -> None:
+        """Decide every interval until the simulator stops"""
+        while self.sim.running:
+            try:
+                self.step()
+            except Exception as e:
+                logging.info("Autoscaler error:%s", e)
+            await asyncio.sleep(self.interval)
+
+
+def parse_bounds(text: str) -> tuple[int, int]:
+    """MIN:MAX printer bounds, e.g. 2:8"""
+    try:
+        low, high = (int(part) for part in text.split(":"))
+    except ValueError:
+        raise ValueError(f"Autoscale bounds must be MIN:MAX, got {text}") from None
+    return low, high
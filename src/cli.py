@@ -1,9 +1,73 @@
 import asyncio
 import argparse
+import heapq
 import sys
+from typing import Optional
 from models import Job
-from simulator import Simulator
-from json_manager import load_jobs_from_json
+from simulator import ENGINE_VERSION, PREEMPTION_MODES, Simulator, log_dir
+from event_log import enable_event_log
+from json_manager import load_jobs_from_json, load_fleet_from_json
+from result_cache import ResultCache, cache_key, file_digest
+from admission import AdmissionControl, Overloaded, POLICIES
+from autoscaler import Autoscaler, parse_bounds
+
+def print_global_summary(stats: dict) -> None:
+    """Prints the global statistics of a run"""
+    print("\n" + "=" * 60)
+    print("GLOBAL SUMMARY")
+    print("=" * 60 + "\n")
+    print(f"Simulated Time: {stats['total_simulation_time']:.3f}")
+    print(f"Jobs Completed: {stats['total_completed']}")
+    print("\nWait Metrics")
+    print(f"Average Wait Time: {stats['avg_wait_time']}")
+    print(f"Median Wait Time: {stats['median_wait_time']}")
+    print(f"\nThroughput: {stats['throughput']:.3f} jobs/sec")
+    admission = stats.get('admission') # missing from results cached before admission control
+    if admission and any(admission.values()):
+        print(f"Refused Jobs: {admission['rejected']} rejected, {admission['shed']} shed, {admission['rate_limited']} rate limited"
+              f" ({admission['blocked']} waited for room)")
+    preemption = stats.get('preemption') # missing from results cached before preemption
+    if preemption and preemption['preemptions']:
+        print(f"Preemptions: {preemption['preemptions']} ({preemption['lost_time']:.3f}s of work lost to restarts)")
+
+    timing = stats['timing_error']
+    print("\nTiming (scheduled vs actual run time)")
+    print(f"Mean Error: {timing['mean_error'] * 1000:.3f} ms")
+    print(f"Max Error: {timing['max_abs_error'] * 1000:.3f} ms")
+    print(f"Relative Error: {timing['relative_error_percent']:.3f} %")
+
+    print("\nPRINTER UTILIZATION")
+    print("=" * 60 + "\n")
+    for p in stats['printer_utilization']:
+        print(f"Printer {p['printer_id']} ({p['printer_class']}): {p['utilization_percent']} %")
+    print()
+    for c in stats['class_utilization']:
+        print(f"Class {c['printer_class']} ({c['printers']} printers): {c['utilization_percent']:.3f} %")
+    print_breakdown(stats['breakdown'])
+    print("="*60 + "\n")
+
+def print_breakdown(breakdown: dict) -> None:
+    """Prints the wait/run time percentiles per priority and material and the windowed throughput"""
+    header = f"{'':<12}{'done':>6}{'canc':>6}" + "".join(f"{'wait ' + p:>10}" for p in ("p50", "p90", "p95", "p99")) \
+             + "".join(f"{'run ' + p:>10}" for p in ("p50", "p99"))
+    def row(name: str, group: dict) -> str:
+        wait, run = group['wait_time'], group['run_time']
+        return f"{name:<12}{group['completed']:>6}{group['cancelled']:>6}" \
+               + "".join(f"{wait[p]:>10.3f}" for p in ("p50", "p90", "p95", "p99")) \
+               + "".join(f"{run[p]:>10.3f}" for p in ("p50", "p99"))
+
+    print("\nBREAKDOWN (seconds)")
+    print("=" * 60 + "\n")
+    print(header)
+    print(row("all", breakdown['overall']))
+    for group in breakdown['by_priority']:
+        print(row(f"priority {group['priority']}", group))
+    for group in breakdown['by_material']:
+        print(row(group['material'], group))
+
+    print(f"\nThroughput per {breakdown['window']:.3f}s window")
+    for w in breakdown['throughput']:
+        print(f"{w['start']:>10.3f} - {w['end']:<10.3f} {w['completed']:>6} jobs {w['throughput']:>10.3f} jobs/sec")
 
 class CLI:
     def __init__(self, simulator: Simulator):
@@ -19,8 +83,16 @@ class CLI:
         print("list                                         - list all the jobs in queue")
         print("completed                                    - list all the jobs completed")
         print("cancel <job_id>                              - cancel a job")
+        print("reprioritize <job_id> <priority>             - change the priority of a queued job")
+        print("cancel-where [material=M] [priority=P] [min_priority=P] [tag=T] - cancel every matching queued job")
+        print("eta [job_id]                                 - projected start/finish of a job, or of the next 10 jobs in the queue")
         print("status                                       - shows simulator status")
-        print("stats                                        - shows global summary")
+        print("printers                                     - shows the printer fleet")
+        print("add-printer [count] [speed] [materials]      - adds printers, materials comma separated (default: any)")
+        print("drain-printer <printer_id>                   - the printer finishes its job and leaves the fleet")
+        print("metrics [on|off|reset]                       - shows hot-path timers, or toggles/resets them")
+        print("profile <cprofile|tracemalloc> <seconds>     - captures a profile to logs/")
+        print("stats [window]                               - shows global summary, percentiles per priority/material and throughput per window (seconds)")
         print("help                                         - shows help")
         print("stop                                         - stops the simulator and exit")
         print()
@@ -41,7 +113,7 @@ class CLI:
             await self.sim.add_job(job = job)
 
             print(f"Added Job {job_id}: {material}, {estimate_time}s with {priority} priority")
-        except ValueError as e:
+        except (ValueError, Overloaded) as e:
             print(f"Error: {e}")
     
     def cmd_completed(self) -> None:
@@ -88,36 +160,161 @@ class CLI:
         else:
             print(f"Could not cancel {args[0]}")
 
-    def cmd_records(self) -> None:
-        """Shows global statistics"""
-        stats = self.sim.get_global_stats()
-        
-        print("\n" + "=" * 60)
-        print("GLOBAL SUMMARY")
-        print("=" * 60 + "\n")
-        print(f"Simulated Time: {stats['total_simulation_time']:.3f}")
-        print(f"Jobs Completed: {stats['total_completed']}")
-        print("\nWait Metrics")
-        print(f"Average Wait Time: {stats['avg_wait_time']}")
-        print(f"Median Wait Time: {stats['median_wait_time']}")
-        print(f"\nThroughput: {stats['throughput']:.3f} jobs/sec")
-
-        print("\nPRINTER UTILIZATION")
-        print("=" * 60 + "\n")
-        for p in stats['printer_utilization']:
-            print(f"Printer {p['printer_id']}: {p['utilization_percent']} %")
-        print("="*60 + "\n")
+    def cmd_reprioritize(self, args: list[str]) -> None:
+        """Change the priority of a queued job, keeping its FIFO position"""
+        if len(args) != 2:
+            print("Usage: reprioritize <job_id> <priority>")
+            return
+        try:
+            job = self.sim.reprioritize(args[0], int(args[1]))
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if job is None:
+            print(f"Job {args[0]} is not queued")
+        else:
+            print(f"Job {job.id} priority set to {job.priority}")
+
+    def cmd_cancel_where(self, args: list[str]) -> None:
+        """Cancel every queued or pending job matching key=value filters"""
+        usage = "Usage: cancel-where [material=M] [priority=P] [min_priority=P] [tag=T]"
+        filters = {}
+        try:
+            for arg in args:
+                key, _, value = arg.partition("=")
+                if key not in ("material", "priority", "min_priority", "tag") or not value:
+                    print(usage)
+                    return
+                filters[key] = int(value) if key in ("priority", "min_priority") else value
+            job_ids = self.sim.cancel_jobs(**filters)
+        except ValueError as e:
+            print(f"Error: {e}")
+            print(usage)
+            return
+        print(f"Cancelled {len(job_ids)} jobs")
+
+    def cmd_records(self, args: list[str]) -> None:
+        """Shows global statistics, the optional argument is the throughput window in seconds"""
+        try:
+            window = float(args[0]) if args else None
+            print_global_summary(self.sim.get_global_stats(window=window))
+        except ValueError as e:
+            print(f"Error: {e}")
     
+    def cmd_eta(self, args: list[str]) -> None:
+        """Shows when a job (or the next jobs of the queue) should start and finish"""
+        if args:
+            job_ids = args[:1]
+        else:
+            schedule = self.sim.predict_schedule(limit=10)
+            queued = (eta for eta in schedule.values() if eta.position is not None)
+            job_ids = [eta.job_id for eta in heapq.nsmallest(10, queued, key=lambda e: e.position)]
+            if not job_ids:
+                print("No queued jobs")
+                return
+        for job_id in job_ids:
+            eta = self.sim.get_eta(job_id)
+            if eta is None:
+                print(f"Job {job_id} is not active")
+            elif eta['status'] == "pending":
+                print(f"{job_id}: arrives in {eta['arrives_in']:.3f}s")
+            elif eta.get('beyond_horizon'):
+                print(f"{job_id}: deep in the queue, starts in {eta['start_in']:.3f}s at the earliest")
+            elif 'finish_in' not in eta:
+                print(f"{job_id}: starting now")
+            else:
+                position = f"#{eta['position'] + 1} in queue" if eta['position'] is not None else "running"
+                print(f"{job_id}: {position}, printer {eta['printer_id']}, starts in {eta['start_in']:.3f}s, finishes in {eta['finish_in']:.3f}s")
+
     def cmd_status(self) -> None:
         """Shows current simulation status including the queue current status"""
         stats = self.sim.get_queue_stats()
         print("\nCurrent Status:")
         print(f" Number of Printers: {self.sim.num_printers}")
         print(f" Time Scale: {self.sim.time_scale}")
-        print(f" Jobs in queue: {stats['active_jobs']}")
+        print(f" Jobs in queue: {stats['queued']}")
+        print(f" Jobs running: {stats['running']}")
         print(f" Jobs Completed: {stats['completed']}")
         print(f" Jobs Cancelled: {stats['cancelled']}")
+        print(f" Jobs waiting to arrive: {stats['pending_arrivals']}")
+        print(f" Records in memory / spilled to SQLite: {stats['records_in_memory']} / {stats['records_spilled']}")
+        print(f" Jobs rejected / shed: {stats['rejected']} / {stats['shed']}")
+        if self.sim.preemption is not None:
+            print(f" Jobs preempted ({self.sim.preemption}): {stats['preemptions']}")
     
+    def cmd_printers(self) -> None:
+        """Shows each printer with its class, speed and supported materials"""
+        print(f"\n{'ID':<6}{'Class':<14}{'Speed':>7}  {'Materials':<24}{'State':<10}{'Job'}")
+        print("-" * 70)
+        for p in self.sim.printers:
+            materials = ",".join(sorted(p.materials)) if p.materials is not None else "any"
+            job = p.current_job.id if p.current_job else "-"
+            print(f"{p.id:<6}{p.printer_class:<14}{p.speed:>7.2f}  {materials:<24}{p.state:<10}{job}")
+        print()
+
+    def cmd_add_printer(self, args: list[str]) -> None:
+        """Add printers to the running fleet"""
+        try:
+            spec = {"count": int(args[0]) if args else 1, "speed": float(args[1]) if len(args) > 1 else 1.0}
+            if len(args) > 2:
+                spec["materials"] = args[2].split(",")
+            printers = self.sim.add_printers(spec)
+        except ValueError as e:
+            print(f"Error: {e}")
+            print("Usage add-printer [count] [speed] [materials]")
+            return
+        print(f"Added printers {', '.join(str(p.id) for p in printers)}")
+
+    def cmd_drain_printer(self, args: list[str]) -> None:
+        """Drain a printer, it leaves once its current job is done"""
+        if len(args) != 1:
+            print("Usage drain-printer <printer_id>")
+            return
+        try:
+            printer = self.sim.drain_printer(int(args[0]))
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        if printer is None:
+            print(f"Printer {args[0]} is not in the fleet")
+        elif printer.is_busy:
+            print(f"Printer {printer.id} draining, it leaves after the job {printer.current_job.id}")
+        else:
+            print(f"Printer {printer.id} draining")
+
+    def cmd_metrics(self, args: list[str]) -> None:
+        """Shows per-phase timers, or turns instrumentation on/off"""
+        instrumentation = self.sim.instrumentation
+        if args:
+            if args[0] in ("on", "off"):
+                instrumentation.enabled = args[0] == "on"
+                print(f"Instrumentation {args[0]}")
+            elif args[0] == "reset":
+                instrumentation.reset()
+                print("Instrumentation reset")
+            else:
+                print("Usage: metrics [on|off|reset]")
+            return
+
+        snapshot = instrumentation.snapshot()
+        print(f"\nInstrumentation: {'on' if snapshot['enabled'] else 'off'}")
+        print(f"{'Phase':<14}{'Count':>10}{'Total ms':>14}{'Mean ms':>12}{'Max ms':>12}")
+        print("-" * 62)
+        for phase, timer in snapshot['phases'].items():
+            print(f"{phase:<14}{timer['count']:>10}{timer['total_ms']:>14.3f}{timer['mean_ms']:>12.4f}{timer['max_ms']:>12.3f}")
+        print()
+
+    async def cmd_profile(self, args: list[str]) -> None:
+        """Captures a cProfile or tracemalloc snapshot over a window"""
+        if len(args) != 2:
+            print("Usage: profile <cprofile|tracemalloc> <seconds>")
+            return
+        try:
+            filepath = await self.sim.instrumentation.profile_window(args[0], float(args[1]))
+            print(f"Profile saved to {filepath}")
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}")
+
     async def run(self) -> None:
         """ Main CLI Loop"""
         self.running = True
@@ -145,10 +342,26 @@ class CLI:
                     self.cmd_completed()
                 elif cmd == "cancel":
                     self.cmd_cancel(args)
+                elif cmd == "reprioritize":
+                    self.cmd_reprioritize(args)
+                elif cmd == "cancel-where":
+                    self.cmd_cancel_where(args)
+                elif cmd == "eta":
+                    self.cmd_eta(args)
                 elif cmd == "status":
                     self.cmd_status()
+                elif cmd == "printers":
+                    self.cmd_printers()
+                elif cmd == "add-printer":
+                    self.cmd_add_printer(args)
+                elif cmd == "drain-printer":
+                    self.cmd_drain_printer(args)
                 elif cmd == "stats":
-                    self.cmd_records()
+                    self.cmd_records(args)
+                elif cmd == "metrics":
+                    self.cmd_metrics(args)
+                elif cmd == "profile":
+                    await self.cmd_profile(args)
                 elif cmd == "help":
                     self.cmd_help()
                 elif cmd == "stop":
@@ -162,6 +375,63 @@ class CLI:
             except Exception as e:
                 print(f"Error: {e}")
 
+async def run_batch(args: argparse.Namespace, fleet: Optional[list[dict]]) -> None:
+    """
+    Run the input until every job has finished, then stop
+
+    The stats, report and charts are cached under a key of the input file contents and
+    the run config, a repeated run restores them instead of simulating again
+    """
+    config = {
+        "engine": "realtime",
+        "engine_version": ENGINE_VERSION,
+        "printers": None if fleet else args.printers,
+        "fleet": fleet,
+        "time_scale": args.time_scale
+    }
+    if args.max_queue is not None: # shed/rejected jobs change the results
+        config["admission"] = {"max_queue": args.max_queue, "policy": args.admission}
+    if args.preemption is not None:
+        config["preemption"] = {"mode": args.preemption, "priority": args.preempt_priority}
+    cache = None if args.no_cache else ResultCache(args.cache_dir, max_bytes=int(args.cache_size * 2**20))
+    key = cache_key(file_digest(args.input), config) if cache else None
+    if cache and not args.archive: # the archive needs the records, which are not cached
+        entry = cache.restore(key, "logs")
+        if entry is not None:
+            print(f"Cached result {key[:12]}, outputs restored to logs/: {', '.join(entry['files'])}")
+            print_global_summary(entry["result"])
+            return
+
+    sim = Simulator(num_printers=args.printers, time_scale=args.time_scale, instrument=args.instrument, fleet=fleet,
+                    max_records=args.max_records, max_record_age=args.max_record_age, admission=admission_from_args(args),
+                    preemption=args.preemption, preempt_priority=args.preempt_priority)
+    await sim.start()
+    print(f"Simulator running with {sim.num_printers} printers")
+    try:
+        await sim.add_jobs(load_jobs_from_json(args.input))
+    except Overloaded as e:
+        print(f"Error: {e}")
+    await sim.drain()
+    await sim.stop()
+    print_global_summary(sim.final_stats)
+    if args.archive:
+        print(f"Records archived to {sim.export_archive(args.archive)}")
+    if cache:
+        cache.put(key, sim.final_stats, config, sim.output_files)
+
+def autoscaler_from_args(args, sim: Simulator) -> Optional[Autoscaler]:
+    """Autoscaler of --autoscale/--target-wait/--target-depth, None without --autoscale"""
+    if args.autoscale is None:
+        return None
+    low, high = parse_bounds(args.autoscale)
+    return Autoscaler(sim, min_printers=low, max_printers=high, target_wait=args.target_wait, target_depth=args.target_depth)
+
+def admission_from_args(args) -> Optional[AdmissionControl]:
+    """Backlog bound of --max-queue/--admission, the block policy waits without a timeout"""
+    if args.max_queue is None:
+        return None
+    return AdmissionControl(max_queue=args.max_queue, policy=args.admission)
+
 async def main():
     if len(sys.argv) > 1:
         """Process json file only"""
@@ -173,6 +443,8 @@ async def main():
             python src/cli.py
             python src/cli.py --input test_data/sample_input.json
             python src/cli.py --input test_data/sample_input.json --printers 3 --time-scale 0.01
+            python src/cli.py --input test_data/sample_input.json --fleet test_data/sample_fleet.json
+            python src/cli.py --input test_data/sample_input.json --batch
             """
         )
         parser.add_argument(
@@ -194,20 +466,144 @@ async def main():
             default=0.1,
             help='Time scale multiplier (default:0.1)'
         )
+        parser.add_argument(
+            '--fleet', '-f',
+            type=str,
+            help='Json file with printer specs (class, count, speed, materials), overrides --printers'
+        )
+        parser.add_argument(
+            '--max-records',
+            type=int,
+            default=None,
+            help='Finished job records kept in memory, older ones are moved to the SQLite history'
+        )
+        parser.add_argument(
+            '--max-record-age',
+            type=float,
+            default=None,
+            help='Seconds a finished job record stays in memory before it is moved to the SQLite history'
+        )
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Run the input until every job finished and exit, results are cached'
+        )
+        parser.add_argument(
+            '--cache-dir',
+            type=str,
+            default='logs/cache',
+            help='Directory of the batch result cache (default: logs/cache)'
+        )
+        parser.add_argument(
+            '--cache-size',
+            type=float,
+            default=500,
+            help='Size limit of the result cache in MB, least recently used results are evicted (default: 500)'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Always simulate in batch mode, without reading or storing cached results'
+        )
+        parser.add_argument(
+            '--archive',
+            type=str,
+            default=None,
+            help='Directory where the job records are written as a columnar archive when the run stops (see archive.py)'
+        )
+        parser.add_argument(
+            '--max-queue',
+            type=int,
+            default=None,
+            help='Bound on the jobs waiting for a printer or for their arrival time'
+        )
+        parser.add_argument(
+            '--admission',
+            choices=POLICIES,
+            default='reject',
+            help='Input jobs over --max-queue: reject the input, shed the least urgent jobs or block until room opens (default: reject)'
+        )
+        parser.add_argument(
+            '--preemption',
+            choices=PREEMPTION_MODES,
+            default=None,
+            help='Urgent jobs suspend running less urgent ones, which later resume where they stopped or restart (default: off)'
+        )
+        parser.add_argument(
+            '--preempt-priority',
+            type=int,
+            default=0,
+            help='Jobs of this priority or more urgent preempt less urgent running jobs (default: 0)'
+        )
+        parser.add_argument(
+            '--autoscale',
+            type=str,
+            default=None,
+            help='MIN:MAX printers, the fleet grows and shrinks with --target-wait/--target-depth (interactive mode)'
+        )
+        parser.add_argument(
+            '--target-wait',
+            type=float,
+            default=None,
+            help='Autoscaler target: predicted wait of the last queued job, in simulated seconds'
+        )
+        parser.add_argument(
+            '--target-depth',
+            type=float,
+            default=None,
+            help='Autoscaler target: queued jobs per printer'
+        )
+        parser.add_argument(
+            '--instrument',
+            action='store_true',
+            help='Collect per-phase hot-path timers (see the metrics command)'
+        )
+        parser.add_argument(
+            '--event-log',
+            action='store_true',
+            help='Also write structured NDJSON events to logs/events.ndjson'
+        )
         args = parser.parse_args()
+        if args.event_log:
+            enable_event_log(log_dir / 'events.ndjson')
         
-        sim = Simulator(num_printers=args.printers, time_scale=args.time_scale)
+        fleet = load_fleet_from_json(args.fleet) if args.fleet else None
+        if args.batch:
+            if not args.input:
+                print("Error: --batch needs --input")
+                return
+            await run_batch(args, fleet)
+            return
+        sim = Simulator(num_printers=args.printers, time_scale=args.time_scale, instrument=args.instrument, fleet=fleet,
+                        max_records=args.max_records, max_record_age=args.max_record_age, admission=admission_from_args(args),
+                        preemption=args.preemption, preempt_priority=args.preempt_priority)
+        try:
+            autoscaler = autoscaler_from_args(args, sim)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
         await sim.start()
+        autoscaler_task = asyncio.create_task(autoscaler.run()) if autoscaler is not None else None
 
         jobs = load_jobs_from_json(args.input)
         if jobs:
-            await sim.add_jobs(jobs)
+            try:
+                admitted = await sim.add_jobs(jobs)
+            except Overloaded as e:
+                print(f"Error: {e}")
+                admitted = []
+            if len(admitted) < len(jobs):
+                print(f"{len(jobs) - len(admitted)} of {len(jobs)} jobs refused by admission control")
             print(f"Simulator running with {sim.num_printers} printers")
 
             cli = CLI(sim)
             await cli.run()
 
+        if autoscaler_task is not None:
+            autoscaler_task.cancel()
         await sim.stop()
+        if args.archive:
+            print(f"Records archived to {sim.export_archive(args.archive)}")
     else:
         """Process input data"""
         sim = Simulator(num_printers=2, time_scale=0.1)
@@ -1,17 +1,22 @@
+import math
 import sqlite3
+import time
 from pathlib import Path
+from typing import Optional
 from models import JobRecord
 
+PERCENTILES = (50, 90, 95, 99)
+
 class JobDatabase:
     """Manages job history persistence"""
 
     def __init__(self, db_path: str = "logs/job_history.db"):
         self.db_path = Path(db_path)
-        self.db_path.parent.mkdir(exist_ok=True)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.init_db()
 
     def init_db(self) -> None:
-        """Checks if database exists"""
+        """Checks if database exists, creates the tables and indexes and migrates older files"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
@@ -26,18 +31,74 @@ class JobDatabase:
                     duration REAL,
                     wait_time REAL,
                     run_time REAL ,
-                    simulation_timestamp REAL
+                    simulation_timestamp REAL,
+                    run_id INTEGER REFERENCES runs(run_id),
+                    material TEXT,
+                    preemptions INTEGER DEFAULT 0
+                    )
+                '''
+        cursor.execute(query)
+
+        query = '''CREATE TABLE IF NOT EXISTS runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    duration REAL,
+                    num_printers INTEGER,
+                    time_scale REAL,
+                    job_count INTEGER DEFAULT 0
                     )
                 '''
         cursor.execute(query)
+
+        #Files created before runs existed have no run_id column
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(job_history)")]
+        if "run_id" not in columns:
+            cursor.execute("ALTER TABLE job_history ADD COLUMN run_id INTEGER REFERENCES runs(run_id)")
+        if "material" not in columns:
+            cursor.execute("ALTER TABLE job_history ADD COLUMN material TEXT")
+        if "preemptions" not in columns:
+            cursor.execute("ALTER TABLE job_history ADD COLUMN preemptions INTEGER DEFAULT 0")
+
+        #(run_id, status, wait_time) also serves ordered wait time lookups for percentiles
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_history_run_status_wait ON job_history (run_id, status, wait_time)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_history_status ON job_history (status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_history_job_id ON job_history (job_id)")
+        conn.commit()
+        conn.close()
+
+    def create_run(self, num_printers: int, time_scale: float, started_at: Optional[float] = None) -> int:
+        """Register a new simulation run and return its id"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO runs (started_at, num_printers, time_scale) VALUES (?, ?, ?)",
+            (started_at if started_at is not None else time.time(), num_printers, time_scale)
+        )
+        run_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return run_id
+
+    def finish_run(self, run_id: int, duration: float) -> None:
+        """Store the end of a run and its job count"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            '''UPDATE runs
+               SET finished_at = started_at + ?, duration = ?,
+                   job_count = (SELECT COUNT(*) FROM job_history WHERE run_id = ?)
+               WHERE run_id = ?''',
+            (duration, duration, run_id, run_id)
+        )
         conn.commit()
         conn.close()
 
-    def save_jobs(self, records: list[JobRecord], simulation_time: float) -> int: 
+    def save_jobs(self, records: list[JobRecord], simulation_time: float, run_id: Optional[int] = None) -> int:
         """Saves records to the SQL database"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
+        rows = []
         for record in records:
             if record.start_time > 0:
                 wait_time = record.start_time - record.created_time
@@ -45,24 +106,133 @@ class JobDatabase:
             else:
                 wait_time = 0
                 run_time = 0
-            query = '''
-                    INSERT INTO job_history
-                    (job_id, priority, status, created_time, start_time, end_time,
-                    duration, wait_time, run_time, simulation_timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    '''
-            cursor.execute(query,(record.job_id,
-                                  record.priority,
-                                  record.status,
-                                  record.created_time,
-                                  record.start_time,
-                                  record.end_time,
-                                  record.duration,
-                                  wait_time,
-                                  run_time,
-                                  simulation_time
-                                  )
-                            ) 
+            rows.append((record.job_id,
+                         record.priority,
+                         record.status,
+                         record.created_time,
+                         record.start_time,
+                         record.end_time,
+                         record.duration,
+                         wait_time,
+                         run_time,
+                         simulation_time,
+                         run_id,
+                         record.material,
+                         record.preemptions
+                         ))
+        query = '''
+                INSERT INTO job_history
+                (job_id, priority, status, created_time, start_time, end_time,
+                duration, wait_time, run_time, simulation_timestamp, run_id, material, preemptions)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                '''
+        cursor.executemany(query, rows)
         conn.commit()
         conn.close()
-        return len(records)
\ No newline at end of file
+        return len(records)
+
+    def load_records(self, run_id: int) -> list[JobRecord]:
+        """Records saved for a run, in the order they were saved"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            '''SELECT job_id, start_time, created_time, end_time, duration, status, priority, COALESCE(material, ''),
+                      COALESCE(preemptions, 0)
+               FROM job_history WHERE run_id = ? ORDER BY id''',
+            (run_id,)
+        ).fetchall()
+        conn.close()
+        return [JobRecord(*row) for row in rows]
+
+    def get_record_columns(self, run_id: int) -> list[tuple]:
+        """(priority, material, status, created_time, start_time, end_time) rows of a run, for columnar stats"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            '''SELECT priority, COALESCE(material, ''), status, created_time, start_time, end_time
+               FROM job_history WHERE run_id = ? ORDER BY id''',
+            (run_id,)
+        ).fetchall()
+        conn.close()
+        return rows
+
+    def list_runs(self, limit: int = 50, offset: int = 0) -> list[dict]:
+        """Most recent runs first"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            '''SELECT run_id, started_at, finished_at, duration, num_printers, time_scale, job_count
+               FROM runs ORDER BY run_id DESC LIMIT ? OFFSET ?''',
+            (limit, offset)
+        ).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def get_run(self, run_id: int) -> Optional[dict]:
+        """One run, None if it does not exist"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            '''SELECT run_id, started_at, finished_at, duration, num_printers, time_scale, job_count
+               FROM runs WHERE run_id = ?''',
+            (run_id,)
+        ).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_run_stats(self, run_id: int) -> Optional[dict]:
+        """
+        Aggregates of one run, computed by SQLite
+
+        Percentiles use the nearest-rank method: one indexed ORDER BY ... LIMIT 1 OFFSET k
+        lookup per percentile on (run_id, status, wait_time), no rows are loaded into Python
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        run = cursor.execute("SELECT duration FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if run is None:
+            conn.close()
+            return None
+        duration = run[0]
+
+        counts = dict(cursor.execute(
+            "SELECT status, COUNT(*) FROM job_history WHERE run_id = ? GROUP BY status",
+            (run_id,)
+        ).fetchall())
+        completed = counts.get("completed", 0)
+
+        avg_wait, max_wait, avg_run = cursor.execute(
+            '''SELECT AVG(wait_time), MAX(wait_time), AVG(run_time)
+               FROM job_history WHERE run_id = ? AND status = 'completed' ''',
+            (run_id,)
+        ).fetchone()
+
+        preemptions = cursor.execute(
+            "SELECT COALESCE(SUM(preemptions), 0) FROM job_history WHERE run_id = ?", (run_id,)
+        ).fetchone()[0]
+
+        percentiles = {}
+        for p in PERCENTILES:
+            value = None
+            if completed:
+                rank = max(math.ceil(p / 100 * completed), 1)
+                value = cursor.execute(
+                    '''SELECT wait_time FROM job_history
+                       WHERE run_id = ? AND status = 'completed'
+                       ORDER BY wait_time LIMIT 1 OFFSET ?''',
+                    (run_id, rank - 1)
+                ).fetchone()[0]
+            percentiles[f"p{p}_wait_time"] = value or 0.0
+        conn.close()
+
+        return {
+            "run_id": run_id,
+            "total_jobs": sum(counts.values()),
+            "completed": completed,
+            "cancelled": counts.get("cancelled", 0),
+            "avg_wait_time": avg_wait or 0.0,
+            "max_wait_time": max_wait or 0.0,
+            "avg_run_time": avg_run or 0.0,
+            **percentiles,
+            "throughput": completed / duration if duration else 0.0,
+            "duration": duration,
+            "preemptions": preemptions
+        }
@@ -0,0 +1,120 @@
+import heapq
+from operator import attrgetter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from models import Printer, PrioritizedJob
+from indexed_heap import merge_heaps
+
+
+@dataclass(slots=True)
+class Eta:
+    """
+    Projected schedule of one job
+    Attributes:
+        job_id: Job identifier
+        printer_id: Printer expected to run the job
+        start: Projected start (clock() time), the actual start for running jobs
+        finish: Projected finish (clock() time)
+        position: Rank in the dispatch order of the queue, None for running jobs
+    """
+    job_id: str
+    printer_id: int
+    start: float
+    finish: float
+    position: Optional[int] = None
+
+
+HORIZON = 5_000 # queued jobs projected at most per queue/fleet state
+
+
+class Projection:
+    """
+    Projected schedule of the running jobs and of the queue, extended on demand
+
+    Each printer is free at the deadline of its current job (or now when idle), draining
+    printers only finish their current job and removed ones are skipped. Queued jobs
+    are taken in dispatch order (priority, then FIFO counter) and each goes to the capable
+    printer that frees up first, for run_time_for(job) * time_scale seconds, which is what
+    the printer workers do when nothing else arrives. Printers with the same materials
+    share one min-heap of free times.
+
+    The dispatch order is read straight off the per-material queue heaps (merge_heaps),
+    without sorting them, so the first k queued jobs cost O(k log k) however long the
+    queue is. The heaps must not change while the projection is in use
+    """
+    def __init__(self, printers: list[Printer], heaps: Iterable[list[PrioritizedJob]], now: float, time_scale: float):
+        self.etas: dict[str, Eta] = {}
+        self.projected = 0 # queued jobs drawn so far
+        #(free at, printer id, seconds per est_time second) heaps, one per distinct material set
+        self._free: dict[Optional[frozenset[str]], list[tuple[float, int, float]]] = {}
+        for printer in printers:
+            free_at = now
+            if printer.is_busy:
+                free_at = max(now, printer.deadline)
+                job = printer.current_job
+                self.etas[job.id] = Eta(job_id=job.id, printer_id=printer.id, start=printer.start_job_time, finish=free_at)
+            if not printer.accepts_jobs:
+                continue
+            self._free.setdefault(printer.materials, []).append((free_at, printer.id, time_scale / printer.speed))
+        for heap in self._free.values():
+            heapq.heapify(heap)
+        self._candidates: dict[str, list[list]] = {} # material -> heaps of the printers that print it
+        self._order = merge_heaps(heaps)
+        self._next = next(self._order, None)
+
+    @property
+    def complete(self) -> bool:
+        """Whether every queued job has been projected"""
+        return self._next is None
+
+    def extend(self, count: int) -> None:
+        """Project the next count queued jobs in dispatch order"""
+        etas = self.etas
+        end = self.projected + count
+        while self._next is not None and self.projected < end:
+            job = self._next.job
+            self._next = next(self._order, None)
+            position = self.projected
+            self.projected += 1
+            candidates = self._printers_for(job.material)
+            if not candidates: # no printer prints the material, it would wait forever
+                continue
+            best = candidates[0]
+            for free in candidates[1:]:
+                if free[0] < best[0]:
+                    best = free
+            start, printer_id, scale = best[0]
+            finish = start + job.work_left * scale
+            heapq.heapreplace(best, (finish, printer_id, scale))
+            etas[job.id] = Eta(job.id, printer_id, start, finish, position)
+
+    def find(self, job_id: str, limit: int = HORIZON) -> Optional[Eta]:
+        """Projected schedule of a job, extending the projection up to limit queued jobs to reach it"""
+        while job_id not in self.etas and self._next is not None and self.projected < limit:
+            self.extend(min(1024, limit - self.projected))
+        return self.etas.get(job_id)
+
+    def earliest_start(self, material: str) -> Optional[float]:
+        """
+        When the next capable printer frees up in the projection so far, a lower bound on
+        the start of any job of the material not projected yet, None if nothing prints it
+        """
+        return min((free[0][0] for free in self._printers_for(material)), default=None)
+
+    def _printers_for(self, material: str) -> list[list]:
+        candidates = self._candidates.get(material)
+        if candidates is None:
+            candidates = self._candidates[material] = [
+                free for materials, free in self._free.items() if materials is None or material in materials]
+        return candidates
+
+
+def predict(printers: list[Printer], entries: Iterable[PrioritizedJob], now: float, time_scale: float) -> dict[str, Eta]:
+    """
+    Project start and finish times of the running jobs and every queued job (see Projection),
+    O(n log n) for sorting the entries into dispatch order (a sorted list is a heap)
+    """
+    entries = sorted(entries, key=attrgetter("priority", "counter"))
+    projection = Projection(printers, [entries], now, time_scale)
+    projection.extend(len(entries))
+    return projection.etas
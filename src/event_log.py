@@ -0,0 +1,169 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(message)s'
+
+
+class _EnqueueHandler(logging.Handler):
+    """
+    Puts records on a queue without formatting them
+
+    Unlike logging.handlers.QueueHandler the message is not rendered here, so the
+    event loop only pays for creating the record; %-style arguments are formatted
+    by the background writer
+    """
+    def __init__(self, records: queue.SimpleQueue):
+        super().__init__()
+        self._records = records
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._records.put_nowait(record)
+
+
+class _BatchFileWriter:
+    """Appends a batch of records to a file with one write and one flush"""
+    def __init__(self, path: Path, render):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._render = render
+
+    def write(self, records: list[logging.LogRecord]) -> None:
+        lines = [line for line in map(self._render, records) if line is not None]
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _render_event(record: logging.LogRecord) -> Optional[str]:
+    """One NDJSON line for records logged with log_event, None for plain messages"""
+    event = getattr(record, "event", None)
+    if event is None:
+        return None
+    return json.dumps({"ts": record.created, "event": event, **record.fields}, separators=(',', ':'), default=str)
+
+
+class BackgroundLogWriter:
+    """
+    Background thread that drains the record queue and writes it in batches
+
+    It waits up to flush_interval for the first record, then takes whatever else is
+    already queued (up to batch_size) and writes the batch to every sink at once
+    """
+    def __init__(self, batch_size: int = 512, flush_interval: float = 0.5):
+        self.records: queue.SimpleQueue = queue.SimpleQueue()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writers: list[_BatchFileWriter] = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def add_file(self, path: Path, render) -> None:
+        with self._lock:
+            self._writers.append(_BatchFileWriter(path, render))
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _drain(self, block: bool) -> list[logging.LogRecord]:
+        batch = []
+        try:
+            batch.append(self.records.get(timeout=self.flush_interval) if block else self.records.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.records.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: list[logging.LogRecord]) -> None:
+        with self._lock:
+            for writer in self._writers:
+                try:
+                    writer.write(batch)
+                except Exception as e: # never let a bad record kill the writer
+                    print(f"Log writer error: {e}")
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+
+    def flush(self) -> None:
+        """Write everything queued so far (from the calling thread)"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+        with self._lock:
+            for writer in self._writers:
+                writer.close()
+            self._writers.clear()
+
+
+_writer: Optional[BackgroundLogWriter] = None
+_events_path: Optional[Path] = None
+
+
+def setup_logging(log_dir: Path, batch_size: int = 512, flush_interval: float = 0.5) -> BackgroundLogWriter:
+    """
+    Route the root logger through the background writer to log_dir/simulation.log
+
+    Safe to call more than once (simulator and api both call it at import); only the
+    first call configures logging
+    """
+    global _writer
+    if _writer is not None:
+        return _writer
+
+    _writer = BackgroundLogWriter(batch_size=batch_size, flush_interval=flush_interval)
+    formatter = logging.Formatter(LOG_FORMAT)
+    _writer.add_file(Path(log_dir) / 'simulation.log', formatter.format)
+    _writer.start()
+
+    root = logging.getLogger()
+    root.addHandler(_EnqueueHandler(_writer.records))
+    root.setLevel(logging.INFO)
+    atexit.register(_writer.stop)
+    return _writer
+
+
+def enable_event_log(path: Path) -> None:
+    """Also write structured events (log_event calls) as NDJSON to path"""
+    global _events_path
+    if _writer is None:
+        raise RuntimeError("setup_logging must be called first")
+    if _events_path is not None:
+        return
+    _events_path = Path(path)
+    _writer.add_file(_events_path, _render_event)
+
+
+def flush_logs() -> None:
+    """Write all pending records now"""
+    if _writer is not None:
+        _writer.flush()
+
+
+def log_event(event: str, msg: str, *args, **fields) -> None:
+    """
+    Log a message (lazily %-formatted) and attach a structured event
+
+    The event is written to the NDJSON event log as {"ts", "event", **fields}
+    """
+    logging.info(msg, *args, extra={"event": event, "fields": fields})
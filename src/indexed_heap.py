@@ -0,0 +1,167 @@
+import heapq
+from typing import Iterable, Iterator, Optional
+from models import PrioritizedJob
+
+
+def merge_heaps(heaps: Iterable[list[PrioritizedJob]]) -> Iterator[PrioritizedJob]:
+    """
+    Entries of several heap arrays in dispatch order (priority, then counter), lazily
+
+    A frontier heap holds the next candidate node of every heap tree and drawing a node
+    adds its two children, so the first k entries cost O(k log k) however large the heaps
+    are. The heaps must not change while the iterator is in use
+    """
+    heaps = [heap for heap in heaps if heap]
+    #(priority, counter, heap index, node index) of the next node of each heap tree
+    frontier = [(heap[0].priority, heap[0].counter, h, 0) for h, heap in enumerate(heaps)]
+    heapq.heapify(frontier)
+    while frontier:
+        _, _, h, i = heapq.heappop(frontier)
+        heap = heaps[h]
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                entry = heap[child]
+                heapq.heappush(frontier, (entry.priority, entry.counter, h, child))
+        yield heap[i]
+
+
+class IndexedHeap:
+    """
+    Binary min-heap of PrioritizedJob entries that knows where each job is
+
+    A {job_id: position} map is kept in sync on every swap, so besides push/pop in
+    O(log n) a job can be removed or have its priority changed in place in O(log n).
+    The entry keeps its FIFO counter, so a reprioritized job is still ordered by its
+    original submission among jobs of the same priority
+    """
+    def __init__(self):
+        self._heap: list[PrioritizedJob] = []
+        self._positions: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._positions
+
+    def __iter__(self) -> Iterator[PrioritizedJob]:
+        """Entries in heap (not sorted) order"""
+        return iter(self._heap)
+
+    @property
+    def entries(self) -> list[PrioritizedJob]:
+        """The heap array itself (entry i has children 2i+1 and 2i+2), not to be modified"""
+        return self._heap
+
+    def peek(self) -> Optional[PrioritizedJob]:
+        return self._heap[0] if self._heap else None
+
+    def push(self, entry: PrioritizedJob) -> None:
+        if entry.job.id in self._positions:
+            raise ValueError(f"Job {entry.job.id} is already in the heap")
+        self._heap.append(entry)
+        self._positions[entry.job.id] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def pop(self) -> PrioritizedJob:
+        return self._remove_at(0)
+
+    def remove(self, job_id: str) -> Optional[PrioritizedJob]:
+        """Remove a job wherever it is, None if it is not in the heap"""
+        position = self._positions.get(job_id)
+        return self._remove_at(position) if position is not None else None
+
+    def remove_many(self, job_ids: Iterable[str]) -> None:
+        """Remove several jobs, rebuilding the heap instead when they are more than half of it"""
+        job_ids = [job_id for job_id in job_ids if job_id in self._positions]
+        if len(job_ids) * 2 > len(self._heap):
+            removed = set(job_ids)
+            self._rebuild([entry for entry in self._heap if entry.job.id not in removed])
+        else:
+            for job_id in job_ids:
+                self.remove(job_id)
+
+    def update_priority(self, job_id: str, priority: int) -> bool:
+        """Change the priority of a job in place (decrease-key or increase-key)"""
+        position = self._positions.get(job_id)
+        if position is None:
+            return False
+        entry = self._heap[position]
+        old = entry.priority
+        entry.priority = priority
+        if priority < old:
+            self._sift_up(position)
+        elif priority > old:
+            self._sift_down(position)
+        return True
+
+    def extend(self, entries: list[PrioritizedJob], presorted: bool = False) -> None:
+        """
+        Add a batch of entries
+
+        An empty heap takes a presorted batch as is (a sorted list is a heap). A batch at
+        least as large as the heap is appended and heapified in linear time, smaller
+        batches are pushed
+        """
+        if not self._heap and presorted:
+            self._rebuild(entries, heapify=False)
+        elif len(entries) >= len(self._heap):
+            self._rebuild(self._heap + entries)
+        else:
+            for entry in entries:
+                self.push(entry)
+
+    def _rebuild(self, entries: list[PrioritizedJob], heapify: bool = True) -> None:
+        self._heap = entries
+        self._positions = {entry.job.id: i for i, entry in enumerate(entries)}
+        if len(self._positions) != len(entries):
+            raise ValueError("Duplicate job ids in the heap")
+        if heapify:
+            for i in reversed(range(len(entries) // 2)):
+                self._sift_down(i)
+
+    def _remove_at(self, position: int) -> PrioritizedJob:
+        heap = self._heap
+        entry = heap[position]
+        del self._positions[entry.job.id]
+        last = heap.pop()
+        if position < len(heap):
+            heap[position] = last
+            self._positions[last.job.id] = position
+            #the moved entry may belong either above or below its new position
+            if position > 0 and last < heap[(position - 1) // 2]:
+                self._sift_up(position)
+            else:
+                self._sift_down(position)
+        return entry
+
+    def _sift_up(self, position: int) -> None:
+        heap, positions = self._heap, self._positions
+        entry = heap[position]
+        while position > 0:
+            parent = (position - 1) // 2
+            if not entry < heap[parent]:
+                break
+            heap[position] = heap[parent]
+            positions[heap[position].job.id] = position
+            position = parent
+        heap[position] = entry
+        positions[entry.job.id] = position
+
+    def _sift_down(self, position: int) -> None:
+        heap, positions = self._heap, self._positions
+        size = len(heap)
+        entry = heap[position]
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            heap[position] = heap[child]
+            positions[heap[position].job.id] = position
+            position = child
+        heap[position] = entry
+        positions[entry.job.id] = position
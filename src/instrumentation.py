@@ -0,0 +1,125 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+PROFILE_KINDS = ("cprofile", "tracemalloc")
+
+@dataclass
+class PhaseTimer:
+    """Aggregated durations of one hot-path phase"""
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float, count: int = 1) -> None:
+        """Add one duration, or a batch of count items that took seconds together (max uses the batch mean)"""
+        self.count += count
+        self.total += seconds
+        if seconds / count > self.max:
+            self.max = seconds / count
+
+
+class Instrumentation:
+    """
+    Per-phase timers for the simulator hot path and on-demand profiling
+
+    Callers check `enabled` before reading the clock, so a disabled instance costs one
+    attribute lookup per phase. Phases used by the simulator:
+        enqueue     - ThreadSafePriorityQueue.put and put_many (counted per job)
+        dequeue     - popping a job once one is available, including skipped cancelled entries
+        dispatch    - from the job being ready (queued and a printer idle) to the printer starting it
+        sleep_error - how late the printer woke up after the job's deadline
+        completion  - finishing the job, recording it and logging
+        logging     - time spent in logging calls of the printer loop
+    """
+    def __init__(self, enabled: bool = False, output_dir: str = "logs"):
+        self.enabled = enabled
+        self.output_dir = Path(output_dir)
+        self._phases: dict[str, PhaseTimer] = {}
+        self._profile_kind: Optional[str] = None
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def record(self, phase: str, seconds: float, count: int = 1) -> None:
+        """Add a duration to a phase, count is the number of items it covers"""
+        timer = self._phases.get(phase)
+        if timer is None:
+            timer = self._phases[phase] = PhaseTimer()
+        timer.add(seconds, count)
+
+    def snapshot(self) -> dict:
+        """Count, total, mean and max (ms) per phase"""
+        return {
+            "enabled": self.enabled,
+            "profiling": self._profile_kind,
+            "phases": {
+                phase: {
+                    "count": timer.count,
+                    "total_ms": timer.total * 1000,
+                    "mean_ms": timer.total / timer.count * 1000 if timer.count else 0.0,
+                    "max_ms": timer.max * 1000
+                }
+                for phase, timer in self._phases.items()
+            }
+        }
+
+    def reset(self) -> None:
+        self._phases.clear()
+
+    @property
+    def is_profiling(self) -> bool:
+        return self._profile_kind is not None
+
+    def start_profile(self, kind: str = "cprofile") -> None:
+        """Start a cProfile or tracemalloc capture"""
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"Unknown profile kind {kind}, expected one of {PROFILE_KINDS}")
+        if self.is_profiling:
+            raise RuntimeError(f"A {self._profile_kind} capture is already running")
+        if kind == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            tracemalloc.start()
+        self._profile_kind = kind
+
+    def stop_profile(self) -> Path:
+        """Stop the running capture and dump it to the output directory, returns the file path"""
+        if not self.is_profiling:
+            raise RuntimeError("No capture is running")
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        if self._profile_kind == "cprofile":
+            self._profiler.disable()
+            filepath = self.output_dir / f"profile_{timestamp}.prof"
+            self._profiler.dump_stats(filepath)
+            summary = io.StringIO()
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            filepath.with_suffix(".txt").write_text(summary.getvalue(), encoding='utf-8')
+            self._profiler = None
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            filepath = self.output_dir / f"tracemalloc_{timestamp}.snap"
+            snapshot.dump(str(filepath))
+            top = snapshot.statistics("lineno")[:30]
+            filepath.with_suffix(".txt").write_text("\n".join(str(stat) for stat in top), encoding='utf-8')
+
+        self._profile_kind = None
+        return filepath
+
+    async def profile_window(self, kind: str, seconds: float) -> Path:
+        """Capture a profile over the next `seconds` of the event loop"""
+        self.start_profile(kind)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            filepath = self.stop_profile()
+        return filepath
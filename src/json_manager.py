@@ -1,10 +1,16 @@
 from pathlib import Path
 from models import JobRecord,Job
 from datetime import datetime
+from typing import Optional
 import json
 
-def generate_json_report(records: list[JobRecord]) -> None:
-    output_dir = Path("logs")
+def generate_json_report(records: list[JobRecord], output_dir: str = "logs", time_offset: float = 0.0,
+                         summary: Optional[dict] = None) -> Path:
+    """
+    Write the job report, time_offset converts the monotonic record timestamps to epoch seconds
+    and summary (the stats breakdown) is written before the jobs when given
+    """
+    output_dir = Path(output_dir)
     output_dir.mkdir(exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
@@ -12,43 +18,61 @@ def generate_json_report(records: list[JobRecord]) -> None:
     filepath = output_dir / filename
 
     report  = {
+        **({"summary": summary} if summary is not None else {}),
         "jobs": [
             {
                 "job_id": r.job_id,
                 "status": r.status,
-                "started_at": r.start_time if r.start_time > 0 else None,
-                "finished_at": r.end_time
+                "started_at": r.start_time + time_offset if r.start_time > 0 else None,
+                "finished_at": r.end_time + time_offset,
+                "preemptions": r.preemptions
             }
             for r in records
         ]
     }
     with open(filepath,'w', encoding='utf-8') as f:
         json.dump(report,f,default=lambda o:o.__dict__, indent=4)
+    return filepath
+
+def _job_from_dict(job: dict) -> Job:
+    return Job(
+        id = job["id"],
+        material = job["material"],
+        est_time = job["est_time"],
+        priority = job["priority"],
+        arrival_time = job.get("arrival_time"),
+        cancel_at = job.get("cancel_at"),
+        tag = job.get("tag")
+    )
+
+def _read_ndjson(path: Path) -> list[Job]:
+    """Read one job per line, skipping blank lines"""
+    jobs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                jobs.append(_job_from_dict(json.loads(line)))
+    return jobs
 
 def load_jobs_from_json(filepath: str) -> list[Job]:
+    """Load jobs from a {"jobs": [...]} JSON file or, for .ndjson/.jsonl files, one job per line"""
     try:
         path = Path(filepath)
         if not path.exists():
             print(f"Error: File {filepath} not found")
             return []
         
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        jobs_data = data.get("jobs", [])
+        if path.suffix in (".ndjson", ".jsonl"):
+            jobs = _read_ndjson(path)
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            jobs = [_job_from_dict(job) for job in data.get("jobs", [])]
         
-        if not jobs_data:
+        if not jobs:
             print(f"Warning: No Jobs found in {filepath}")
             return []
         
-        jobs = []
-        for job in jobs_data:
-            jobs.append(Job(
-                id = job["id"],
-                material = job["material"],
-                est_time = job["est_time"],
-                priority = job["priority"]
-            ))
         print(f"Loaded {len(jobs)} jobs in {filepath}")
         return jobs
     except json.JSONDecodeError as e:
@@ -56,4 +80,19 @@ def load_jobs_from_json(filepath: str) -> list[Job]:
         return []
     except Exception as e:
         print(f"Error: loading jobs: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def load_fleet_from_json(filepath: str) -> list[dict]:
+    """Load printer specs from a {"printers": [...]} JSON file (see models.build_fleet)"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        specs = data.get("printers", []) if isinstance(data, dict) else data
+        print(f"Loaded {len(specs)} printer specs in {filepath}")
+        return specs
+    except FileNotFoundError:
+        print(f"Error: File {filepath} not found")
+        return []
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in {filepath}: {e}")
+        return []
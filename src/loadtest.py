@@ -0,0 +1,259 @@
+import asyncio
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import httpx
+import numpy as np
+
+MATERIALS = ["PLA", "PETG", "ABS", "TPU"]
+
+# Share of requests per operation
+DEFAULT_MIX = {"create": 0.6, "list": 0.15, "cancel": 0.15, "stats": 0.1}
+
+@dataclass
+class EndpointResult:
+    """Latencies (seconds) and response codes observed for one operation"""
+    latencies: list[float] = field(default_factory=list)
+    status_codes: dict[int, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, latency: float, status_code: int) -> None:
+        self.latencies.append(latency)
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = np.asarray(self.latencies)
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            mean = latencies.mean() * 1000
+        else:
+            p50 = p95 = p99 = mean = 0.0
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "mean_ms": float(mean),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "status_codes": {str(code): count for code, count in sorted(self.status_codes.items())}
+        }
+
+
+class LoadTester:
+    """
+    Drives an open-loop mix of API requests at a target rate
+
+    Requests are issued on a fixed schedule (one every 1/rate seconds) regardless of how fast
+    earlier ones complete, with at most `concurrency` requests in flight
+    """
+    def __init__(self, client: httpx.AsyncClient, rate: float, duration: float,
+                 mix: Optional[dict[str, float]] = None, concurrency: int = 100, seed: Optional[int] = None):
+        if rate <= 0 or duration <= 0:
+            raise ValueError("Rate and duration must be positive")
+        self.client = client
+        self.rate = rate
+        self.duration = duration
+        self.mix = mix or DEFAULT_MIX
+        unknown = set(self.mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise ValueError(f"Unknown operations in mix: {sorted(unknown)}")
+        self.concurrency = concurrency
+        self._rng = random.Random(seed)
+        self._run_id = f"{int(time.time() * 1000) % 10**8}"
+        self._created: list[str] = []
+        self._counter = 0
+        self.results = {op: EndpointResult() for op in self.mix}
+
+    def _new_job(self, est_time: Optional[float] = None) -> dict:
+        self._counter += 1
+        return {
+            "id": f"lt-{self._run_id}-{self._counter}",
+            "material": self._rng.choice(MATERIALS),
+            "est_time": est_time or round(self._rng.uniform(5, 60), 2),
+            "priority": self._rng.randint(0, 5)
+        }
+
+    async def prefill(self, count: int) -> None:
+        """Create a backlog of long jobs that stay queued during the test"""
+        for _ in range(count):
+            job = self._new_job(est_time=10**6)
+            response = await self.client.post("/jobs", json=job)
+            if response.status_code == 201:
+                self._created.append(job["id"])
+
+    async def _request(self, op: str) -> httpx.Response:
+        if op == "create":
+            job = self._new_job()
+            response = await self.client.post("/jobs", json=job)
+            if response.status_code == 201:
+                self._created.append(job["id"]) # only jobs that exist can be picked for cancel
+            return response
+        if op == "list":
+            return await self.client.get("/jobs")
+        if op == "stats":
+            return await self.client.get("/stats")
+        job_id = self._created.pop(self._rng.randrange(len(self._created))) if self._created else "lt-missing"
+        return await self.client.delete(f"/jobs/{job_id}")
+
+    async def _send(self, op: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self._request(op)
+            except httpx.HTTPError:
+                self.results[op].errors += 1
+                return
+            self.results[op].record(time.perf_counter() - start, response.status_code)
+
+    async def run(self) -> dict:
+        """Run the test and return the report"""
+        ops = list(self.mix)
+        weights = list(self.mix.values())
+        total = int(self.rate * self.duration)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / self.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            op = self._rng.choices(ops, weights)[0]
+            tasks.append(asyncio.create_task(self._send(op, semaphore)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        health = (await self.client.get("/health")).json()
+        completed = sum(len(r.latencies) for r in self.results.values())
+        return {
+            "target_rate": self.rate,
+            "duration": elapsed,
+            "achieved_rate": completed / elapsed if elapsed > 0 else 0.0,
+            "endpoints": {op: result.summary(elapsed) for op, result in self.results.items()},
+            "server": health
+        }
+
+
+@asynccontextmanager
+async def in_process_client():
+    """
+    Client bound to the FastAPI app in this process, with its lifespan running
+
+    Jobs still running when the test ends (e.g. the prefilled backlog) are cancelled
+    instead of waited for
+    """
+    import api
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            yield client
+        if api.sim is not None: # None when the app uses the queue service
+            await api.sim.stop(cancel_running=True)
+
+@asynccontextmanager
+async def spawned_server_client(port: int):
+    """Start a local uvicorn server in a subprocess (from the repo root) and yield a client for it"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--app-dir", "src", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).parent.parent
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            for _ in range(100):
+                try:
+                    await client.get("/health")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            yield client
+    finally:
+        process.terminate()
+        process.wait()
+
+@asynccontextmanager
+async def remote_client(url: str):
+    async with httpx.AsyncClient(base_url=url) as client:
+        yield client
+
+
+def print_report(report: dict) -> None:
+    print("\n" + "=" * 80)
+    print("LOAD TEST")
+    print("=" * 80)
+    print(f"Target rate: {report['target_rate']:.1f} req/s   Achieved: {report['achieved_rate']:.1f} req/s   Duration: {report['duration']:.2f}s")
+    print(f"\n{'Endpoint':<10}{'Requests':>10}{'Errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 80)
+    for op, summary in report['endpoints'].items():
+        print(f"{op:<10}{summary['requests']:>10}{summary['errors']:>8}{summary['throughput']:>10.1f}"
+              f"{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}")
+    print("\nServer")
+    for key, value in report['server'].items():
+        print(f" {key}: {value}")
+    print("=" * 80 + "\n")
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """Parse a mix such as create=0.7,list=0.1,cancel=0.1,stats=0.1"""
+    mix = {}
+    for part in text.split(","):
+        op, weight = part.split("=")
+        mix[op.strip()] = float(weight)
+    return mix
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description='Load test for the 3D Printing Queue API',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+    Examples:
+            python src/loadtest.py --rate 500 --duration 10
+            python src/loadtest.py --spawn --rate 200 --prefill 10000
+            python src/loadtest.py --url http://127.0.0.1:8000 --mix create=0.5,stats=0.5
+            """
+    )
+    parser.add_argument('--url', type=str, default=None, help='Base URL of a running server (default: in-process app)')
+    parser.add_argument('--spawn', action='store_true', help='Start a local uvicorn server for the test')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --spawn (default: 8765)')
+    parser.add_argument('--rate', '-r', type=float, default=100.0, help='Target requests per second (default: 100)')
+    parser.add_argument('--duration', '-d', type=float, default=10.0, help='Test duration in seconds (default: 10)')
+    parser.add_argument('--concurrency', '-c', type=int, default=100, help='Maximum requests in flight (default: 100)')
+    parser.add_argument('--mix', type=parse_mix, default=None, help='Operation mix, e.g. create=0.6,list=0.15,cancel=0.15,stats=0.1')
+    parser.add_argument('--prefill', type=int, default=0, help='Queued jobs to create before the test (default: 0)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        client_context = remote_client(args.url)
+    elif args.spawn:
+        client_context = spawned_server_client(args.port)
+    else:
+        client_context = in_process_client()
+
+    async with client_context as client:
+        tester = LoadTester(client, rate=args.rate, duration=args.duration, mix=args.mix,
+                            concurrency=args.concurrency, seed=args.seed)
+        if args.prefill:
+            await tester.prefill(args.prefill)
+        report = await tester.run()
+
+    print_report(report)
+    output = args.output or Path("logs") / f"loadtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    Path(output).parent.mkdir(exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,6 +2,11 @@ from dataclasses import dataclass, field
 from enum import Enum
 import time
 from typing import Optional
+from timeline import BusyTimeline
+
+#All simulation timestamps come from a monotonic clock, so wall-clock jumps cannot corrupt
+#durations, utilization or throughput. Only differences between timestamps are meaningful
+clock = time.monotonic
 
 class JobStatus(Enum):
     "Represents the different states of each job"
@@ -23,15 +28,27 @@ class Job:
         started_at: Timestamp when the job was started
         finished_at: Timestamp when the job was finished
         status: Current status of the job
+        arrival_time: Simulated seconds after the start when the job is released to the queue (None = immediately)
+        cancel_at: Simulated seconds after the start when the job is cancelled if still queued
+        queued_at: Timestamp when the job was put in the queue
+        tag: Optional submitter tag, used to query or cancel a group of jobs
+        remaining: Simulated seconds of work left after a checkpointed preemption (None = est_time)
+        preemptions: Times the job was suspended for a more urgent one
     """
     id: str
     material: str
     est_time: float
     priority: int = 0 #lower means higher priority
-    created_at: float = field(default_factory=time.time)
+    created_at: float = field(default_factory=clock)
     started_at: Optional[float] = None
     finished_at: Optional[float] = None
     status: JobStatus = JobStatus.QUEUE
+    arrival_time: Optional[float] = None
+    cancel_at: Optional[float] = None
+    queued_at: Optional[float] = None
+    tag: Optional[str] = None
+    remaining: Optional[float] = None
+    preemptions: int = 0
 
     def __post_init__(self):
         """Data validation"""
@@ -39,6 +56,12 @@ class Job:
             raise ValueError("Estimated time must be positive")
         if self.priority < 0 :
             raise ValueError("Priority must be positive")
+        if self.arrival_time is not None and self.arrival_time < 0:
+            raise ValueError("Arrival time must not be negative")
+        if self.cancel_at is not None and self.cancel_at < 0:
+            raise ValueError("Cancel time must not be negative")
+        if self.cancel_at is not None and self.arrival_time is not None and self.cancel_at < self.arrival_time:
+            raise ValueError("Cancel time must not be before the arrival time")
     
     @property
     def wait_time(self) -> Optional[float]:
@@ -53,21 +76,27 @@ class Job:
         if self.finished_at is not None and self.started_at is not None:
             return self.finished_at - self.started_at
 
-    def start_processing(self) -> None:
-        """Beginning of the Job"""
+    @property
+    def work_left(self) -> float:
+        """Simulated seconds of work the job still needs"""
+        return self.remaining if self.remaining is not None else self.est_time
+
+    def start_processing(self, started_at: Optional[float] = None) -> None:
+        """Beginning of the Job, started_at defaults to now. A resumed job keeps the start of its first run"""
         self.status = JobStatus.RUNNING
-        self.started_at = time.time()
+        if self.started_at is None:
+            self.started_at = started_at if started_at is not None else clock()
     
-    def completed_processing(self) -> None:
-        """Job Completion"""
+    def completed_processing(self, finished_at: Optional[float] = None) -> None:
+        """Job Completion, finished_at defaults to now"""
         self.status = JobStatus.COMPLETED
-        self.finished_at = time.time()
+        self.finished_at = finished_at if finished_at is not None else clock()
     
     def cancel(self) -> None:
         """Cancel the Job"""
         self.status = JobStatus.CANCELLED
         if self.finished_at is None:
-            self.finished_at = time.time()
+            self.finished_at = clock()
 
 @dataclass(order=True)
 class PrioritizedJob:
@@ -89,42 +118,135 @@ class Printer:
     Attributes:
         id: Unique printer identifier
         current_job: Job currently being processed
-        total_busy_time: Total time working
         start_job_time: Time printer started to work
+        deadline: Scheduled end of the current (or last) job
+        timeline: Busy intervals of the printer, total busy time is derived from it
+        speed: Speed factor, a job runs for est_time / speed
+        materials: Materials the printer can print (None = any material)
+        printer_class: Name of the printer model, utilization is also reported per class
+        joined_at: Timestamp the printer was added to a running fleet (None = from the start)
+        left_at: Timestamp the printer left the fleet after draining (None = still in it)
+        draining: The printer finishes its current job and takes no new one
     """
     
     id: int
     current_job: Optional[Job] = None
-    total_busy_time: float = 0.0
     start_job_time: float = 0.0
+    deadline: float = 0.0
+    timeline: BusyTimeline = field(default_factory=BusyTimeline, repr=False)
+    speed: float = 1.0
+    materials: Optional[frozenset[str]] = None
+    printer_class: str = "standard"
+    joined_at: Optional[float] = None
+    left_at: Optional[float] = None
+    draining: bool = False
+
+    def __post_init__(self):
+        """Data validation"""
+        if self.speed <= 0:
+            raise ValueError("Printer speed must be positive")
+        if self.materials is not None:
+            if not self.materials:
+                raise ValueError("Printer must support at least one material")
+            self.materials = frozenset(self.materials)
+
+    @property
+    def total_busy_time(self) -> float:
+        """Total time working"""
+        return self.timeline.total_busy_time
+
+    def can_print(self, material: str) -> bool:
+        """Check if the printer supports the material"""
+        return self.materials is None or material in self.materials
+
+    def run_time_for(self, job: Job) -> float:
+        """Simulated time the job (what is left of it after a preemption) takes on this printer"""
+        return job.work_left / self.speed
+
+    @property
+    def state(self) -> str:
+        """online, draining or removed"""
+        if self.left_at is not None:
+            return "removed"
+        return "draining" if self.draining else "online"
+
+    @property
+    def accepts_jobs(self) -> bool:
+        return self.left_at is None and not self.draining
 
     @property
     def is_busy(self) -> bool:
         """Check to see if the printer is being used"""
         return self.current_job is not None
     
-    def start_job(self, job: Job) -> None:
-        """ Start Processing job for printer"""
+    def start_job(self, job: Job, started_at: Optional[float] = None) -> None:
+        """ Start Processing job for printer, started_at defaults to now"""
         self.current_job = job
-        self.start_job_time = time.time()
-        job.start_processing()
+        self.start_job_time = started_at if started_at is not None else clock()
+        job.start_processing(started_at=self.start_job_time)
     
-    def finish_current_job(self) -> Optional[Job]:
-        """ Complete a printing job successfully"""
+    def finish_current_job(self, finished_at: Optional[float] = None) -> Optional[Job]:
+        """ Complete a printing job successfully, finished_at defaults to now"""
         job = self.current_job
-        job.completed_processing()
+        job.completed_processing(finished_at=finished_at)
 
-        self.total_busy_time += time.time() - self.start_job_time
+        self.timeline.add(self.start_job_time, job.finished_at)
         self.current_job = None
         return job
     
+    def abort_current_job(self) -> Optional[Job]:
+        """ Stop the current job without completing it (shutdown or preemption), the time spent still counts as busy"""
+        job = self.current_job
+        self.timeline.add(self.start_job_time, max(clock(), self.start_job_time))
+        self.current_job = None
+        return job
+
+    def online_time(self, start: float, end: float) -> float:
+        """Time between start and end the printer was part of the fleet, the base of its utilization"""
+        joined = start if self.joined_at is None else max(start, self.joined_at)
+        left = end if self.left_at is None else min(end, self.left_at)
+        return max(0.0, left - joined)
+
     def get_utilization(self, total_simulation_time: float) -> float:
-        """ Calculate printer utilization"""
+        """ Calculate printer utilization over the time it was online"""
         if total_simulation_time <= 0:
             return 0.0
         return (self.total_busy_time / total_simulation_time) * 100
+
+    def get_utilization_over_time(self, start: float, end: float, bins: int = 100) -> list[float]:
+        """ Calculate printer utilization (%) for each time bin between start and end"""
+        _, utilization = self.timeline.utilization(start, end, bins)
+        return (utilization * 100).tolist()
     
 
+def build_fleet(specs: list[dict], start_id: int = 0) -> list[Printer]:
+    """
+    Create printers from fleet specs, ids are assigned in order from start_id
+
+    Each spec is {"class": name, "count": n, "speed": factor, "materials": [...]}, every key
+    is optional (1 standard printer of speed 1.0 that prints any material)
+    """
+    printers = []
+    for spec in specs:
+        unknown = set(spec) - {"class", "count", "speed", "materials"}
+        if unknown:
+            raise ValueError(f"Unknown printer spec keys: {', '.join(sorted(unknown))}")
+        count = spec.get("count", 1)
+        if count <= 0:
+            raise ValueError("Printer count must be positive")
+        materials = spec.get("materials")
+        for _ in range(count):
+            printers.append(Printer(
+                id=start_id + len(printers),
+                speed=spec.get("speed", 1.0),
+                materials=frozenset(materials) if materials is not None else None,
+                printer_class=spec.get("class", "standard")
+            ))
+    if not printers:
+        raise ValueError("Fleet has no printers")
+    return printers
+
+
 @dataclass
 class JobRecord:
     """
@@ -137,6 +259,8 @@ class JobRecord:
     duration: float # Diference between end_time and start time
     status: str # Job end status
     priority: int # Job priority
+    material: str = "" # Job material
+    preemptions: int = 0 # Times the job was suspended, duration then spans the suspensions
 
 if __name__ == "__main__":
     #Test Job creating and processing
@@ -162,7 +286,7 @@ if __name__ == "__main__":
     print(f"Job Processing Time : {job.run_time:.3f} seconds Estimated: {job.est_time:.3f} seconds")
 
     #Test printer 
-    start_sim = time.time()
+    start_sim = clock()
     printer = Printer(id=1)
 
     job1 = Job("J1", "PLA", 10,priority=2)
@@ -186,7 +310,7 @@ if __name__ == "__main__":
     time.sleep(jobs[1].job.est_time * time_speedup)
     printer.finish_current_job()
     
-    total_sim_time = time.time() - start_sim
+    total_sim_time = clock() - start_sim
     print(f"Printer : {printer.id}, Total time processing: {printer.total_busy_time} seconds")
     print(f"Expected Time Processing: {jobs[0].job.est_time/time_speedup + jobs[1].job.est_time/time_speedup} seconds")
     print(f"Printer Utilization : {printer.get_utilization(total_simulation_time=total_sim_time):.3f} %")
\ No newline at end of file
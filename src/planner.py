@@ -0,0 +1,262 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+from models import Job
+from json_manager import load_jobs_from_json
+
+POLICIES = ("priority", "fifo", "sjf")
+
+#Bump when a change alters simulate_virtual results, cached results of older versions are ignored
+ENGINE_VERSION = 1
+
+
+class Workload:
+    """
+    Column view of a list of jobs, cheap to pickle into worker processes
+
+    Times are simulated seconds (the same units as est_time, before time_scale)
+    """
+    def __init__(self, jobs: list[Job]):
+        self.arrival = np.array([job.arrival_time or 0.0 for job in jobs], dtype=np.float64)
+        self.est_time = np.array([job.est_time for job in jobs], dtype=np.float64)
+        self.priority = np.array([job.priority for job in jobs], dtype=np.int64)
+        self.cancel_at = np.array([job.cancel_at if job.cancel_at is not None else np.inf for job in jobs], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.arrival)
+
+
+def simulate_virtual(workload: Workload, num_printers: int, policy: str = "priority") -> dict:
+    """
+    Event-driven run of the scheduler model in virtual time
+
+    Same rules as the Simulator: jobs are released at their arrival time, an idle printer
+    takes the best queued job and a queued job is cancelled once its cancel_at passes.
+    The best job is the one with the lowest (priority, FIFO) for "priority", arrival
+    order for "fifo" and the lowest (est_time, FIFO) for "sjf". Runs in O(n log n)
+    """
+    if num_printers <= 0:
+        raise ValueError("Number of printers must be positive")
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy}, expected one of {POLICIES}")
+
+    order = np.argsort(workload.arrival, kind="stable")
+    arrival = workload.arrival[order].tolist()
+    est_time = workload.est_time[order].tolist()
+    priority = workload.priority[order].tolist()
+    cancel_at = workload.cancel_at[order].tolist()
+    n = len(arrival)
+
+    ready: list[tuple] = []
+    idle = list(range(num_printers - 1, -1, -1))
+    busy: list[tuple[float, int]] = [] # (finish, printer_id)
+    busy_time = [0.0] * num_printers
+    waits = []
+    cancelled = 0
+    makespan = 0.0
+    i = 0
+
+    while i < n or ready:
+        #Next event: a printer finishing if jobs are waiting, otherwise the next arrival
+        now = busy[0][0] if ready else arrival[i]
+        while busy and busy[0][0] <= now:
+            idle.append(heapq.heappop(busy)[1])
+        while i < n and arrival[i] <= now:
+            if policy == "priority":
+                key = (priority[i], i)
+            elif policy == "sjf":
+                key = (est_time[i], i)
+            else:
+                key = (i,)
+            heapq.heappush(ready, (key, i))
+            i += 1
+
+        while idle and ready:
+            _, job = heapq.heappop(ready)
+            if cancel_at[job] < now:
+                cancelled += 1
+                continue
+            printer_id = idle.pop()
+            waits.append(now - arrival[job])
+            finish = now + est_time[job]
+            busy_time[printer_id] += est_time[job]
+            makespan = max(makespan, finish)
+            heapq.heappush(busy, (finish, printer_id))
+
+    waits = np.asarray(waits)
+    completed = len(waits)
+    if completed:
+        p50, p90, p95, p99 = np.percentile(waits, [50, 90, 95, 99], method="inverted_cdf")
+        avg_wait = float(waits.mean())
+        max_wait = float(waits.max())
+    else:
+        p50 = p90 = p95 = p99 = avg_wait = max_wait = 0.0
+    return {
+        "num_printers": num_printers,
+        "policy": policy,
+        "completed": completed,
+        "cancelled": cancelled,
+        "avg_wait_time": avg_wait,
+        "p50_wait_time": float(p50),
+        "p90_wait_time": float(p90),
+        "p95_wait_time": float(p95),
+        "p99_wait_time": float(p99),
+        "max_wait_time": max_wait,
+        "makespan": makespan,
+        "throughput": completed / makespan if makespan else 0.0,
+        "avg_utilization_percent": sum(busy_time) / (makespan * num_printers) * 100 if makespan else 0.0
+    }
+
+
+#Workload of the current worker process, set once by the pool initializer
+_worker_workload: Optional[Workload] = None
+
+def _init_worker(workload: Workload) -> None:
+    global _worker_workload
+    _worker_workload = workload
+
+def _evaluate(num_printers: int, policy: str) -> dict:
+    return simulate_virtual(_worker_workload, num_printers, policy)
+
+
+class CapacityPlanner:
+    """
+    Finds the fewest printers that keep a wait percentile at or below a target
+
+    Wait times only go down as printers are added, so each policy is searched with a
+    parallel k-ary search: every round evaluates up to `workers` evenly spaced printer
+    counts inside the open interval at once and keeps the sub-interval where the target
+    starts being met
+    """
+    def __init__(self, jobs: list[Job], workers: Optional[int] = None):
+        if not jobs:
+            raise ValueError("Workload has no jobs")
+        self.workload = Workload(jobs)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.evaluated: dict[tuple[str, int], dict] = {}
+
+    def _run(self, executor: Optional[Executor], candidates: list[tuple[int, str]]) -> None:
+        candidates = [c for c in candidates if (c[1], c[0]) not in self.evaluated]
+        if executor is None:
+            results = [simulate_virtual(self.workload, printers, policy) for printers, policy in candidates]
+        else:
+            results = executor.map(_evaluate, *zip(*candidates)) if candidates else []
+        for (printers, policy), result in zip(candidates, results):
+            self.evaluated[(policy, printers)] = result
+
+    def plan(self, target_wait: float, percentile: int = 95, policies: tuple[str, ...] = ("priority",),
+             max_printers: Optional[int] = None) -> Optional[dict]:
+        """
+        Minimal configuration meeting the target, or None if even max_printers cannot
+
+        Returns the predicted stats of the chosen (printers, policy) plus the per-policy minimum
+        """
+        metric = f"p{percentile}_wait_time"
+        if metric not in ("p50_wait_time", "p90_wait_time", "p95_wait_time", "p99_wait_time"):
+            raise ValueError("Percentile must be one of 50, 90, 95, 99")
+        for policy in policies:
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown policy {policy}, expected one of {POLICIES}")
+        max_printers = max_printers or len(self.workload) # with one printer per job nobody waits
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.workload,))
+        try:
+            meets = lambda policy, printers: self.evaluated[(policy, printers)][metric] <= target_wait
+            self._run(executor, [(max_printers, policy) for policy in policies] + [(1, policy) for policy in policies])
+
+            bounds = {}
+            for policy in policies:
+                if meets(policy, 1):
+                    bounds[policy] = (0, 1)
+                elif meets(policy, max_printers):
+                    bounds[policy] = (1, max_printers) # lo fails, hi meets
+            #k-ary search, all policies share each round of the pool
+            while any(hi - lo > 1 for lo, hi in bounds.values()):
+                open_policies = [p for p, (lo, hi) in bounds.items() if hi - lo > 1]
+                per_policy = max(1, self.workers // len(open_policies))
+                candidates = []
+                for policy in open_policies:
+                    lo, hi = bounds[policy]
+                    step = (hi - lo) / (per_policy + 1)
+                    points = sorted({min(hi - 1, max(lo + 1, round(lo + step * k))) for k in range(1, per_policy + 1)})
+                    candidates.extend((printers, policy) for printers in points)
+                self._run(executor, candidates)
+                for policy in open_policies:
+                    lo, hi = bounds[policy]
+                    for printers in range(lo + 1, hi):
+                        if (policy, printers) in self.evaluated:
+                            if meets(policy, printers):
+                                hi = printers
+                                break
+                            lo = printers
+                    bounds[policy] = (lo, hi)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        minimal = {policy: self.evaluated[(policy, hi)] for policy, (lo, hi) in bounds.items()}
+        if not minimal:
+            return None
+        best = min(minimal.values(), key=lambda r: (r["num_printers"], r[metric]))
+        return {
+            "target": {"percentile": percentile, "max_wait_time": target_wait},
+            "recommended": best,
+            "per_policy": minimal,
+            "simulations": len(self.evaluated)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Capacity planner: fewest printers that keep a wait percentile under a target',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+    Wait times are in simulated seconds (est_time units, before time_scale)
+    Examples:
+            python src/planner.py --input test_data/sample_input.json --target 30
+            python src/planner.py --input workload.ndjson --target 120 --percentile 99 --policies priority,fifo,sjf
+            """
+    )
+    parser.add_argument('--input', '-i', type=str, required=True, help='Workload file (JSON or NDJSON)')
+    parser.add_argument('--target', type=float, required=True, help='Maximum wait time at the percentile')
+    parser.add_argument('--percentile', type=int, default=95, choices=(50, 90, 95, 99), help='Wait percentile (default: 95)')
+    parser.add_argument('--policies', type=str, default="priority", help=f'Comma separated policies to compare, from {",".join(POLICIES)}')
+    parser.add_argument('--max-printers', type=int, default=None, help='Largest fleet to consider (default: number of jobs)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Parallel simulations (default: CPU count)')
+    args = parser.parse_args()
+
+    jobs = load_jobs_from_json(args.input)
+    if not jobs:
+        sys.exit(1)
+    planner = CapacityPlanner(jobs, workers=args.workers)
+    result = planner.plan(
+        target_wait=args.target,
+        percentile=args.percentile,
+        policies=tuple(p.strip() for p in args.policies.split(",")),
+        max_printers=args.max_printers
+    )
+    if result is None:
+        print(f"No configuration up to {args.max_printers or len(jobs)} printers meets p{args.percentile} <= {args.target}")
+        sys.exit(1)
+
+    best = result["recommended"]
+    print("\n" + "=" * 60)
+    print("CAPACITY PLAN")
+    print("=" * 60)
+    print(f"Target: p{args.percentile} wait <= {args.target}")
+    print(f"Recommended: {best['num_printers']} printers, {best['policy']} policy ({result['simulations']} simulations)")
+    for policy, stats in result["per_policy"].items():
+        print(f" {policy:<10} {stats['num_printers']:>5} printers  p95 {stats['p95_wait_time']:.2f}  "
+              f"p99 {stats['p99_wait_time']:.2f}  avg {stats['avg_wait_time']:.2f}  utilization {stats['avg_utilization_percent']:.1f} %")
+    print("=" * 60)
+    print(json.dumps(best, indent=4))
+
+if __name__ == "__main__":
+    main()
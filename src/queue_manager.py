@@ -1,44 +1,336 @@
-from models import Job, JobStatus, PrioritizedJob
+from models import Job, JobStatus, PrioritizedJob, clock
 import asyncio
+import time
+from collections import deque
+from typing import Callable, Optional
+from instrumentation import Instrumentation
+from indexed_heap import IndexedHeap
 from dataclasses import dataclass
 from models import JobRecord
+from record_stats import RecordColumns
 
-class ThreadSafePriorityQueue:
+class JobIndex:
     """
-    ThreadSafe priority queue for managing printing jobs
+    Secondary indexes of a set of jobs by material, priority and tag
+
+    Each index maps a key to an insertion ordered {job_id: job} dict, so adding and
+    removing a job is O(1) and a query walks only the smallest matching bucket
     """
     def __init__(self):
-        self._queue = asyncio.PriorityQueue()
+        self._by_material: dict[str, dict[str, Job]] = {}
+        self._by_priority: dict[int, dict[str, Job]] = {}
+        self._by_tag: dict[str, dict[str, Job]] = {}
+
+    def add(self, job: Job) -> None:
+        bucket = self._by_material.get(job.material)
+        if bucket is None:
+            bucket = self._by_material[job.material] = {}
+        bucket[job.id] = job
+        bucket = self._by_priority.get(job.priority)
+        if bucket is None:
+            bucket = self._by_priority[job.priority] = {}
+        bucket[job.id] = job
+        if job.tag is not None:
+            self._by_tag.setdefault(job.tag, {})[job.id] = job
+
+    def remove(self, job: Job) -> None:
+        for index, key in ((self._by_material, job.material), (self._by_priority, job.priority), (self._by_tag, job.tag)):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(job.id, None)
+                if not bucket:
+                    del index[key]
+
+    def materials(self) -> set[str]:
+        """Materials of the indexed jobs"""
+        return set(self._by_material)
+
+    def find(self, material: Optional[str] = None, priority: Optional[int] = None,
+             min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[Job]:
+        """
+        Jobs matching every given filter, in insertion order per bucket
+
+        min_priority matches priority values >= min_priority (the given urgency and less urgent)
+        """
+        candidates: list[list[dict[str, Job]]] = []
+        if material is not None:
+            candidates.append([self._by_material.get(material, {})])
+        if priority is not None:
+            candidates.append([self._by_priority.get(priority, {})])
+        if min_priority is not None:
+            candidates.append([bucket for p, bucket in self._by_priority.items() if p >= min_priority])
+        if tag is not None:
+            candidates.append([self._by_tag.get(tag, {})])
+        if not candidates:
+            return [job for bucket in self._by_material.values() for job in bucket.values()]
+
+        smallest = min(candidates, key=lambda buckets: sum(map(len, buckets)))
+        return [
+            job for bucket in smallest for job in bucket.values()
+            if (material is None or job.material == material)
+            and (priority is None or job.priority == priority)
+            and (min_priority is None or job.priority >= min_priority)
+            and (tag is None or job.tag == tag)
+        ]
+
+
+class ThreadSafePriorityQueue:
+    """
+    Priority queue for managing printing jobs
+
+    Despite the name the queue is bound to the event loop of the simulator: other threads
+    go through Simulator.add_jobs_threadsafe and other processes through the queue service
+    (queue_service.py)
+
+    Jobs are kept in one IndexedHeap per material, ordered by (priority, FIFO counter)
+    with a counter shared by all heaps. A printer asks for the best job among the materials it
+    can print, which costs one peek per material plus O(log n) for the pop, so matching
+    never scans the backlog. Idle printers wait on a future registered for each of their
+    materials and a put wakes a single printer able to run the job.
+
+    Queued jobs are also kept in a JobIndex for predicate queries and bulk cancellation.
+    Since the heaps know the position of each job, cancelling and reprioritizing work in
+    place in O(log n) and leave no tombstones behind. Job ids must be unique among active jobs.
+
+    Records of finished jobs are kept in memory, bounded by max_records (count) and/or
+    max_record_age (seconds since the job ended) when a spill callback is given. Records
+    past the limits are handed to spill oldest first; a count overflow spills an extra 10%
+    of the window so the callback runs in batches
+    """
+    def __init__(self, instrumentation: Optional[Instrumentation] = None, max_records: Optional[int] = None,
+                 max_record_age: Optional[float] = None, spill: Optional[Callable[[list[JobRecord]], None]] = None):
+        self._heaps: dict[str, IndexedHeap] = {}
+        self._index = JobIndex()
+        self._waiters: dict[Optional[str], deque[tuple[float, asyncio.Future]]] = {}  #material (None = any) -> idle printers
+        self.instrumentation = instrumentation or Instrumentation()
         self._counter = 0
+        self._version = 0   #Bumped on every change of the queued/running jobs
         self._jobs: dict[str,Job] = {}
-        self._job_records: list[JobRecord] = []     #Jobs terminated
+        self._job_records: deque[JobRecord] = deque()     #Jobs terminated, oldest first
+        self._record_columns = RecordColumns()    #Same records as numeric columns, for stats
+        self.max_records = max_records
+        self.max_record_age = max_record_age
+        self._spill = spill
+        self._spilled = 0
+        self._status_counts = {status: 0 for status in JobStatus}  #Live counters, updated on each transition
     
     async def put(self, job: Job) -> None:
         """Add a job to the queue"""
+        start = time.perf_counter() if self.instrumentation.enabled else None
+        if job.id in self._jobs:
+            raise ValueError(f"Job {job.id} is already active")
         self._counter +=1
         prioritized = PrioritizedJob(
             priority=job.priority,
             counter=self._counter,
             job=job
         )
+        job.queued_at = clock()
         self._jobs[job.id] = job
-        await self._queue.put(prioritized)
-    
-    async def get(self) -> Job:
-        """Get the highest priority job from the queue"""
+        self._status_counts[JobStatus.QUEUE] += 1
+        self._index.add(job)
+        heap = self._heaps.get(job.material)
+        if heap is None:
+            heap = self._heaps[job.material] = IndexedHeap()
+        heap.push(prioritized)
+        self._version += 1
+        self._wake(job.material)
+        if start is not None:
+            self.instrumentation.record("enqueue", time.perf_counter() - start)
+
+    async def put_many(self, jobs: list[Job]) -> None:
+        """
+        Add a batch of jobs in one pass
+
+        Jobs are validated and given FIFO counters in input order, and bucketed by (material,
+        priority) in the same pass. Concatenating the buckets of a material in priority order
+        gives a list sorted by (priority, counter), which is already a valid heap, so an empty
+        heap is built in linear time without a single comparison. A heap that receives at least
+        as many jobs as it holds is extended and heapified (linear), smaller batches are pushed.
+        Each waiting printer is woken at most once for the whole batch, also when it waits for
+        several of its materials (see _wake)
+        """
+        start = time.perf_counter() if self.instrumentation.enabled else None
+        queued = JobStatus.QUEUE
+        seen = set()
+        for job in jobs:
+            if job.status is not queued:
+                raise ValueError(f"Job {job.id} is {job.status.value}, only new jobs can be queued")
+            if job.id in self._jobs or job.id in seen:
+                raise ValueError(f"Job {job.id} is already active")
+            seen.add(job.id)
+
+        buckets: dict[tuple[str, int], list[PrioritizedJob]] = {}
+        counter = self._counter
+        jobs_by_id = self._jobs
+        index = self._index
+        for job in jobs:
+            counter += 1
+            job.queued_at = clock() # distinct per job, printers schedule from it and completions keep FIFO order
+            jobs_by_id[job.id] = job
+            index.add(job)
+            key = (job.material, job.priority)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = []
+            bucket.append(PrioritizedJob(job.priority, counter, job))
+        self._counter = counter
+        self._status_counts[JobStatus.QUEUE] += len(jobs)
+
+        batches: dict[str, list[PrioritizedJob]] = {}
+        for material, priority in sorted(buckets): # one entry per distinct (material, priority)
+            batches.setdefault(material, []).extend(buckets[(material, priority)])
+        for material, batch in batches.items():
+            heap = self._heaps.get(material)
+            if heap is None:
+                heap = self._heaps[material] = IndexedHeap()
+            heap.extend(batch, presorted=True)
+        self._version += 1
+        for material, batch in batches.items():
+            for _ in range(len(batch)):
+                if not self._wake(material):
+                    break
+        if start is not None and jobs:
+            self.instrumentation.record("enqueue", time.perf_counter() - start, count=len(jobs))
+
+    def _wake(self, material: str) -> bool:
+        """
+        Wake the longest waiting printer that can print the material, False if none is waiting
+
+        A printer waiting for several materials sits in the deque of each until it resumes,
+        so entries already woken through another material (or cancelled by a timeout) are
+        dropped here instead of being woken twice
+        """
+        candidates = []
+        for waiters in (self._waiters.get(material), self._waiters.get(None)):
+            while waiters and waiters[0][1].done():
+                waiters.popleft()
+            if waiters:
+                candidates.append(waiters)
+        if not candidates:
+            return False
+        _, future = min(candidates, key=lambda w: w[0][0]).popleft()
+        future.set_result(None)
+        return True
+
+    def _pop_best(self, materials: Optional[frozenset[str]]) -> Optional[Job]:
+        """Pop the best queued job among the materials (None = any)"""
+        best_heap = best = None
+        for material in (self._heaps if materials is None else materials):
+            heap = self._heaps.get(material)
+            top = heap.peek() if heap is not None else None
+            if top is not None and (best is None or top < best):
+                best_heap, best = heap, top
+        if best_heap is None:
+            return None
+        job = best_heap.pop().job
+        self._index.remove(job)
+        self._version += 1
+        return job
+
+    async def get(self, materials: Optional[frozenset[str]] = None, stop: Optional[Callable[[], bool]] = None) -> Optional[Job]:
+        """
+        Get the highest priority job among the given materials (None = any material)
+
+        When stop() turns true (a draining printer) the call returns None instead of a job,
+        passing on a wakeup it may have received to the other waiting printers
+        """
         while True:
-            prioritized = await self._queue.get()
-            job = prioritized.job
-            if job.status == JobStatus.QUEUE:
+            if stop is not None and stop():
+                for material in (self._heaps if materials is None else materials):
+                    if self._heaps.get(material):
+                        self._wake(material)
+                return None
+            start = time.perf_counter() if self.instrumentation.enabled else None
+            job = self._pop_best(materials)
+            if job is not None:
+                self._status_counts[JobStatus.QUEUE] -= 1
+                self._status_counts[JobStatus.RUNNING] += 1
+                if start is not None:
+                    self.instrumentation.record("dequeue", time.perf_counter() - start)
                 return job
+            waiter = (clock(), asyncio.get_running_loop().create_future())
+            keys = (None,) if materials is None else materials
+            for material in keys:
+                self._waiters.setdefault(material, deque()).append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                #woken through one material or cancelled, the other registrations are stale
+                for material in keys:
+                    waiters = self._waiters[material]
+                    if waiter in waiters:
+                        waiters.remove(waiter)
                                 
-    def get_job_records(self) -> list[Job]:
-        """Get completed jobs"""
-        return self._job_records.copy()
+    def queued_materials(self) -> set[str]:
+        """Materials of the queued jobs"""
+        return self._index.materials()
+
+    @property
+    def version(self) -> int:
+        """Changes whenever a job is queued, dequeued, reprioritized, cancelled or completed"""
+        return self._version
+
+    def queued_entries(self) -> list[PrioritizedJob]:
+        """Heap entries of every queued job, in no particular order"""
+        return [entry for heap in self._heaps.values() for entry in heap]
+
+    def queued_heaps(self, materials: Optional[set[str]] = None) -> list[list[PrioritizedJob]]:
+        """
+        The per-material heap arrays of the queued jobs (of the given materials), valid
+        until the next change (see version)
+        """
+        return [heap.entries for material, heap in self._heaps.items() if materials is None or material in materials]
+
+    def is_queued(self, job: Job) -> bool:
+        """Whether the job waits in its heap (not yet handed to a printer)"""
+        heap = self._heaps.get(job.material)
+        return heap is not None and job.id in heap
+
+    def get_job_records(self) -> list[JobRecord]:
+        """Get the completed/cancelled records still in memory"""
+        return list(self._job_records)
+
+    @property
+    def record_columns(self) -> RecordColumns:
+        """Columns of the records still in memory"""
+        return self._record_columns
+
+    @property
+    def spilled_count(self) -> int:
+        """Number of records handed to the spill callback"""
+        return self._spilled
+
+    def _add_record(self, record: JobRecord) -> None:
+        records = self._job_records
+        records.append(record)
+        self._record_columns.append(record)
+        if self._spill is None:
+            return
+        batch = []
+        if self.max_records is not None and len(records) > self.max_records:
+            excess = len(records) - self.max_records + self.max_records // 10
+            batch = [records.popleft() for _ in range(min(excess, len(records)))]
+        if self.max_record_age is not None:
+            cutoff = clock() - self.max_record_age
+            while records and records[0].end_time < cutoff:
+                batch.append(records.popleft())
+        if batch:
+            self._record_columns.drop_left(len(batch))
+            self._spill(batch)
+            self._spilled += len(batch)
     
     def get_active_jobs(self) -> dict[str,Job]:
         """Get queue jobs"""
         return self._jobs.copy()
+
+    def get_active_job(self, job_id: str) -> Optional[Job]:
+        """A queued or running job, None otherwise"""
+        return self._jobs.get(job_id)
+
+    def get_status_counts(self) -> dict[str, int]:
+        """Number of jobs per status, read in constant time"""
+        return {status.value: count for status, count in self._status_counts.items()}
     
     def cancel_job(self, job_id: str) -> bool:
         """Cancel a job and update data objects
@@ -52,27 +344,104 @@ class ThreadSafePriorityQueue:
             job = self._jobs[job_id]
             if job.status == JobStatus.RUNNING:
                 return False
-            if job.status == JobStatus.QUEUE:
-                job.cancel()
-                record = JobRecord(
-                    job_id = job.id,
-                    start_time = 0,
-                    end_time = job.finished_at ,
-                    created_time=job.created_at,
-                    duration = 0.00,
-                    status = job.status.value,
-                    priority = job.priority
-                )
-                self._job_records.append(record)
-                del self._jobs[job_id]
+            #a job handed to a printer is out of the heap even before its status changes
+            if job.status == JobStatus.QUEUE and self._heaps[job.material].remove(job.id) is not None:
+                self._cancel_queued(job)
                 return True
         return False
+
+    def reprioritize(self, job_id: str, priority: int) -> Optional[Job]:
+        """
+        Change the priority of a queued job in place, O(log n)
+
+        The job keeps its FIFO position among jobs of the same priority. Returns the job,
+        or None if it is not queued (unknown, running or finished)
+        """
+        if priority < 0:
+            raise ValueError("Priority must be positive")
+        job = self._jobs.get(job_id)
+        if job is None or job.status != JobStatus.QUEUE or job_id not in self._heaps[job.material]:
+            return None
+        self._index.remove(job)
+        job.priority = priority
+        self._heaps[job.material].update_priority(job_id, priority)
+        self._index.add(job)
+        self._version += 1
+        return job
+
+    def find_queued(self, material: Optional[str] = None, priority: Optional[int] = None,
+                    min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[Job]:
+        """Queued jobs matching every given filter (see JobIndex.find)"""
+        return self._index.find(material=material, priority=priority, min_priority=min_priority, tag=tag)
+
+    def cancel_many(self, material: Optional[str] = None, priority: Optional[int] = None,
+                    min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[Job]:
+        """Cancel every queued job matching the filters, in time proportional to the matched set"""
+        jobs = self.find_queued(material=material, priority=priority, min_priority=min_priority, tag=tag)
+        by_material: dict[str, list[str]] = {}
+        for job in jobs:
+            by_material.setdefault(job.material, []).append(job.id)
+            self._cancel_queued(job)
+        for material, job_ids in by_material.items():
+            self._heaps[material].remove_many(job_ids)
+        return jobs
+
+    def _cancel_queued(self, job: Job) -> None:
+        self._version += 1
+        job.cancel()
+        self._status_counts[JobStatus.QUEUE] -= 1
+        self._index.remove(job)
+        self.record_cancelled(job)
+        del self._jobs[job.id]
+
+    def requeue(self, job: Job) -> None:
+        """
+        Put a preempted running job back in the queue. It goes ahead of every job of its
+        priority (requeued jobs in the order they were suspended) so it resumes first
+        """
+        job.status = JobStatus.QUEUE
+        job.queued_at = clock()
+        self._status_counts[JobStatus.RUNNING] -= 1
+        self._status_counts[JobStatus.QUEUE] += 1
+        self._index.add(job)
+        heap = self._heaps.get(job.material)
+        if heap is None:
+            heap = self._heaps[job.material] = IndexedHeap()
+        heap.push(PrioritizedJob(job.priority, self._counter - 2**62, job)) # below every put counter
+        self._version += 1
+        self._wake(job.material)
+
+    def cancel_running(self, job: Job) -> None:
+        """Cancel a job that was interrupted while running (simulator shutdown)"""
+        self._version += 1
+        job.cancel()
+        self._status_counts[JobStatus.RUNNING] -= 1
+        self.record_cancelled(job)
+        self._jobs.pop(job.id, None)
+
+    def record_cancelled(self, job: Job) -> None:
+        """Create the record of a cancelled job"""
+        self._status_counts[JobStatus.CANCELLED] += 1
+        record = JobRecord(
+            job_id = job.id,
+            start_time = 0,
+            end_time = job.finished_at ,
+            created_time=job.created_at,
+            duration = 0.00,
+            status = job.status.value,
+            priority = job.priority,
+            material = job.material,
+            preemptions = job.preemptions
+        )
+        self._add_record(record)
     
     def mark_completed(self,job: Job) -> None:
         """
         Complete a job and create a lightweight record to save memory
         """
-        job.completed_processing()
+        self._version += 1
+        if job.status != JobStatus.COMPLETED:
+            job.completed_processing()
         record = JobRecord(
             job_id = job.id,
             start_time = job.started_at,
@@ -80,9 +449,13 @@ class ThreadSafePriorityQueue:
             created_time=job.created_at,
             duration = job.finished_at - job.started_at,
             status = job.status.value,
-            priority = job.priority
+            priority = job.priority,
+            material = job.material,
+            preemptions = job.preemptions
         )
-        self._job_records.append(record)
+        self._add_record(record)
+        self._status_counts[JobStatus.RUNNING] -= 1
+        self._status_counts[JobStatus.COMPLETED] += 1
         del self._jobs[job.id]
 
     
@@ -0,0 +1,461 @@
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import signal
+import socket
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Optional
+from models import Job, Printer
+from admission import AdmissionControl, Overloaded, POLICIES
+from simulator import PREEMPTION_MODES, Simulator
+from autoscaler import Autoscaler, parse_bounds
+from json_manager import load_fleet_from_json
+
+#Frames are a 4 byte big-endian length followed by a JSON body. A request holds a batch of
+#calls {"calls": [[id, method, kwargs], ...]}, the ids chosen by the client. Each call is
+#answered as soon as it finishes, replies finished together share a response frame
+#{"results": [{"id": id, "result": ...} | {"id": id, "error": message, "type": exception name}, ...]}
+HEADER = struct.Struct(">I")
+MAX_BATCH = 256 # calls per request frame
+
+
+class QueueServiceError(Exception):
+    """The queue service failed or could not be reached"""
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "material": job.material,
+        "est_time": job.est_time,
+        "priority": job.priority,
+        "status": job.status.value,
+        "tag": job.tag,
+        "preemptions": job.preemptions
+    }
+
+
+def printer_to_dict(printer: Printer) -> dict:
+    return {
+        "id": printer.id,
+        "printer_class": printer.printer_class,
+        "speed": printer.speed,
+        "materials": sorted(printer.materials) if printer.materials is not None else None,
+        "busy": printer.is_busy,
+        "current_job": printer.current_job.id if printer.current_job else None,
+        "state": printer.state
+    }
+
+
+class LocalQueue:
+    """
+    Queue operations of the API over a Simulator in this process
+
+    Every method is a coroutine taking and returning plain JSON values, so the same calls
+    are served in-process (single API worker) or by the queue service to RemoteQueue clients
+    """
+    METHODS = ("add_job", "add_jobs", "list_jobs", "cancel_job", "cancel_jobs", "reprioritize", "get_eta",
+               "global_stats", "health", "printers", "add_printers", "drain_printer", "list_runs", "run_stats",
+               "metrics", "set_metrics", "profile", "version")
+
+    def __init__(self, sim: Simulator):
+        self.sim = sim
+
+    async def add_job(self, job: dict, client: Optional[str] = None) -> dict:
+        job = Job(**job)
+        await self.sim.add_job(job, client=client)
+        return job_to_dict(job)
+
+    async def add_jobs(self, jobs: list[dict], client: Optional[str] = None) -> list[dict]:
+        """
+        Queue job dicts (Job fields): ValueError if one is invalid, Overloaded if admission
+        control refuses the batch. Returns the admitted jobs
+        """
+        jobs = [Job(**job) for job in jobs]
+        return [job_to_dict(job) for job in await self.sim.add_jobs(jobs, client=client)]
+
+    async def list_jobs(self, material: Optional[str] = None, priority: Optional[int] = None,
+                        min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[dict]:
+        if material is None and priority is None and min_priority is None and tag is None:
+            jobs = self.sim.get_active_jobs()
+        else:
+            jobs = self.sim.find_jobs(material=material, priority=priority, min_priority=min_priority, tag=tag)
+        return [job_to_dict(job) for job in jobs]
+
+    async def cancel_job(self, job_id: str) -> bool:
+        return self.sim.cancel_job(job_id)
+
+    async def cancel_jobs(self, material: Optional[str] = None, priority: Optional[int] = None,
+                          min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[str]:
+        return self.sim.cancel_jobs(material=material, priority=priority, min_priority=min_priority, tag=tag)
+
+    async def reprioritize(self, job_id: str, priority: int) -> Optional[dict]:
+        job = self.sim.reprioritize(job_id, priority)
+        return job_to_dict(job) if job is not None else None
+
+    async def get_eta(self, job_id: str) -> Optional[dict]:
+        return self.sim.get_eta(job_id)
+
+    async def global_stats(self, window: Optional[float] = None) -> dict:
+        return self.sim.get_global_stats(window=window)
+
+    async def health(self) -> dict:
+        return {"printers": self.sim.num_printers, **self.sim.get_queue_stats()}
+
+    async def printers(self) -> list[dict]:
+        return [printer_to_dict(printer) for printer in self.sim.printers]
+
+    async def add_printers(self, spec: dict) -> list[dict]:
+        return [printer_to_dict(printer) for printer in self.sim.add_printers(spec)]
+
+    async def drain_printer(self, printer_id: int) -> Optional[dict]:
+        """The draining printer, None if it is not in the fleet, ValueError if it cannot leave"""
+        printer = self.sim.drain_printer(printer_id)
+        return printer_to_dict(printer) if printer is not None else None
+
+    async def list_runs(self, limit: int = 50, offset: int = 0) -> list[dict]:
+        return self.sim.database.list_runs(limit=limit, offset=offset)
+
+    async def run_stats(self, run_id: int) -> Optional[dict]:
+        return self.sim.database.get_run_stats(run_id)
+
+    async def metrics(self) -> dict:
+        return self.sim.instrumentation.snapshot()
+
+    async def set_metrics(self, enabled: bool, reset: bool = False) -> dict:
+        self.sim.instrumentation.enabled = enabled
+        if reset:
+            self.sim.instrumentation.reset()
+        return self.sim.instrumentation.snapshot()
+
+    async def profile(self, kind: str, seconds: float) -> str:
+        return str(await self.sim.instrumentation.profile_window(kind, seconds))
+
+    async def version(self) -> list[int]:
+        """Simulator.version, API workers cache their responses on it"""
+        return list(self.sim.version)
+
+    async def close(self) -> None:
+        pass
+
+
+def _error(reply: dict) -> Exception:
+    """Exception of an error reply, validation, admission and state errors keep their type"""
+    if reply["type"] == "Overloaded":
+        return Overloaded(reply["error"], retry_after=reply["retry_after"])
+    kind = {"ValueError": ValueError, "RuntimeError": RuntimeError}.get(reply["type"], QueueServiceError)
+    return kind(reply["error"])
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return json.loads(await reader.readexactly(size))
+
+
+def _encode_frame(payload: Any) -> bytes:
+    body = json.dumps(payload).encode()
+    return HEADER.pack(len(body)) + body
+
+
+class RemoteQueue:
+    """
+    LocalQueue calls forwarded to the queue service over its Unix socket
+
+    Calls made while a frame is being written are held and sent together as the next batch
+    (at most MAX_BATCH per frame), so concurrent API requests share frames instead of each
+    paying one. Sending does not wait for replies: a receiver task resolves each call by its
+    id when the service answers it, so a slow call does not hold back the ones after it. One
+    connection per API worker, opened on first use and reopened after a failure; the calls
+    waiting on a connection that fails get a QueueServiceError
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: list[tuple[str, dict, asyncio.Future]] = []
+        self._waiting: dict[int, asyncio.Future] = {} # call id -> caller, sent and not answered yet
+        self._ids = itertools.count()
+        self._sender: Optional[asyncio.Task] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self.calls = 0
+        self.batches = 0
+
+    def __getattr__(self, name: str):
+        if name not in LocalQueue.METHODS:
+            raise AttributeError(name)
+        async def method(**kwargs):
+            return await self.call(name, **kwargs)
+        return method
+
+    async def connect(self) -> None:
+        if self._writer is None:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                raise QueueServiceError(f"Queue service unavailable at {self.path}: {e}") from e
+            self._receiver = asyncio.create_task(self._receive(self._reader))
+
+    async def call(self, method: str, **kwargs) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((method, kwargs, future))
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send())
+        return await future
+
+    async def _send(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending[:MAX_BATCH], self._pending[MAX_BATCH:]
+            calls = []
+            for method, kwargs, future in batch:
+                call_id = next(self._ids)
+                self._waiting[call_id] = future
+                calls.append([call_id, method, kwargs])
+            try:
+                await self.connect()
+                self._writer.write(_encode_frame({"calls": calls}))
+                await self._writer.drain()
+            except (OSError, QueueServiceError) as e:
+                await self._disconnect(e)
+                continue
+            self.calls += len(batch)
+            self.batches += 1
+
+    async def _receive(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                for reply in (await _read_frame(reader))["results"]:
+                    future = self._waiting.pop(reply["id"], None)
+                    if future is None or future.done(): # the caller went away
+                        continue
+                    if "error" in reply:
+                        future.set_exception(_error(reply))
+                    else:
+                        future.set_result(reply["result"])
+        except (OSError, asyncio.IncompleteReadError) as e:
+            await self._disconnect(e)
+
+    async def _disconnect(self, error: Exception) -> None:
+        """Drop the connection, the calls waiting on it fail with the error"""
+        waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            if not future.done():
+                future.set_exception(QueueServiceError(f"Queue service call failed: {error}"))
+        await self.close()
+
+    async def close(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        receiver, self._receiver = self._receiver, None
+        if receiver is not None and receiver is not asyncio.current_task():
+            receiver.cancel()
+        waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            if not future.done():
+                future.set_exception(QueueServiceError("Queue service connection closed"))
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class QueueClient:
+    """
+    Blocking queue service client for scripts and producer threads, safe to share
+    between threads. call_many sends a list of (method, kwargs) in one frame and waits
+    for all of their replies
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._socket: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def call(self, method: str, **kwargs) -> Any:
+        return self.call_many([(method, kwargs)])[0]
+
+    def call_many(self, calls: list[tuple[str, dict]]) -> list[Any]:
+        """Results in call order, raises the error of the first failed call after all ran"""
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._socket.connect(self.path)
+                    self._file = self._socket.makefile("rb")
+                self._socket.sendall(_encode_frame({"calls": [[i, method, kwargs] for i, (method, kwargs) in enumerate(calls)]}))
+                replies = {}
+                while len(replies) < len(calls): # in the order the calls finish
+                    (size,) = HEADER.unpack(self._file.read(HEADER.size))
+                    replies.update((reply["id"], reply) for reply in json.loads(self._file.read(size))["results"])
+            except (OSError, struct.error) as e:
+                self.close()
+                raise QueueServiceError(f"Queue service call failed: {e}") from e
+        results = [replies[i] for i in range(len(calls))]
+        for reply in results:
+            if "error" in reply:
+                raise _error(reply)
+        return [reply["result"] for reply in results]
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+        self._socket = self._file = None
+
+
+class QueueServer:
+    """
+    Serves the LocalQueue of a simulator on a Unix socket
+
+    Every call runs as its own task of the simulator's event loop, started in request
+    order, and is answered as soon as it finishes, so every API worker and producer sees
+    one queue and a slow call (a profile window, a blocked admission) does not hold back
+    the calls sent with or after it
+    """
+    def __init__(self, sim: Simulator, path: str):
+        self.queue = LocalQueue(sim)
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        Path(self.path).unlink(missing_ok=True) # left behind by a previous service
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logging.info("Queue service listening on %s", self.path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            Path(self.path).unlink(missing_ok=True)
+
+    async def _dispatch(self, method: str, kwargs: dict) -> dict:
+        if method not in LocalQueue.METHODS:
+            return {"error": f"Unknown method {method}", "type": "ValueError"}
+        try:
+            return {"result": await getattr(self.queue, method)(**kwargs)}
+        except Overloaded as e:
+            return {"error": str(e), "type": "Overloaded", "retry_after": e.retry_after}
+        except (ValueError, TypeError) as e:
+            return {"error": str(e), "type": "ValueError"}
+        except Exception as e:
+            logging.exception("Queue service call %s failed", method)
+            return {"error": str(e), "type": type(e).__name__}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        replies: list[dict] = []
+        ready = asyncio.Event()
+        calls: set[asyncio.Task] = set() # running, referenced until they finish
+
+        def answer(call_id: int, call: asyncio.Task) -> None:
+            calls.discard(call)
+            if not call.cancelled():
+                replies.append({"id": call_id, **call.result()})
+                ready.set()
+
+        replier = asyncio.create_task(self._reply(writer, replies, ready))
+        try:
+            while True:
+                request = await _read_frame(reader)
+                for call_id, method, kwargs in request["calls"]:
+                    call = asyncio.create_task(self._dispatch(method, kwargs))
+                    calls.add(call)
+                    call.add_done_callback(functools.partial(answer, call_id))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # client disconnected
+        finally:
+            replier.cancel()
+            writer.close()
+
+    async def _reply(self, writer: asyncio.StreamWriter, replies: list[dict], ready: asyncio.Event) -> None:
+        """Write the finished calls of a connection, those of one loop iteration in one frame"""
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                results = replies[:]
+                replies.clear()
+                writer.write(_encode_frame({"results": results}))
+                await writer.drain()
+        except ConnectionError:
+            pass # client disconnected
+
+
+async def serve(sim: Simulator, path: str, autoscaler: Optional[Autoscaler] = None) -> None:
+    """Run the simulator (and its autoscaler) with its queue service until SIGINT/SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await sim.start()
+    autoscaler_task = asyncio.create_task(autoscaler.run()) if autoscaler is not None else None
+    server = QueueServer(sim, path)
+    await server.start()
+    print(f"Queue service listening on {path}")
+    try:
+        await stop.wait()
+    finally:
+        if autoscaler_task is not None:
+            autoscaler_task.cancel()
+        await server.stop()
+        await sim.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queue service: one simulator shared by several API workers over a Unix socket",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+    Examples:
+            python src/queue_service.py --socket logs/queue.sock
+            SIMULATOR_QUEUE_SOCKET=logs/queue.sock uvicorn api:app --app-dir src --workers 4
+            """
+    )
+    parser.add_argument('--socket', type=str, default="logs/queue.sock", help='Unix socket path (default: logs/queue.sock)')
+    parser.add_argument('--printers', '-p', type=int, default=2, help='Number of printers (default: 2)')
+    parser.add_argument('--time-scale', '-t', type=float, default=0.1, help='Time scale (default: 0.1)')
+    parser.add_argument('--fleet', type=str, default=None, help='JSON file with printer specs')
+    parser.add_argument('--output-dir', type=str, default="logs", help='Run outputs (default: logs)')
+    parser.add_argument('--max-records', type=int, default=None, help='Finished records kept in memory, older ones go to SQLite')
+    parser.add_argument('--max-record-age', type=float, default=None, help='Seconds a finished record stays in memory')
+    parser.add_argument('--instrument', action='store_true', help='Enable the hot-path timers')
+    parser.add_argument('--max-queue', type=int, default=None, help='Bound on queued and pending jobs')
+    parser.add_argument('--admission', choices=POLICIES, default="reject", help='Policy over the bound (default: reject)')
+    parser.add_argument('--admission-timeout', type=float, default=30.0, help='Seconds the block policy waits (default: 30)')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Jobs per second per client')
+    parser.add_argument('--rate-burst', type=float, default=None, help='Burst per client (default: the rate)')
+    parser.add_argument('--preemption', choices=PREEMPTION_MODES, default=None,
+                        help='Urgent jobs suspend running ones, which resume or restart (default: off)')
+    parser.add_argument('--preempt-priority', type=int, default=0, help='Priorities that preempt (default: 0)')
+    parser.add_argument('--autoscale', type=str, default=None, help='MIN:MAX printers, scaled on --target-wait/--target-depth')
+    parser.add_argument('--target-wait', type=float, default=None, help='Predicted wait of the last queued job (simulated seconds)')
+    parser.add_argument('--target-depth', type=float, default=None, help='Queued jobs per printer')
+    args = parser.parse_args()
+
+    sim = Simulator(
+        num_printers=args.printers,
+        time_scale=args.time_scale,
+        output_dir=args.output_dir,
+        instrument=args.instrument,
+        fleet=load_fleet_from_json(args.fleet) if args.fleet else None,
+        max_records=args.max_records,
+        max_record_age=args.max_record_age,
+        admission=AdmissionControl(max_queue=args.max_queue, policy=args.admission, rate=args.rate_limit,
+                                   burst=args.rate_burst, block_timeout=args.admission_timeout),
+        preemption=args.preemption,
+        preempt_priority=args.preempt_priority
+    )
+    autoscaler = None
+    if args.autoscale:
+        low, high = parse_bounds(args.autoscale)
+        autoscaler = Autoscaler(sim, min_printers=low, max_printers=high, target_wait=args.target_wait,
+                                target_depth=args.target_depth)
+    asyncio.run(serve(sim, args.socket, autoscaler))
+
+
+if __name__ == "__main__":
+    main()
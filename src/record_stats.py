@@ -0,0 +1,162 @@
+from array import array
+from typing import Optional
+import numpy as np
+from models import JobRecord
+from archive import STATUS_CODES
+
+PERCENTILES = (50, 90, 95, 99)
+THROUGHPUT_WINDOWS = 20 # windows over the run when no window length is given
+MAX_WINDOWS = 10000
+COMPLETED = STATUS_CODES["completed"]
+CANCELLED = STATUS_CODES["cancelled"]
+
+
+class RecordColumns:
+    """
+    Columnar mirror of the finished job records kept in memory
+
+    Every record appended to the queue's record window is also appended here as a few
+    numbers (material as a code of the materials list), so stats are computed with numpy
+    over contiguous arrays instead of walking JobRecord objects. Dropping the oldest rows
+    moves a head offset, the arrays are compacted once half of them is dead
+    """
+    def __init__(self):
+        self.materials: list[str] = []
+        self._material_codes: dict[str, int] = {}
+        self._head = 0
+        self._columns = {
+            "priority": array("q"),
+            "material": array("I"),
+            "status": array("B"),
+            "created": array("d"),
+            "start": array("d"),  # NaN for jobs that never started
+            "end": array("d"),
+        }
+
+    def __len__(self) -> int:
+        return len(self._columns["end"]) - self._head
+
+    def material_code(self, material: str) -> int:
+        code = self._material_codes.get(material)
+        if code is None:
+            code = self._material_codes[material] = len(self.materials)
+            self.materials.append(material)
+        return code
+
+    def append(self, record: JobRecord) -> None:
+        columns = self._columns
+        columns["priority"].append(record.priority)
+        columns["material"].append(self.material_code(record.material))
+        columns["status"].append(STATUS_CODES[record.status])
+        columns["created"].append(record.created_time)
+        columns["start"].append(record.start_time if record.start_time > 0 else np.nan)
+        columns["end"].append(record.end_time)
+
+    def drop_left(self, count: int) -> None:
+        """Forget the oldest count rows"""
+        self._head += count
+        if self._head * 2 >= len(self._columns["end"]):
+            for column in self._columns.values():
+                del column[:self._head]
+            self._head = 0
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Copies of the live rows (a view would pin the buffers and block appends)"""
+        return {
+            name: np.frombuffer(column, dtype=column.typecode)[self._head:].copy()
+            for name, column in self._columns.items()
+        }
+
+
+def _distribution(values: np.ndarray) -> dict:
+    """
+    avg, max and percentiles (linear interpolation, as np.percentile) from one sort, which
+    is several times faster than np.percentile selecting each point
+    """
+    if not values.size:
+        return {"avg": 0.0, "max": 0.0, **{f"p{p}": 0.0 for p in PERCENTILES}}
+    values = np.sort(values)
+    positions = (values.size - 1) * np.array(PERCENTILES) / 100
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, values.size - 1)
+    points = values[lower] + (values[upper] - values[lower]) * (positions - lower)
+    return {
+        "avg": float(values.mean()),
+        "max": float(values[-1]),
+        **{f"p{p}": float(v) for p, v in zip(PERCENTILES, points)}
+    }
+
+
+def _groups(key: np.ndarray, wait: np.ndarray, run: np.ndarray) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """{key value: (wait, run)} of the completed rows, grouped with one stable sort by key"""
+    if not key.size:
+        return {}
+    if key.min() >= 0 and key.max() < 2**16:
+        key = key.astype(np.uint16) # numpy radix sorts 16 bit keys
+    order = np.argsort(key, kind="stable")
+    key, wait, run = key[order], wait[order], run[order]
+    bounds = np.flatnonzero(key[1:] != key[:-1]) + 1
+    starts = [0, *bounds.tolist()]
+    ends = [*bounds.tolist(), key.size]
+    return {int(key[start]): (wait[start:end], run[start:end]) for start, end in zip(starts, ends)}
+
+
+def _by(key: np.ndarray, completed: np.ndarray, cancelled: np.ndarray, wait: np.ndarray, run: np.ndarray) -> list[tuple[int, dict]]:
+    """[(key value, stats of its rows)] in key order, wait and run are those of the completed rows"""
+    groups = _groups(key[completed], wait, run)
+    values, counts = np.unique(key[cancelled], return_counts=True)
+    cancelled_counts = dict(zip(values.tolist(), counts.tolist()))
+    empty = np.zeros(0)
+    return [
+        (value, {
+            "completed": int(groups.get(value, (empty,))[0].size),
+            "cancelled": cancelled_counts.get(value, 0),
+            "wait_time": _distribution(groups.get(value, (empty, empty))[0]),
+            "run_time": _distribution(groups.get(value, (empty, empty))[1])
+        })
+        for value in sorted(set(groups) | set(cancelled_counts))
+    ]
+
+
+def breakdown(columns: dict[str, np.ndarray], materials: list[str], origin: float = 0.0,
+              window: Optional[float] = None) -> dict:
+    """
+    Wait/run time distributions (avg, max, p50/p90/p95/p99 of completed jobs) overall, per
+    priority and per material, and completions per time window
+
+    columns are the arrays of RecordColumns, materials its material list and origin the
+    start of the run. Windows are window seconds long from the start, THROUGHPUT_WINDOWS
+    equal windows over the run by default
+    """
+    status = columns["status"]
+    completed = status == COMPLETED
+    cancelled = status == CANCELLED
+    start = columns["start"][completed]
+    end = columns["end"][completed]
+    wait = start - columns["created"][completed]
+    run = end - start
+    stats = {"overall": {
+        "completed": int(wait.size),
+        "cancelled": int(np.count_nonzero(cancelled)),
+        "wait_time": _distribution(wait),
+        "run_time": _distribution(run)
+    }}
+    stats["by_priority"] = [{"priority": p, **group} for p, group in _by(columns["priority"], completed, cancelled, wait, run)]
+    stats["by_material"] = [{"material": materials[m], **group} for m, group in _by(columns["material"], completed, cancelled, wait, run)]
+
+    duration = float(columns["end"].max() - origin) if status.size else 0.0
+    if window is None:
+        window = duration / THROUGHPUT_WINDOWS if duration > 0 else 1.0
+    elif window <= 0:
+        raise ValueError("Throughput window must be positive")
+    elif duration / window > MAX_WINDOWS:
+        raise ValueError(f"Throughput window too small, the run would need more than {MAX_WINDOWS} windows")
+    #truncating the scaled non-negative offsets floors them, several times faster than //
+    bins = np.maximum((end - origin) * (1.0 / window), 0).astype(np.int64)
+    counts = np.bincount(bins) if bins.size else np.zeros(0, dtype=np.int64)
+    stats["window"] = window
+    stats["throughput"] = [
+        {"start": i * window, "end": (i + 1) * window, "completed": int(count), "throughput": float(count) / window}
+        for i, count in enumerate(counts)
+    ]
+    return stats
@@ -0,0 +1,54 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from models import clock
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON of plain dicts and lists, no response model is built per object"""
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header (a list of tags or *) against an ETag, weak comparison"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+class ResponseCache:
+    """
+    Serialized JSON bodies of read endpoints
+
+    Entries are keyed by endpoint and query parameters and served while the state version
+    they were built at is current and, with a max_age, for at most max_age seconds (bodies
+    that also depend on the clock, like throughput). The ETag is a digest of the body, so a
+    rebuilt identical body keeps its ETag. The max_entries most recently used entries are kept
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[Hashable, float, bytes, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: Hashable, version: Hashable, max_age: Optional[float] = None) -> Optional[tuple[bytes, str]]:
+        """(body, etag) built at version, None if there is none or it is too old"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version or (max_age is not None and clock() - entry[1] > max_age):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def store(self, key: Hashable, version: Hashable, payload: Any) -> tuple[bytes, str]:
+        """Serialize payload as the body of key at version, returns (body, etag)"""
+        body = dumps(payload)
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self._entries[key] = (version, clock(), body, etag)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return body, etag
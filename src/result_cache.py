@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+MANIFEST = "entry.json"
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def jobs_digest(jobs: list[dict]) -> str:
+    """sha256 of job dicts, independent of key order"""
+    return hashlib.sha256(json.dumps(jobs, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(workload_digest: str, config: dict) -> str:
+    """Key of a run: the workload contents plus the configuration (which includes the engine and its version)"""
+    payload = json.dumps({"workload": workload_digest, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of simulation results
+
+    Each entry is a directory named after its key holding the run's output files and a
+    manifest with the result (stats) and the config it was produced with. Entries are
+    written to a temporary directory and renamed into place, so a reader never sees a
+    partial entry. Reading an entry touches its manifest; when the cache grows past
+    max_bytes the least recently used entries are removed
+    """
+    def __init__(self, directory: str = "logs/cache", max_bytes: int = 500 * 2**20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / key
+
+    def get(self, key: str) -> Optional[dict]:
+        """Manifest of an entry (result, config, files, size), None on a miss"""
+        manifest = self._entry(key) / MANIFEST
+        try:
+            with open(manifest, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(manifest) # mark as recently used
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def restore(self, key: str, output_dir: str) -> Optional[dict]:
+        """Copy the cached output files of an entry to output_dir, returns its manifest (None on a miss)"""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for name in entry["files"]:
+                shutil.copy2(self._entry(key) / name, output_dir / name)
+        except FileNotFoundError: # evicted meanwhile
+            return None
+        return entry
+
+    def put(self, key: str, result: dict, config: dict, files: list[Path] = ()) -> bool:
+        """Store a result with copies of its output files, False when it would not fit in the cache"""
+        entry = {
+            "key": key,
+            "config": config,
+            "result": result,
+            "files": [Path(f).name for f in files],
+            "size": 0,
+            "created_at": time.time()
+        }
+        #the manifest counts too, results without files still take space
+        entry["size"] = sum(Path(f).stat().st_size for f in files) + len(json.dumps(entry))
+        if entry["size"] > self.max_bytes:
+            return False
+        tmp = self.directory / f".tmp-{uuid.uuid4().hex}"
+        tmp.mkdir()
+        try:
+            for f in files:
+                shutil.copy2(f, tmp / Path(f).name)
+            with open(tmp / MANIFEST, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            try:
+                tmp.rename(self._entry(key))
+            except OSError: # another run stored the same key first
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+        return True
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        """(last use, size, path) of every entry"""
+        entries = []
+        for path in self.directory.iterdir():
+            manifest = path / MANIFEST
+            if path.name.startswith(".") or not manifest.is_file():
+                continue
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    size = json.load(f)["size"]
+                entries.append((manifest.stat().st_mtime, size, path))
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                continue
+        return entries
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in max_bytes, returns how many"""
+        entries = sorted(self.entries(), key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+from result_cache import ResultCache, cache_key, jobs_digest
+
+ENGINES = ("virtual", "realtime")
+
+
+class ServiceBusy(Exception):
+    """Raised when the submission queue of the simulation service is full"""
+
+
+def _cache_config(request: dict) -> dict:
+    """The part of a request that determines its result, with the engine version"""
+    engine = request.get("engine", "virtual")
+    if engine == "virtual":
+        from planner import ENGINE_VERSION
+        fields = ("num_printers", "policy")
+    else:
+        from simulator import ENGINE_VERSION
+        fields = ("num_printers", "fleet", "time_scale", "timeout")
+    config = {"engine": engine, "engine_version": ENGINE_VERSION, **{f: request.get(f) for f in fields}}
+    if request.get("preemption"): # left out otherwise so results cached before preemption stay valid
+        config["preemption"] = {"mode": request["preemption"], "priority": request.get("preempt_priority", 0)}
+    return config
+
+
+def _run_virtual(jobs: list, request: dict) -> dict:
+    from planner import Workload, simulate_virtual
+    return simulate_virtual(Workload(jobs), request.get("num_printers", 2), request.get("policy", "priority"))
+
+
+async def _run_realtime(jobs: list, request: dict, output_dir: str) -> dict:
+    from simulator import Simulator
+    sim = Simulator(
+        num_printers=request.get("num_printers", 2),
+        time_scale=request.get("time_scale", 0.01),
+        output_dir=output_dir,
+        fleet=request.get("fleet"),
+        preemption=request.get("preemption"),
+        preempt_priority=request.get("preempt_priority", 0)
+    )
+    await sim.start()
+    await sim.add_jobs(jobs)
+    timed_out = not await sim.drain(timeout=request.get("timeout", 300.0))
+    await sim.stop(cancel_running=timed_out)
+    return {
+        "timed_out": timed_out,
+        "queue": sim.get_queue_stats(),
+        "run": sim.database.get_run_stats(sim.run_id),
+        **sim.final_stats
+    }
+
+
+def run_simulation(request: dict, output_dir: str) -> dict:
+    """
+    Worker entry point, runs one simulation request in the calling process
+
+    The "virtual" engine is the planner's event model (no sleeping, identical printers and a
+    scheduling policy); "realtime" runs the full Simulator with its fleet and time_scale and
+    writes its outputs to output_dir
+    """
+    from json_manager import _job_from_dict
+    jobs = [_job_from_dict(job) for job in request["jobs"]]
+    if request.get("engine", "virtual") == "virtual":
+        return _run_virtual(jobs, request)
+    return asyncio.run(_run_realtime(jobs, request, output_dir))
+
+
+class SimulationService:
+    """
+    Runs what-if simulations in a process pool, isolated from the live simulator
+
+    At most max_workers simulations run at once, up to max_pending more wait in line and
+    further submissions raise ServiceBusy. Only the last max_results finished simulations
+    are kept. Each simulation is a dict with id, status (queued, running, completed or
+    failed), timestamps, result, error and whether the result came from the cache.
+
+    With a cache, a request with the same jobs and config as an earlier run completes
+    immediately with the stored result; finished runs (except timed out ones) are stored
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, max_results: int = 100, output_dir: str = "logs",
+                 cache: Optional[ResultCache] = None):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_results = max_results
+        self.output_dir = Path(output_dir) / "simulations"
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max_workers)
+        self._ids = itertools.count(1)
+        self._simulations: OrderedDict[str, dict] = OrderedDict()
+        self._changed: dict[str, asyncio.Event] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    @property
+    def active(self) -> int:
+        """Queued plus running simulations"""
+        return len(self._tasks)
+
+    def submit(self, request: dict) -> dict:
+        """Queue a simulation request, returns its (queued) state"""
+        if request.get("engine", "virtual") not in ENGINES:
+            raise ValueError(f"Unknown engine {request.get('engine')}, expected one of {ENGINES}")
+        key = None
+        entry = None
+        if self.cache is not None:
+            config = _cache_config(request)
+            key = cache_key(jobs_digest(request["jobs"]), config)
+            entry = self.cache.get(key)
+        if entry is None and self.active >= self.max_workers + self.max_pending:
+            raise ServiceBusy(f"{self.active} simulations are already queued or running")
+        simulation_id = f"sim_{next(self._ids)}"
+        now = time.time()
+        simulation = {
+            "id": simulation_id,
+            "engine": request.get("engine", "virtual"),
+            "status": "queued",
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "cached": entry is not None
+        }
+        self._simulations[simulation_id] = simulation
+        self._changed[simulation_id] = asyncio.Event()
+        if entry is not None:
+            simulation.update(status="completed", started_at=now, finished_at=now, result=entry["result"])
+            self._evict()
+        else:
+            self._tasks[simulation_id] = asyncio.create_task(self._run(simulation, request, key))
+        return simulation
+
+    def get(self, simulation_id: str) -> Optional[dict]:
+        return self._simulations.get(simulation_id)
+
+    def list(self) -> list[dict]:
+        """Simulations without their results, most recent first"""
+        return [{**s, "result": None} for s in reversed(self._simulations.values())]
+
+    async def wait_change(self, simulation_id: str, timeout: Optional[float] = None) -> None:
+        """Wait until the state of a simulation changes (or the timeout passes)"""
+        event = self._changed.get(simulation_id)
+        if event is None:
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _update(self, simulation: dict, **fields) -> None:
+        simulation.update(fields)
+        event = self._changed[simulation["id"]]
+        event.set()
+        self._changed[simulation["id"]] = asyncio.Event() # waiters of the next change get a fresh event
+
+    async def _run(self, simulation: dict, request: dict, key: Optional[str] = None) -> None:
+        try:
+            async with self._slots:
+                if self._pool is None:
+                    #spawn: workers start clean instead of inheriting the server's threads and event loop
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                self._update(simulation, status="running", started_at=time.time())
+                output_dir = self.output_dir / simulation["id"]
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._pool, run_simulation, request, str(output_dir))
+                self._update(simulation, status="completed", finished_at=time.time(), result=result)
+                if key is not None and not result.get("timed_out"):
+                    self.cache.put(key, result, _cache_config(request))
+        except asyncio.CancelledError:
+            self._update(simulation, status="failed", finished_at=time.time(), error="cancelled")
+            raise
+        except Exception as e:
+            self._update(simulation, status="failed", finished_at=time.time(), error=str(e))
+        finally:
+            del self._tasks[simulation["id"]]
+            self._evict()
+
+    def _evict(self) -> None:
+        """Forget the oldest finished simulations beyond max_results"""
+        finished = [sid for sid, s in self._simulations.items() if s["status"] in ("completed", "failed")]
+        for simulation_id in finished[:max(0, len(finished) - self.max_results)]:
+            del self._simulations[simulation_id]
+            del self._changed[simulation_id]
+
+    async def shutdown(self) -> None:
+        """Cancel pending simulations and stop the worker processes"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
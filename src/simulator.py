@@ -1,38 +1,119 @@
 import asyncio
+import concurrent.futures
+import heapq
+import os
 import time
-from models import Job, Printer
-from queue_manager import ThreadSafePriorityQueue
+from typing import Optional
+from models import Job, JobRecord, JobStatus, Printer, build_fleet, clock
+from queue_manager import JobIndex, ThreadSafePriorityQueue
+from indexed_heap import merge_heaps
 import logging
 from pathlib import Path
 from database import JobDatabase
 from visualizer import Visualizer
 from json_manager import generate_json_report
+from archive import STATUS_CODES, write_archive
+from record_stats import breakdown
+from eta import HORIZON, Eta, Projection
+from admission import AdmissionControl, Overloaded
+import numpy as np
+from instrumentation import Instrumentation
+from event_log import setup_logging, enable_event_log, log_event
 
 log_dir = Path(__file__).parent.parent / "logs"
 log_dir.mkdir(exist_ok=True)
-logging.basicConfig(
-    filename= log_dir /'simulation.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s'
-)
+setup_logging(log_dir)
+if os.environ.get("SIMULATOR_EVENT_LOG") == "1":
+    enable_event_log(log_dir / 'events.ndjson')
+
+#Scheduled actions of the release heap
+RELEASE = 0
+CANCEL = 1
+
+#Bump when a change alters simulation results, cached results of older versions are ignored
+ENGINE_VERSION = 2
+
+#What a preempted job keeps: its progress (resume) or nothing (restart)
+PREEMPTION_MODES = ("resume", "restart")
 
 
 class Simulator:
     """
     Main 3D printing simulator 
+
+    The fleet is num_printers identical printers, or the printers described by fleet
+    specs (see models.build_fleet) with their own speed and supported materials.
+
+    With max_records and/or max_record_age only a window of finished job records is kept
+    in memory; older records are written to the job history database under this run as
+    they leave the window, and records/stats read both tiers.
+
+    admission bounds the backlog and the ingest rate of each client (see admission.py).
+
+    Printers can be added and drained while the simulator runs. A draining printer
+    finishes its current job and leaves; removed printers stay in printers with their
+    join/leave times so their utilization is computed over the time they were online
+
+    With a preemption mode, a queued job of priority <= preempt_priority that no idle printer
+    can take suspends the least urgent running job (priority > preempt_priority) on a printer
+    able to print it. The suspended job goes back to the head of its priority with the work
+    it has left (resume) or all of it (restart, the work done is counted as lost)
     """
-    def __init__(self, num_printers: int = 1, time_scale: float = 0.1):
-        self._printers = [Printer(id=i) for i in range(num_printers)]
+    def __init__(self, num_printers: int = 1, time_scale: float = 0.1, output_dir: str = "logs", instrument: bool = False,
+                 fleet: Optional[list[dict]] = None, max_records: Optional[int] = None, max_record_age: Optional[float] = None,
+                 admission: Optional[AdmissionControl] = None, preemption: Optional[str] = None,
+                 preempt_priority: int = 0):
+        if preemption is not None and preemption not in PREEMPTION_MODES:
+            raise ValueError(f"Unknown preemption mode {preemption}, expected one of {', '.join(PREEMPTION_MODES)}")
+        if preempt_priority < 0:
+            raise ValueError("Preemption priority must be positive")
+        self._printers = build_fleet(fleet) if fleet else [Printer(id=i) for i in range(num_printers)]
         self._time_scale = time_scale
         self._start_time = None
-        self._queue = ThreadSafePriorityQueue()
+        self._instrumentation = Instrumentation(enabled=instrument, output_dir=output_dir)
+        self._queue = ThreadSafePriorityQueue(
+            instrumentation=self._instrumentation,
+            max_records=max_records,
+            max_record_age=max_record_age,
+            spill=self._spill_records if max_records is not None or max_record_age is not None else None
+        )
         self._running = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._workers_tasks = []
-        self._db = JobDatabase()
+        self._output_dir = Path(output_dir)
+        self._db = JobDatabase(db_path=str(self._output_dir / "job_history.db"))
+        self._run_id = None
+        self._wall_offset = 0.0    #time.time() - clock() at start, converts timestamps for reports
+        self._timing = {"jobs": 0, "scheduled": 0.0, "error": 0.0, "abs_error": 0.0, "max_abs_error": 0.0}
+        self._releases: list[tuple[float, int, int, Job]] = []  #(offset, counter, action, job) min-heap
+        self._release_counter = 0
+        self._pending_jobs: dict[str, Job] = {}    #Jobs waiting for their arrival_time
+        self._pending_index = JobIndex()
+        self._pending_version = 0   #Bumped when jobs waiting to arrive are added, changed or cancelled
+        self._release_wakeup = asyncio.Event()
+        self._release_task = None
+        self._dispatches = 0   #Jobs started by the printers, part of the schedule cache key
+        self._projection: Optional[Projection] = None
+        self._projection_key = None
+        self._final_stats: Optional[dict] = None
+        self._output_files: list[Path] = []
+        self._saved = False   #Set once stop() saved the in-memory window, the database then has every record
+        self._admission = admission
+        self._space = asyncio.Event()   #Set when the backlog shrinks, wakes blocked add_jobs calls
+        self._fleet_version = 0   #Bumped when printers join or start draining, part of the schedule cache key
+        self._preemption = preemption
+        self._preempt_priority = preempt_priority
+        self._interrupts: dict[int, asyncio.Event] = {}   #printer id -> set to suspend its current job
+        self._preemption_counts = {"preemptions": 0, "lost_time": 0.0}
 
     @property
     def num_printers(self) -> int:
-        return len(self._printers)
+        """Printers in the fleet, draining ones included"""
+        return sum(1 for printer in self._printers if printer.left_at is None)
+
+    @property
+    def running(self) -> bool:
+        return self._running
     
     @property
     def time_scale(self) -> float:
@@ -40,140 +121,748 @@ class Simulator:
     
     @property
     def printers(self) -> list[Printer]:
+        """Every printer of the run, removed ones included (see Printer.state)"""
         return self._printers.copy()
+
+    def can_print(self, material: str) -> bool:
+        """Check if at least one printer taking jobs supports the material"""
+        return any(printer.accepts_jobs and printer.can_print(material) for printer in self._printers)
+
+    def add_printers(self, spec: dict) -> list[Printer]:
+        """
+        Add the printers of a fleet spec (see models.build_fleet) with the next free ids,
+        they take jobs at once when the simulator is running
+        """
+        printers = build_fleet([spec], start_id=len(self._printers))
+        for printer in printers:
+            self._printers.append(printer)
+            if self._running:
+                printer.joined_at = clock()
+                self._workers_tasks.append(asyncio.create_task(self.run_printer(printer=printer)))
+        self._fleet_version += 1
+        log_event("printers_added", "Added printers %s", [p.id for p in printers],
+                  printer_ids=[p.id for p in printers], printer_class=printers[0].printer_class)
+        return printers
+
+    def drain_printer(self, printer_id: int) -> Optional[Printer]:
+        """
+        Stop giving jobs to a printer, it leaves the fleet once its current job is done
+
+        Returns None if the printer is unknown or already draining/removed. Raises ValueError
+        when it is the last printer taking jobs, or the last one able to print the material
+        of a queued or pending job
+        """
+        printer = self._printers[printer_id] if 0 <= printer_id < len(self._printers) else None
+        if printer is None or not printer.accepts_jobs:
+            return None
+        others = [p for p in self._printers if p.accepts_jobs and p is not printer]
+        if not others:
+            raise ValueError("Cannot drain the last printer of the fleet")
+        waiting = self._queue.queued_materials() | self._pending_index.materials()
+        stranded = sorted(m for m in waiting if printer.can_print(m) and not any(p.can_print(m) for p in others))
+        if stranded:
+            raise ValueError(f"Printer {printer_id} is the last one printing {', '.join(stranded)} for waiting jobs")
+        printer.draining = True
+        if not self._running: # no worker to finish, it never joins
+            printer.left_at = clock()
+        self._fleet_version += 1
+        log_event("printer_draining", "Printer %s draining", printer_id, printer_id=printer_id, busy=printer.is_busy)
+        return printer
+
+    @property
+    def run_id(self) -> Optional[int]:
+        """Id of this run in the job history database, set by start()"""
+        return self._run_id
+
+    @property
+    def final_stats(self) -> Optional[dict]:
+        """Global stats taken when the run stopped, None while it is running"""
+        return self._final_stats
+
+    @property
+    def output_files(self) -> list[Path]:
+        """Report and charts written when the run stopped"""
+        return self._output_files
+
+    @property
+    def database(self) -> JobDatabase:
+        return self._db
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        """Hot-path timers and profiler, set instrumentation.enabled to collect timings"""
+        return self._instrumentation
     
+    @property
+    def admission(self) -> Optional[AdmissionControl]:
+        return self._admission
+
+    @property
+    def version(self) -> tuple[int, int, int, int]:
+        """
+        Changes whenever the active jobs, the job records, the fleet or the admission counters
+        change, a key for cached API responses
+        """
+        refused = sum(self._admission.counts.values()) if self._admission is not None else 0
+        return (self._queue.version, self._pending_version, self._fleet_version, refused)
+
+    @property
+    def preemption(self) -> Optional[str]:
+        return self._preemption
+
+    @property
+    def backlog(self) -> int:
+        """Jobs waiting for a printer or for their arrival time, what admission control bounds"""
+        return self._queue.get_status_counts()["queue"] + len(self._pending_jobs)
+
     def cancel_job(self, job_id: str) -> bool:
-        """Cancel job by ID """
+        """Cancel job by ID, including jobs that have not arrived yet"""
+        self._space.set()
+        job = self._pending_jobs.get(job_id)
+        if job is not None:
+            self._cancel_pending(job)
+            return True
         return self._queue.cancel_job(job_id=job_id)
+
+    def reprioritize(self, job_id: str, priority: int) -> Optional[Job]:
+        """
+        Change the priority of a queued job, or of a job that has not arrived yet
+
+        Returns the job, or None if it is not waiting (unknown, running or finished)
+        """
+        job = self._pending_jobs.get(job_id)
+        if job is None:
+            job = self._queue.reprioritize(job_id, priority)
+            if job is not None:
+                self._preempt()
+            return job
+        if priority < 0:
+            raise ValueError("Priority must be positive")
+        self._pending_index.remove(job)
+        job.priority = priority # used when it is queued on arrival
+        self._pending_index.add(job)
+        self._pending_version += 1
+        return job
+
+    def _cancel_pending(self, job: Job) -> None:
+        del self._pending_jobs[job.id]
+        self._pending_index.remove(job)
+        self._pending_version += 1
+        job.cancel() # the release heap drops cancelled jobs when they become due
+        self._queue.record_cancelled(job)
+
+    def find_jobs(self, material: Optional[str] = None, priority: Optional[int] = None,
+                  min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[Job]:
+        """Queued jobs and jobs waiting to arrive that match every given filter, served by secondary indexes"""
+        filters = dict(material=material, priority=priority, min_priority=min_priority, tag=tag)
+        return self._queue.find_queued(**filters) + self._pending_index.find(**filters)
+
+    def cancel_jobs(self, material: Optional[str] = None, priority: Optional[int] = None,
+                    min_priority: Optional[int] = None, tag: Optional[str] = None) -> list[str]:
+        """
+        Cancel every queued or pending job matching the filters and return their ids
+
+        min_priority matches priority values >= min_priority (the given urgency and less urgent).
+        At least one filter is required; running jobs are not cancelled
+        """
+        filters = dict(material=material, priority=priority, min_priority=min_priority, tag=tag)
+        if all(value is None for value in filters.values()):
+            raise ValueError("At least one filter is required to cancel jobs in bulk")
+        pending = self._pending_index.find(**filters)
+        for job in pending:
+            self._cancel_pending(job)
+        self._space.set()
+        return [job.id for job in pending] + [job.id for job in self._queue.cancel_many(**filters)]
     
     def get_active_jobs(self) -> list[Job]:
-        """Returns a list of the active jobs"""
-        return list(self._queue.get_active_jobs().values())
+        """Returns a list of the active jobs, followed by the jobs waiting to arrive"""
+        return list(self._queue.get_active_jobs().values()) + list(self._pending_jobs.values())
     
-    def get_job_records(self) -> list[Job]:
-        """Return Jobs that are completed/cancelled"""
-        return self._queue.get_job_records()
+    def projection(self) -> Projection:
+        """
+        Projected schedule of the current queue and printers (see eta.Projection)
+
+        The projection is cached until the queue or the printers change and only extended
+        as far as the queries need, so repeated ETA queries between events cost a dict
+        lookup and a change costs at most HORIZON queued jobs, however long the queue is
+        """
+        key = (self._queue.version, self._dispatches, self._fleet_version)
+        if key != self._projection_key:
+            self._projection = Projection(self._printers, self._queue.queued_heaps(), clock(), self._time_scale)
+            self._projection_key = key
+        return self._projection
+
+    def predict_schedule(self, limit: int = HORIZON) -> dict[str, Eta]:
+        """Projected start/finish of the running jobs and of the first limit queued jobs"""
+        projection = self.projection()
+        if projection.projected < limit:
+            projection.extend(limit - projection.projected)
+        return projection.etas
+
+    def get_eta(self, job_id: str) -> Optional[dict]:
+        """
+        Projected schedule of an active job with times relative to now and as epoch seconds,
+        None if the job is unknown or finished. Jobs that have not arrived only report when
+        they arrive
+        """
+        now = clock()
+        pending = self._pending_jobs.get(job_id)
+        if pending is not None:
+            arrives = self._start_time + pending.arrival_time * self._time_scale
+            return {"job_id": job_id, "status": "pending", "arrives_in": max(0.0, arrives - now),
+                    "arrives_at": arrives + self._wall_offset}
+        job = self._queue.get_active_job(job_id)
+        if job is None:
+            return None
+        projection = self.projection()
+        eta = projection.find(job_id)
+        start = projection.earliest_start(job.material)
+        if eta is None and start is not None and not projection.complete and self._queue.is_queued(job):
+            #past the horizon, the job cannot start before the next capable printer frees up
+            start = max(now, start)
+            return {"job_id": job_id, "status": job.status.value, "beyond_horizon": True,
+                    "start_in": start - now, "start_at": start + self._wall_offset}
+        if eta is None: # handed to a printer that has not started it yet
+            return {"job_id": job_id, "status": job.status.value, "start_in": 0.0, "start_at": now + self._wall_offset}
+        return {
+            "job_id": job_id,
+            "status": job.status.value,
+            "printer_id": eta.printer_id,
+            "position": eta.position,
+            "start_in": max(0.0, eta.start - now),
+            "finish_in": max(0.0, eta.finish - now),
+            "start_at": eta.start + self._wall_offset,
+            "finish_at": eta.finish + self._wall_offset
+        }
+
+    def get_job_records(self) -> list[JobRecord]:
+        """
+        Return the records of completed/cancelled jobs, spilled ones (from the database) first.
+        Once the run is saved, runs that spilled are read from the database alone
+        """
+        if not self._queue.spilled_count:
+            return self._queue.get_job_records()
+        if self._saved:
+            return self._db.load_records(self._run_id)
+        return self._db.load_records(self._run_id) + self._queue.get_job_records()
+
+    def _spill_records(self, records: list[JobRecord]) -> None:
+        """Retention callback of the queue, saves records leaving the in-memory window"""
+        elapsed = clock() - self._start_time if self._start_time is not None else 0.0
+        self._db.save_jobs(records=records, simulation_time=elapsed, run_id=self._run_id)
     
     def get_queue_stats(self) -> dict:
-        records = self._queue.get_job_records()
+        """Live queue counters, constant time regardless of the history size"""
+        counts = self._queue.get_status_counts()
         return{
-            "active_jobs": len(self._queue.get_active_jobs()),
-            "completed": sum(1 for r in records if r.status == "completed"),
-            "cancelled": sum(1 for r in records if r.status == "cancelled"),
-            "total_processed": len(records)
+            "active_jobs": counts["queue"] + counts["running"],
+            "queued": counts["queue"],
+            "running": counts["running"],
+            "completed": counts["completed"],
+            "cancelled": counts["cancelled"],
+            "total_processed": counts["completed"] + counts["cancelled"],
+            "pending_arrivals": len(self._pending_jobs),
+            "records_in_memory": counts["completed"] + counts["cancelled"] - self._queue.spilled_count,
+            "records_spilled": self._queue.spilled_count,
+            **self.get_admission_stats(),
+            "preemptions": self._preemption_counts["preemptions"]
         }
+
+    def get_admission_stats(self) -> dict:
+        """Jobs refused by admission control: rejected (queue full), shed, rate_limited, and blocked (had to wait)"""
+        if self._admission is None:
+            return {"rejected": 0, "shed": 0, "rate_limited": 0, "blocked": 0}
+        return dict(self._admission.counts)
+
+    def get_preemption_stats(self) -> dict:
+        """Running jobs suspended for urgent ones, and the busy seconds thrown away by restarts"""
+        return dict(self._preemption_counts)
     
-    def get_global_stats(self) -> dict:
-        """Final statistics"""
-        total_sim_time = time.time() - self._start_time
-        records = self._queue.get_job_records()
-        completed = [r for r in records if r.status == "completed"]
-
-        wait_times = []
-        for r in completed:
-            if r.start_time > 0:
-                wait = r.start_time - r.created_time
-                wait_times.append(wait)
-
-
-        if wait_times:
-            sorted_wait = sorted(wait_times)
-            size = len(sorted_wait)
-            avg_wait = sum(wait_times) / len(wait_times)
-            if size % 2 == 0:
-                median_wait = (sorted_wait[size//2 -1] + sorted_wait[size//2])/2
+    def get_breakdown_stats(self, window: Optional[float] = None) -> dict:
+        """
+        Wait/run time percentiles overall, per priority and per material plus throughput per
+        time window (see record_stats.breakdown), over the in-memory and spilled records
+        """
+        record_columns = self._queue.record_columns
+        columns = record_columns.arrays()
+        if self._queue.spilled_count:
+            rows = self._db.get_record_columns(self._run_id)
+            spilled = {
+                "priority": np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+                "material": np.fromiter((record_columns.material_code(r[1]) for r in rows), dtype=np.uint32, count=len(rows)),
+                "status": np.fromiter((STATUS_CODES[r[2]] for r in rows), dtype=np.uint8, count=len(rows)),
+                "created": np.fromiter((r[3] for r in rows), dtype=np.float64, count=len(rows)),
+                "start": np.fromiter((r[4] if r[4] > 0 else np.nan for r in rows), dtype=np.float64, count=len(rows)),
+                "end": np.fromiter((r[5] for r in rows), dtype=np.float64, count=len(rows)),
+            }
+            if self._saved: # the window is in the database too
+                columns = spilled
             else:
-                median_wait = sorted_wait[size//2]
-        else:
-            median_wait = 0.0
-            avg_wait = 0.0
+                columns = {name: np.concatenate([spilled[name], values]) for name, values in columns.items()}
+        return breakdown(columns, record_columns.materials, origin=self._start_time, window=window)
+
+    def get_global_stats(self, window: Optional[float] = None) -> dict:
+        """Final statistics, window is the length of the throughput windows of the breakdown"""
+        total_sim_time = clock() - self._start_time
+        stats_breakdown = self.get_breakdown_stats(window)
+        avg_wait = stats_breakdown["overall"]["wait_time"]["avg"]
+        median_wait = stats_breakdown["overall"]["wait_time"]["p50"]
 
-        total_completed = len(completed)
+        total_completed = self._queue.get_status_counts()["completed"] # includes spilled records
         if total_sim_time != 0:
             throughput = total_completed / total_sim_time
         else:
             throughput = 0.0
         
-        #printer utilization
+        #printer utilization over the time each printer was online, per printer and per printer class
         printer_utilization = []
+        classes: dict[str, list[tuple[float, float]]] = {}
+        now = self._start_time + total_sim_time
         for printer in self._printers:
-            utilization = printer.get_utilization(total_sim_time)
+            online = printer.online_time(self._start_time, now)
             printer_utilization.append({
                 "printer_id": printer.id,
-                "utilization_percent": utilization
+                "printer_class": printer.printer_class,
+                "state": printer.state,
+                "online_time": online,
+                "utilization_percent": printer.get_utilization(online)
             })
+            classes.setdefault(printer.printer_class, []).append((printer.total_busy_time, online))
+        #busy time over online time of the class, printers online for a short while weigh less
+        class_utilization = [
+            {"printer_class": name, "printers": len(values),
+             "utilization_percent": sum(b for b, _ in values) / online * 100 if (online := sum(o for _, o in values)) > 0 else 0.0}
+            for name, values in classes.items()
+        ]
         return {
             "avg_wait_time": avg_wait,
             "median_wait_time":median_wait,
             "throughput":throughput,
             "printer_utilization": printer_utilization,
+            "class_utilization": class_utilization,
             "total_simulation_time": total_sim_time,
-            "total_completed": total_completed
+            "total_completed": total_completed,
+            "timing_error": self.get_timing_error(),
+            "admission": self.get_admission_stats(),
+            "preemption": self.get_preemption_stats(),
+            "breakdown": stats_breakdown
+        }
+
+    def get_timing_error(self) -> dict:
+        """Scheduled (est_time / speed * time_scale) versus measured run time of completed jobs"""
+        timing = self._timing
+        jobs = timing["jobs"]
+        return {
+            "jobs": jobs,
+            "mean_error": timing["error"] / jobs if jobs else 0.0,
+            "mean_abs_error": timing["abs_error"] / jobs if jobs else 0.0,
+            "max_abs_error": timing["max_abs_error"],
+            "relative_error_percent": timing["abs_error"] / timing["scheduled"] * 100 if timing["scheduled"] else 0.0
         }
+
+    def _record_timing(self, scheduled: float, actual: float) -> None:
+        error = actual - scheduled
+        timing = self._timing
+        timing["jobs"] += 1
+        timing["scheduled"] += scheduled
+        timing["error"] += error
+        timing["abs_error"] += abs(error)
+        timing["max_abs_error"] = max(timing["max_abs_error"], abs(error))
     
-    async def add_job(self, job: Job) -> None:
-        """Add a job to the queue"""
-        await self._queue.put(job)
+    async def add_job(self, job: Job, client: Optional[str] = None) -> None:
+        """Add a job to the queue, or schedule it if it has an arrival/cancel time"""
+        if not await self.add_jobs([job], client=client):
+            raise Overloaded(f"Queue is full, job {job.id} was shed", retry_after=self._next_free_in())
+
+    async def add_jobs(self, jobs: list[Job], client: Optional[str] = None) -> list[Job]:
+        """
+        Add jobs to the queue, jobs with an arrival_time are released on schedule. Returns the
+        jobs admitted, all of them unless the admission policy shed some
 
-    async def add_jobs(self, jobs: list[Job]) -> None:
-        """Add a job to the queue"""
+        Raises ValueError, before adding any job, if a material is not supported by the fleet,
+        and Overloaded when admission control refuses the batch (client over its rate, queue
+        full with the reject policy or still full after the block timeout)
+        """
+        unsupported = {material for material in {job.material for job in jobs} if not self.can_print(material)}
+        if unsupported:
+            raise ValueError(f"No printer supports the material: {', '.join(sorted(unsupported))}")
+        admission = self._admission
+        if admission is not None:
+            admission.check_rate(client, len(jobs))
+            if admission.max_queue is not None and len(jobs) > admission.max_queue - self.backlog:
+                if admission.policy == "reject":
+                    admission.counts["rejected"] += len(jobs)
+                    raise Overloaded(f"Queue is full ({self.backlog} of {admission.max_queue} jobs waiting)",
+                                     retry_after=self._next_free_in())
+                if admission.policy == "block":
+                    await self._add_blocking(jobs)
+                    return jobs
+                jobs = self._shed(jobs, max(0, admission.max_queue - self.backlog))
+        await self._enqueue(jobs)
+        return jobs
+
+    def _shed(self, jobs: list[Job], room: int) -> list[Job]:
+        """The room most urgent jobs of a batch (FIFO among equal priorities) in input order"""
+        keep = set(sorted(range(len(jobs)), key=lambda i: jobs[i].priority)[:room])
+        self._admission.counts["shed"] += len(jobs) - len(keep)
+        return [job for i, job in enumerate(jobs) if i in keep]
+
+    async def _add_blocking(self, jobs: list[Job]) -> None:
+        """Queue the jobs in input order as room opens, Overloaded with the rest after the block timeout"""
+        admission = self._admission
+        admission.counts["blocked"] += len(jobs)
+        deadline = clock() + admission.block_timeout if admission.block_timeout is not None else None
+        queued = 0
+        while queued < len(jobs):
+            room = admission.max_queue - self.backlog
+            if room > 0:
+                await self._enqueue(jobs[queued:queued + room])
+                queued += room
+                continue
+            remaining = deadline - clock() if deadline is not None else 1.0
+            if remaining <= 0 or not self._running:
+                admission.counts["rejected"] += len(jobs) - queued
+                raise Overloaded(f"Queue stayed full, {queued} of {len(jobs)} jobs were queued",
+                                 retry_after=self._next_free_in())
+            self._space.clear()
+            try:
+                #bounded like the printer loop so a stopped simulator releases the caller
+                await asyncio.wait_for(self._space.wait(), timeout=min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _next_free_in(self) -> float:
+        """Seconds until the first busy printer is due to finish, a hint for Retry-After"""
+        now = clock()
+        return min((printer.deadline - now for printer in self._printers if printer.is_busy), default=1.0)
+
+    async def _enqueue(self, jobs: list[Job]) -> None:
+        """Queue the jobs without an arrival time, schedule the arrivals and cancellations"""
+        immediate = []
+        scheduled = []
         for job in jobs:
-            await self._queue.put(job)
+            if job.arrival_time is None:
+                immediate.append(job)
+            else:
+                scheduled.append((job.arrival_time, RELEASE, job))
+            if job.cancel_at is not None:
+                scheduled.append((job.cancel_at, CANCEL, job))
+        if immediate:
+            await self._queue.put_many(immediate)
+            self._preempt()
+        if scheduled:
+            self.schedule(scheduled)
+
+    def add_jobs_threadsafe(self, jobs: list[Job]) -> concurrent.futures.Future:
+        """
+        add_jobs from another thread, the queue lives in the simulator's event loop. The
+        returned future resolves once the jobs are queued (or holds the ValueError)
+        """
+        if self._loop is None:
+            raise RuntimeError("Simulator is not running")
+        return asyncio.run_coroutine_threadsafe(self.add_jobs(jobs), self._loop)
+
+    def schedule(self, actions: list[tuple[float, int, Job]]) -> None:
+        """
+        Push (offset, action, job) entries on the release heap
+
+        Offsets are simulated seconds since start. Large batches are appended and
+        heapified in linear time instead of being pushed one by one
+        """
+        entries = []
+        for offset, action, job in actions:
+            self._release_counter += 1
+            entries.append((offset, self._release_counter, action, job))
+            if action == RELEASE:
+                self._pending_jobs[job.id] = job
+                self._pending_index.add(job)
+        self._pending_version += 1
+        if len(entries) > len(self._releases):
+            self._releases.extend(entries)
+            heapq.heapify(self._releases)
+        else:
+            for entry in entries:
+                heapq.heappush(self._releases, entry)
+        self._release_wakeup.set()
+
+    async def run_releases(self) -> None:
+        """
+        Single coroutine that releases scheduled jobs and cancellations when they are due
+
+        Sleeps until the earliest deadline on the release heap, or until new entries are scheduled.
+        Arrivals that are due together are queued with one put_many call
+        """
+        due: list[Job] = []
+        while self._running:
+            if self._releases:
+                offset, _, action, job = self._releases[0]
+                delay = self._start_time + offset * self._time_scale - clock()
+            else:
+                delay = None # nothing scheduled, wait for schedule() or stop()
+            if delay is None or delay > 0 or action == CANCEL or len(due) >= 1000:
+                if due:
+                    #flush before sleeping, before a cancellation (it may target a job of the
+                    #batch) and every 1000 jobs so printers run while a large backlog becomes due
+                    await self._queue.put_many(due)
+                    due = []
+                    self._preempt()
+                    await asyncio.sleep(0)
+                    continue
+            if delay is None or delay > 0:
+                self._release_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._release_wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._releases)
+            if action == RELEASE:
+                if job.status != JobStatus.QUEUE:
+                    continue # cancelled before it arrived
+                del self._pending_jobs[job.id]
+                self._pending_index.remove(job)
+                job.created_at = clock()
+                due.append(job)
+            elif job.status == JobStatus.QUEUE:
+                self._queue.cancel_job(job.id)
+                self._space.set()
+        if due:
+            await self._queue.put_many(due) # stopped while a batch was being collected
     
+    def _preempt(self) -> None:
+        """
+        Suspend running jobs for the urgent queued jobs that no idle printer will take
+
+        Urgent jobs are matched, most urgent first, to idle printers (or printers already
+        told to suspend their job) that print their material, then to the busy printer
+        running the least urgent preemptible job, the latest started on ties since it has
+        done the least work. Interrupted printers take the urgent job once they requeued theirs.
+
+        Only the head of the queue is read: urgent jobs come lazily in dispatch order from the
+        heaps of the materials the idle and preemptible printers print, and the scan stops once no
+        preemptible printer is left or the jobs are no more urgent than every running one
+        """
+        if self._preemption is None:
+            return
+        free = []
+        victims = []
+        for printer in self._printers:
+            if not printer.accepts_jobs:
+                continue
+            interrupt = self._interrupts.get(printer.id)
+            if not printer.is_busy or (interrupt is not None and interrupt.is_set()):
+                free.append(printer)
+            elif interrupt is not None and printer.current_job.priority > self._preempt_priority:
+                victims.append(printer)
+        if not victims: # idle printers take the urgent jobs on their own
+            return
+        materials = None
+        if all(p.materials is not None for p in free + victims):
+            materials = set().union(*(p.materials for p in free + victims))
+        exhausted = set() # materials no remaining printer takes for the jobs that follow
+        for entry in merge_heaps(self._queue.queued_heaps(materials)):
+            job = entry.job
+            if job.priority > self._preempt_priority or job.priority >= max(p.current_job.priority for p in victims):
+                break
+            if job.material in exhausted:
+                continue
+            printer = next((p for p in free if p.can_print(job.material)), None)
+            if printer is not None:
+                free.remove(printer)
+                continue
+            candidates = [p for p in victims if p.can_print(job.material) and p.current_job.priority > job.priority]
+            if not candidates: # later jobs are no more urgent, they find none either
+                exhausted.add(job.material)
+                continue
+            victim = max(candidates, key=lambda p: (p.current_job.priority, p.start_job_time))
+            victims.remove(victim)
+            self._interrupts[victim.id].set()
+            if not victims:
+                break
+
+    def _suspend(self, printer: Printer) -> None:
+        """Take the preempted job off the printer and queue it again with the work it has left"""
+        now = clock()
+        elapsed = now - printer.start_job_time
+        job = printer.abort_current_job()
+        printer.deadline = now
+        if self._preemption == "resume":
+            job.remaining = max(0.0, job.work_left - elapsed / self._time_scale * printer.speed)
+        else:
+            job.remaining = None
+            self._preemption_counts["lost_time"] += elapsed
+        job.preemptions += 1
+        self._preemption_counts["preemptions"] += 1
+        self._queue.requeue(job)
+        log_event("job_preempted", "Printer %s suspended the job %s", printer.id, job.id, printer_id=printer.id,
+                  job_id=job.id, remaining=job.work_left)
+
     async def run_printer(self,printer: Printer) -> None:
         """
         One coroutine per printer 
         Runs in loop until signal from CLI to stop (timeout in order to stop)
         """
-        while self._running:
+        instr = self._instrumentation
+        draining = lambda: printer.draining
+        interrupt = None
+        if self._preemption is not None:
+            interrupt = self._interrupts[printer.id] = asyncio.Event()
+        while self._running and not printer.draining:
             try:
+                idle_since = clock()
                 job = await asyncio.wait_for(
-                    self._queue.get(),
+                    self._queue.get(printer.materials, stop=draining),
                     timeout=1.0
                 )
-                printer.start_job(job)
-                logging.info(f"Printer {printer.id} started the job {job.id}")
-                await asyncio.sleep(job.est_time * self._time_scale)
-                printer.finish_current_job()
+                if job is None: # drained while idle
+                    continue
+                self._space.set()
+                now = clock()
+                #The job starts on the model schedule: when the previous job was due to end or when
+                #it was queued, whichever is later. Sleeping until an absolute deadline means loop
+                #and logging overhead is absorbed instead of accumulating job after job
+                scheduled_start = min(now, max(printer.deadline, job.queued_at or now))
+                duration = printer.run_time_for(job) * self._time_scale
+                printer.start_job(job, started_at=scheduled_start)
+                printer.deadline = scheduled_start + duration
+                self._dispatches += 1
+
+                timed = instr.enabled # fixed for this job so toggling mid-job is safe
+                if timed:
+                    #job is ready once it is queued and this printer is idle
+                    instr.record("dispatch", now - max(job.queued_at or now, idle_since))
+                    start = time.perf_counter()
+                log_event("job_started", "Printer %s started the job %s", printer.id, job.id, printer_id=printer.id, job_id=job.id)
+                if timed:
+                    instr.record("logging", time.perf_counter() - start)
+
+                if interrupt is None:
+                    await asyncio.sleep(max(0.0, printer.deadline - clock()))
+                else:
+                    interrupt.clear()
+                    try:
+                        await asyncio.wait_for(interrupt.wait(), timeout=max(0.0, printer.deadline - clock()))
+                    except asyncio.TimeoutError:
+                        pass
+                    if interrupt.is_set() and clock() < printer.deadline:
+                        self._suspend(printer)
+                        continue
+                if timed:
+                    instr.record("sleep_error", clock() - printer.deadline)
+                    start = time.perf_counter()
+
+                #The job ends on the model schedule too (its deadline, earlier if the sleep woke early)
+                #since the next job starts from that deadline, busy intervals never overlap. The
+                #timing error still measures the actual wakeup
+                woke = clock()
+                printer.finish_current_job(finished_at=min(printer.deadline, woke))
+                self._record_timing(duration, woke - printer.start_job_time)
                 self._queue.mark_completed(job)
-                logging.info(f"Printer {printer.id} completed the job {job.id}")
+                log_event("job_completed", "Printer %s completed the job %s", printer.id, job.id, printer_id=printer.id, job_id=job.id, run_time=job.run_time)
+                if timed:
+                    instr.record("completion", time.perf_counter() - start)
 
             except asyncio.TimeoutError:
                 continue
             except Exception as e:
-                logging.info(f"Printer {printer.id} has the  error:{e}")
+                logging.info("Printer %s has the  error:%s", printer.id, e)
                 print(f"Printer {printer.id} has the  error:{e}")
 
-        logging.info(f"Printer {printer.id} stopped")
+        if printer.draining:
+            printer.left_at = clock()
+            self._fleet_version += 1
+            log_event("printer_removed", "Printer %s drained and removed", printer.id, printer_id=printer.id)
+        logging.info("Printer %s stopped", printer.id)
         print(f"Printer {printer.id} stopped")
 
     async def start(self) -> None:
         """Main routine that starts all the coroutines"""
         self._running = True
-        self._start_time = time.time()
-        logging.info("Simulation started")
+        self._loop = asyncio.get_running_loop()
+        self._start_time = clock()
+        self._wall_offset = time.time() - self._start_time
+        self._run_id = self._db.create_run(
+            num_printers=self.num_printers,
+            time_scale=self._time_scale,
+            started_at=time.time()
+        )
+        log_event("run_started", "Simulation run %s started", self._run_id, run_id=self._run_id, printers=self.num_printers, time_scale=self._time_scale)
         for printer in self._printers:
-            task = asyncio.create_task(self.run_printer(printer=printer))
-            self._workers_tasks.append(task)
-        logging.info(f"Started {len(self._printers)} printer workers")
+            if printer.accepts_jobs:
+                task = asyncio.create_task(self.run_printer(printer=printer))
+                self._workers_tasks.append(task)
+        self._release_task = asyncio.create_task(self.run_releases())
+        logging.info("Started %s printer workers", len(self._workers_tasks))
+
+    def export_archive(self, directory: str) -> Path:
+        """Write every job record of the run (memory and SQLite) as a columnar archive, see archive.py"""
+        records = sorted(self.get_job_records(), key=lambda r: r.end_time)
+        return write_archive(records, directory, origin=self._start_time, started_at=self._start_time + self._wall_offset,
+                             run_id=self._run_id)
 
-    async def stop(self) -> None:
-        """Stops all the workers safely"""
+    async def drain(self, timeout: Optional[float] = None, poll_interval: float = 0.05) -> bool:
+        """Wait until every job has arrived and finished, False if the timeout passed first"""
+        deadline = clock() + timeout if timeout is not None else None
+        while True:
+            stats = self.get_queue_stats()
+            if not stats["active_jobs"] and not stats["pending_arrivals"]:
+                return True
+            if deadline is not None and clock() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+
+    async def stop(self, cancel_running: bool = False) -> None:
+        """
+        Stops all the workers safely
+
+        By default running jobs are allowed to finish. With cancel_running the printers are
+        interrupted and their current jobs are recorded as cancelled. Calling stop again is a no-op
+        """
+        if not self._running:
+            return
         self._running = False
-        await asyncio.gather(*self._workers_tasks, return_exceptions=True) # Waits for all threads even if they raise exceptions
+        self._release_wakeup.set()
+        if cancel_running:
+            for task in self._workers_tasks:
+                task.cancel()
+        tasks = self._workers_tasks + ([self._release_task] if self._release_task else [])
+        await asyncio.gather(*tasks, return_exceptions=True) # Waits for all threads even if they raise exceptions
+        for printer in self._printers:
+            if printer.is_busy:
+                job = printer.abort_current_job()
+                self._queue.cancel_running(job)
+                log_event("job_cancelled", "Printer %s cancelled the job %s", printer.id, job.id, printer_id=printer.id, job_id=job.id, running=True)
         print("All workers stopped")
         logging.info("All workers stopped")
         
-        records = self._queue.get_job_records()
-        sorted_records = sorted(records, key=lambda r: r.end_time) #sort records by the order they were concluded
-        
+        #spilled records are already in the database, only the in-memory window is saved here
+        in_memory = sorted(self._queue.get_job_records(), key=lambda r: r.end_time) #sort records by the order they were concluded
+        #report rows are read before the save, after it the window would be in both tiers
+        sorted_records = sorted(self.get_job_records(), key=lambda r: r.end_time)
+
         stats = self.get_global_stats()
-        jobs_on_db = self._db.save_jobs(records=sorted_records, simulation_time=stats['total_simulation_time'])
-        logging.info(f"Saved {jobs_on_db} jobs to the database")
+        jobs_on_db = self._db.save_jobs(records=in_memory, simulation_time=stats['total_simulation_time'], run_id=self._run_id)
+        self._saved = True
+        self._db.finish_run(self._run_id, duration=stats['total_simulation_time'])
+        logging.info("Saved %s jobs to the database", jobs_on_db)
 
-        plt = Visualizer()
-        plt.plot_printer_utilization(stats=stats)
-        generate_json_report(records=sorted_records)
+        plt = Visualizer(dir=str(self._output_dir))
+        self._output_files.append(plt.plot_printer_utilization(stats=stats))
+        timeline = plt.plot_printer_timeline(
+            timelines={printer.id: printer.timeline for printer in self._printers},
+            start_time=self._start_time,
+            end_time=self._start_time + stats['total_simulation_time']
+        )
+        if timeline is not None:
+            self._output_files.append(timeline)
+        self._output_files.append(generate_json_report(records=sorted_records, output_dir=str(self._output_dir), time_offset=self._wall_offset,
+                                                       summary=stats['breakdown']))
+        self._final_stats = stats
+        timing = stats['timing_error']
+        log_event("run_finished", "Timing error over %s jobs: mean %.6fs, max %.6fs (%.3f%%)",
+                  timing['jobs'], timing['mean_error'], timing['max_abs_error'], timing['relative_error_percent'],
+                  run_id=self._run_id, **timing)
 
 async def basic_test():
 
@@ -0,0 +1,102 @@
+from array import array
+from typing import Optional
+import numpy as np
+
+
+class BusyTimeline:
+    """
+    Compact record of the intervals a printer spent working
+
+    Intervals are appended in chronological order and never overlap, so the
+    start and end columns are always sorted. Each interval costs 16 bytes.
+    """
+    def __init__(self):
+        self._starts = array('d')
+        self._ends = array('d')
+        self._busy_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def add(self, start: float, end: float) -> None:
+        """Append a busy interval"""
+        if end < start:
+            raise ValueError("Interval end must not be before its start")
+        self._starts.append(start)
+        self._ends.append(end)
+        self._busy_time += end - start
+
+    @property
+    def total_busy_time(self) -> float:
+        return self._busy_time
+
+    @property
+    def starts(self) -> np.ndarray:
+        """Interval starts as a numpy array (copied, so the timeline can keep growing)"""
+        return np.array(self._starts, dtype=np.float64)
+
+    @property
+    def ends(self) -> np.ndarray:
+        """Interval ends as a numpy array"""
+        return np.array(self._ends, dtype=np.float64)
+
+    def busy_time_until(self, times: np.ndarray) -> np.ndarray:
+        """
+        Cumulative busy time at each of the given instants
+
+        busy(t) = sum(t - s for s <= t) - sum(t - e for e <= t), evaluated with a
+        binary search per instant over the prefix sums of the sorted columns
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if not len(self):
+            return np.zeros_like(times)
+        starts = self.starts
+        ends = self.ends
+        start_sums = np.concatenate(([0.0], np.cumsum(starts)))
+        end_sums = np.concatenate(([0.0], np.cumsum(ends)))
+
+        n_started = np.searchsorted(starts, times, side='right')
+        n_ended = np.searchsorted(ends, times, side='right')
+        started = n_started * times - start_sums[n_started]
+        ended = n_ended * times - end_sums[n_ended]
+        return started - ended
+
+    def utilization(self, start: float, end: float, bins: int = 100) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Utilization over time between start and end
+
+        Returns the bin edges (bins + 1) and the busy fraction of each bin (0..1)
+        """
+        if bins <= 0:
+            raise ValueError("Number of bins must be positive")
+        edges = np.linspace(start, end, bins + 1)
+        width = (end - start) / bins
+        if width <= 0:
+            return edges, np.zeros(bins)
+        busy = np.diff(self.busy_time_until(edges))
+        return edges, np.clip(busy / width, 0.0, 1.0)
+
+    def merged(self, min_gap: float, start: Optional[float] = None, end: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Intervals clipped to [start, end] with idle gaps shorter than min_gap merged away
+
+        Used to downsample a timeline to the resolution it will be drawn at
+        """
+        starts = self.starts
+        ends = self.ends
+        if start is not None or end is not None:
+            lo = np.searchsorted(ends, start, side='left') if start is not None else 0
+            hi = np.searchsorted(starts, end, side='right') if end is not None else len(starts)
+            starts = starts[lo:hi]
+            ends = ends[lo:hi]
+            if start is not None:
+                starts = np.maximum(starts, start)
+            if end is not None:
+                ends = np.minimum(ends, end)
+        if len(starts) == 0:
+            return starts, ends
+
+        breaks = np.flatnonzero(starts[1:] - ends[:-1] > min_gap)
+        merged_starts = np.concatenate(([starts[0]], starts[breaks + 1]))
+        merged_ends = np.concatenate((ends[breaks], [ends[-1]]))
+        return merged_starts, merged_ends
@@ -1,18 +1,26 @@
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import numpy as np
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
+from timeline import BusyTimeline
 
 
 class Visualizer:
     """Create visualization of printer utilization"""
 
+    TIMELINE_WIDTH_PX = 1800     # Horizontal resolution of the timeline chart
+    MAX_GANTT_SEGMENTS = 5000    # Above this the timeline is drawn as a heatmap
+    HEATMAP_BINS = 600
+    MAX_FIGURE_HEIGHT = 12       # Inches, keeps image size bounded for large fleets
+
     def __init__(self, dir: str = "logs"):
         self.output_dir = Path(dir)
         self.output_dir.mkdir(exist_ok=True)
         
-    def plot_printer_utilization(self, stats: dict) -> None:
+    def plot_printer_utilization(self, stats: dict) -> Path:
         """Plot printer utilization"""
         printer_util = stats['printer_utilization']
 
@@ -33,3 +41,63 @@ class Visualizer:
         
         plt.savefig(filepath,dpi = 150, bbox_inches= 'tight')
         plt.close()
+        return filepath
+
+    def plot_printer_timeline(self, timelines: dict[int, BusyTimeline], start_time: float, end_time: float) -> Optional[Path]:
+        """
+        Plot when each printer was busy
+
+        Intervals separated by less than one pixel are merged before drawing, and when
+        the chart would still need more than MAX_GANTT_SEGMENTS bars it is drawn as a
+        utilization heatmap instead, so the cost does not grow with the number of jobs
+        """
+        duration = end_time - start_time
+        if duration <= 0 or not timelines:
+            return None
+
+        min_gap = duration / self.TIMELINE_WIDTH_PX
+        segments = {
+            printer_id: timeline.merged(min_gap, start_time, end_time)
+            for printer_id, timeline in timelines.items()
+        }
+        total_segments = sum(len(starts) for starts, _ in segments.values())
+
+        rows = len(timelines)
+        height = min(self.MAX_FIGURE_HEIGHT, 1.5 + 0.4 * rows)
+        fig, ax = plt.subplots(figsize=(self.TIMELINE_WIDTH_PX / 150, height))
+
+        if total_segments <= self.MAX_GANTT_SEGMENTS:
+            for row, (starts, ends) in enumerate(segments.values()):
+                bars = np.column_stack((starts - start_time, ends - starts))
+                ax.broken_barh(bars, (row - 0.4, 0.8))
+            ax.set_ylim(-0.5, rows - 0.5)
+            ax.invert_yaxis()
+        else:
+            grid = np.vstack([
+                timeline.utilization(start_time, end_time, self.HEATMAP_BINS)[1] * 100
+                for timeline in timelines.values()
+            ])
+            image = ax.imshow(
+                grid,
+                aspect='auto',
+                interpolation='nearest',
+                extent=(0, duration, rows - 0.5, -0.5),
+                vmin=0,
+                vmax=100
+            )
+            fig.colorbar(image, ax=ax, label='Utilization %')
+
+        if rows <= 50:
+            ax.set_yticks(range(rows))
+            ax.set_yticklabels([f"Printer {printer_id}" for printer_id in timelines])
+        ax.set_xlim(0, duration)
+        ax.set_xlabel('Time since start (s)')
+        fig.tight_layout()
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = self.output_dir / f"printer_timeline_{timestamp}.png"
+
+        fig.savefig(filepath, dpi=150)
+        plt.close(fig)
+        return filepath
+
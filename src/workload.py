@@ -0,0 +1,159 @@
+import json
+import random
+from bisect import bisect
+from itertools import accumulate
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+# Share of jobs printed with each material
+MATERIAL_MIX = {"PLA": 0.50, "PETG": 0.25, "ABS": 0.15, "TPU": 0.10}
+
+# Empirical est_time histograms per material: (low, high) buckets in seconds and their weights
+EST_TIME_DISTRIBUTIONS = {
+    "PLA":  ([(5, 15), (15, 30), (30, 60), (60, 120)], [0.30, 0.40, 0.22, 0.08]),
+    "PETG": ([(10, 20), (20, 40), (40, 80), (80, 160)], [0.20, 0.40, 0.28, 0.12]),
+    "ABS":  ([(10, 25), (25, 50), (50, 100), (100, 200)], [0.15, 0.35, 0.35, 0.15]),
+    "TPU":  ([(20, 40), (40, 90), (90, 180), (180, 300)], [0.10, 0.35, 0.35, 0.20]),
+}
+
+# Share of jobs per priority (lower means higher priority)
+PRIORITY_MIX = {0: 0.05, 1: 0.10, 2: 0.25, 3: 0.30, 4: 0.20, 5: 0.10}
+
+ARRIVAL_PROCESSES = ("none", "poisson", "bursty")
+
+
+class _WeightedChoice:
+    """Constant-time setup, O(log k) sampling from a fixed discrete distribution"""
+    def __init__(self, values: list, weights: list[float]):
+        if len(values) != len(weights) or not values:
+            raise ValueError("Values and weights must be non-empty and the same length")
+        self.values = list(values)
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def sample(self, rng: random.Random):
+        return self.values[bisect(self.cum_weights, rng.random() * self.total)]
+
+
+def _arrival_times(rng: random.Random, arrival: str, rate: float, burst_size: float) -> Iterator[Optional[float]]:
+    """
+    Infinite stream of arrival offsets (in simulated seconds)
+
+    none: everything is available at the start
+    poisson: exponential inter-arrival times with mean 1/rate
+    bursty: bursts arrive as a Poisson process and carry a geometric number of
+            jobs (mean burst_size) each, spread over short gaps of mean 1/(100*rate).
+            The burst rate accounts for those gaps, so the long run rate equals rate
+    """
+    if arrival == "none":
+        while True:
+            yield None
+    if rate <= 0:
+        raise ValueError("Arrival rate must be positive")
+
+    now = 0.0
+    if arrival == "poisson":
+        while True:
+            now += rng.expovariate(rate)
+            yield now
+    elif arrival == "bursty":
+        if burst_size < 1:
+            raise ValueError("Burst size must be at least 1")
+        in_burst_rate = rate * 100 # jobs in a burst arrive almost together
+        # burst_size / rate = 1 / burst_rate + (burst_size - 1) / in_burst_rate
+        burst_rate = in_burst_rate / (100 * burst_size - (burst_size - 1))
+        continue_probability = 1 - 1 / burst_size
+        while True:
+            now += rng.expovariate(burst_rate)
+            yield now
+            while rng.random() < continue_probability:
+                now += rng.expovariate(in_burst_rate)
+                yield now
+    else:
+        raise ValueError(f"Unknown arrival process {arrival}, expected one of {ARRIVAL_PROCESSES}")
+
+
+def generate_jobs(count: int,
+                  seed: Optional[int] = None,
+                  arrival: str = "none",
+                  rate: float = 1.0,
+                  burst_size: float = 10.0,
+                  cancel_fraction: float = 0.0,
+                  mean_patience: float = 60.0,
+                  material_mix: Optional[dict[str, float]] = None,
+                  priority_mix: Optional[dict[int, float]] = None,
+                  id_prefix: str = "P") -> Iterator[dict]:
+    """
+    Lazily generate count jobs as dicts in the workload file format
+
+    The same seed always produces the same workload. A cancel_fraction share of
+    the jobs gets a cancel_at time, an exponential patience (mean mean_patience)
+    after its arrival.
+    """
+    if count < 0:
+        raise ValueError("Count must not be negative")
+    if not 0 <= cancel_fraction <= 1:
+        raise ValueError("Cancel fraction must be between 0 and 1")
+    if mean_patience <= 0:
+        raise ValueError("Mean patience must be positive")
+
+    rng = random.Random(seed)
+    material_mix = material_mix or MATERIAL_MIX
+    priority_mix = priority_mix or PRIORITY_MIX
+
+    materials = _WeightedChoice(list(material_mix), list(material_mix.values()))
+    priorities = _WeightedChoice(list(priority_mix), list(priority_mix.values()))
+    unknown = [material for material in material_mix if material not in EST_TIME_DISTRIBUTIONS]
+    if unknown:
+        raise ValueError(f"No est_time distribution for materials {unknown}")
+    est_times = {
+        material: _WeightedChoice(*EST_TIME_DISTRIBUTIONS[material])
+        for material in material_mix
+    }
+    arrivals = _arrival_times(rng, arrival, rate, burst_size)
+
+    for i in range(count):
+        material = materials.sample(rng)
+        low, high = est_times[material].sample(rng)
+        job = {
+            "id": f"{id_prefix}{i}",
+            "material": material,
+            "est_time": round(rng.uniform(low, high), 2),
+            "priority": priorities.sample(rng)
+        }
+        arrival_time = next(arrivals)
+        if arrival_time is not None:
+            job["arrival_time"] = round(arrival_time, 4)
+        if cancel_fraction and rng.random() < cancel_fraction:
+            job["cancel_at"] = round((arrival_time or 0.0) + rng.expovariate(1 / mean_patience), 4)
+        yield job
+
+
+def write_workload(jobs: Iterable[dict], filepath: str, fmt: str = "json") -> int:
+    """
+    Stream jobs to a workload file without holding them in memory
+
+    fmt is "json" ({"jobs": [...]}, readable by load_jobs_from_json) or "ndjson" (one job per line)
+    Returns the number of jobs written
+    """
+    if fmt not in ("json", "ndjson"):
+        raise ValueError(f"Unknown workload format {fmt}")
+    path = Path(filepath)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == "json":
+            f.write('{"jobs": [')
+        for job in jobs:
+            line = json.dumps(job, separators=(',', ':'))
+            if fmt == "json":
+                f.write(",\n" if count else "\n")
+                f.write(line)
+            else:
+                f.write(line)
+                f.write("\n")
+            count += 1
+        if fmt == "json":
+            f.write("\n]}\n")
+    return count
@@ -0,0 +1,104 @@
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from admission import AdmissionControl, Overloaded, TokenBucket
+from simulator import Simulator
+from models import Job
+
+def _jobs(count, start=0):
+    return [Job(f"J{i}", "PLA", 1000, priority=i % 3) for i in range(start, start + count)]
+
+def test_token_bucket():
+    """Test: A bucket grants its burst at once and reports the wait for the rest"""
+    bucket = TokenBucket(rate=10, burst=5)
+    assert bucket.take(5) == 0.0
+    assert 0 < bucket.take(1) <= 0.1
+    assert bucket.take(6) == float("inf")
+
+    admission = AdmissionControl(rate=1, burst=2, max_clients=1)
+    admission.check_rate("alice", 2)
+    with pytest.raises(Overloaded) as e:
+        admission.check_rate("alice", 1)
+    assert e.value.retry_after == 1
+    admission.check_rate("bob", 2) # alice's bucket is dropped past max_clients
+    admission.check_rate("alice", 2)
+    with pytest.raises(ValueError):
+        admission.check_rate("carol", 3)
+    assert admission.counts["rate_limited"] == 1
+
+@pytest.mark.asyncio
+async def test_reject_and_shed(tmp_path):
+    """Test: Over the bound a batch is refused whole (reject) or trimmed to its most urgent jobs (shed)"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path),
+                    admission=AdmissionControl(max_queue=5, policy="reject"))
+    await sim.start()
+    try:
+        await sim.add_jobs(_jobs(4))
+        with pytest.raises(Overloaded):
+            await sim.add_jobs(_jobs(3, start=10))
+        assert sim.backlog <= 4
+        sim.admission.policy = "shed"
+        admitted = await sim.add_jobs(_jobs(6, start=20))
+        assert sim.backlog == 5
+        assert all(job.priority == 0 for job in admitted)
+        with pytest.raises(Overloaded):
+            await sim.add_job(Job("late", "PLA", 10, priority=0))
+        stats = sim.get_queue_stats()
+        assert stats["rejected"] == 3
+        assert stats["shed"] == 6 - len(admitted) + 1
+    finally:
+        await sim.stop(cancel_running=True)
+    assert sim.final_stats["admission"]["rejected"] == 3
+
+@pytest.mark.asyncio
+async def test_block_until_room(tmp_path):
+    """Test: The block policy queues a batch in chunks as printers take jobs, and gives up after its timeout"""
+    sim = Simulator(num_printers=2, time_scale=0.001, output_dir=str(tmp_path),
+                    admission=AdmissionControl(max_queue=3, policy="block", block_timeout=5.0))
+    await sim.start()
+    try:
+        jobs = [Job(f"B{i}", "PLA", 10) for i in range(12)]
+        admitted = await sim.add_jobs(jobs)
+        assert len(admitted) == 12
+        assert await sim.drain(timeout=5.0)
+        assert sim.get_queue_stats()["completed"] == 12
+
+        sim.admission.block_timeout = 0.2
+        await sim.add_jobs(_jobs(5)) # waits for the printers to take 2, then 3 stay queued
+        with pytest.raises(Overloaded):
+            await sim.add_jobs(_jobs(2, start=10))
+        assert sim.get_admission_stats() == {"rejected": 2, "shed": 0, "rate_limited": 0, "blocked": 19}
+    finally:
+        await sim.stop(cancel_running=True)
+
+def test_api_admission(tmp_path):
+    """Test: POST /jobs answers 429 with Retry-After over the client rate and the queue bound"""
+    os.environ.update(SIMULATOR_OUTPUT_DIR=str(tmp_path), SIMULATOR_MAX_QUEUE="100", SIMULATOR_RATE_LIMIT="1",
+                      SIMULATOR_RATE_BURST="4")
+    try:
+        import api
+        with TestClient(api.app) as client:
+            def post(job_id, client_id):
+                #3s at the API time scale, long enough to keep both printers busy and short to wait for at shutdown
+                return client.post("/jobs", json={"id": job_id, "material": "PLA", "est_time": 30, "priority": 1},
+                                   headers={"X-Client-Id": client_id})
+            codes = [post(f"J{i}", "alice").status_code for i in range(6)]
+            assert codes == [201, 201, 201, 201, 429, 429]
+            assert post("B0", "bob").status_code == 201 # buckets are per client
+
+            api.sim.admission.max_queue = 1 # at least 3 of the 5 jobs wait for the 2 printers
+            response = post("B1", "bob")
+            assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) >= 1
+            admission = client.get("/stats").json()["admission"]
+            assert admission == {"rejected": 1, "shed": 0, "rate_limited": 2, "blocked": 0}
+            assert client.get("/health").json()["rate_limited"] == 2
+    finally:
+        for name in ("SIMULATOR_OUTPUT_DIR", "SIMULATOR_MAX_QUEUE", "SIMULATOR_RATE_LIMIT", "SIMULATOR_RATE_BURST"):
+            del os.environ[name]
@@ -1,5 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
+import json
+import time
+import os
 import sys
 from pathlib import Path
 
@@ -8,10 +11,12 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from api import app
 
 @pytest.fixture(scope="module")
-def client():
-    """FastAPI test client"""
+def client(tmp_path_factory):
+    """FastAPI test client, run outputs go to a temporary directory"""
+    os.environ["SIMULATOR_OUTPUT_DIR"] = str(tmp_path_factory.mktemp("output"))
     with TestClient(app) as c:
         yield c
+    del os.environ["SIMULATOR_OUTPUT_DIR"]
 
 def test_health_endpoint(client):
     """Test: Health check returns 200"""
@@ -58,6 +63,12 @@ def test_get_stats(client):
     data = response.json()
     
     assert "avg_wait_time" in data
+    assert set(data["overall"]["wait_time"]) == {"avg", "max", "p50", "p90", "p95", "p99"}
+    assert "by_priority" in data and "by_material" in data
+
+    response = client.get("/stats", params={"window": 0.5})
+    assert response.json()["window"] == 0.5
+    assert client.get("/stats", params={"window": 0}).status_code == 422
 
 def test_cancel_nonexistent_job(client):
     """Test: Cancel non-existent job returns 404"""
@@ -65,3 +76,163 @@ def test_cancel_nonexistent_job(client):
     response = client.delete("/jobs/nonexistent_job")
     assert response.status_code == 404
 
+
+def test_history(client):
+    """Test: Current run is listed in history and unknown runs return 404"""
+    response = client.get("/history")
+    assert response.status_code == 200
+    runs = response.json()
+    assert len(runs) >= 1
+
+    response = client.get(f"/history/{runs[0]['run_id']}/stats")
+    assert response.status_code == 200
+    assert "p95_wait_time" in response.json()
+
+    assert client.get("/history/999999/stats").status_code == 404
+
+def test_metrics(client):
+    """Test: Instrumentation can be toggled and read through the API"""
+    response = client.put("/metrics", params={"enabled": True, "reset": True})
+    assert response.status_code == 200
+    client.post("/jobs", json={"id": "metrics_001", "material": "PLA", "est_time": 1.0, "priority": 1})
+
+    data = client.get("/metrics").json()
+    assert data["enabled"] == True
+    assert data["phases"]["enqueue"]["count"] == 1
+
+    client.put("/metrics", params={"enabled": False})
+
+def test_bulk_cancel_by_filters(client):
+    """Test: Query and cancel queued jobs by material, priority and tag"""
+    for i in range(2):
+        client.post("/jobs", json={"id": f"blocker_{i}", "material": "PLA", "est_time": 10.0, "priority": 0})
+    for i in range(3):
+        client.post("/jobs", json={"id": f"tpu_{i}", "material": "TPU", "est_time": 10.0, "priority": 9, "tag": "bulk"})
+    client.post("/jobs", json={"id": "pla_bulk", "material": "PLA", "est_time": 10.0, "priority": 9, "tag": "bulk"})
+
+    response = client.get("/jobs", params={"tag": "bulk"})
+    assert sorted(j["id"] for j in response.json()) == ["pla_bulk", "tpu_0", "tpu_1", "tpu_2"]
+
+    response = client.delete("/jobs", params={"material": "TPU", "tag": "bulk"})
+    assert response.status_code == 200
+    assert response.json() == {"cancelled": 3, "job_ids": ["tpu_0", "tpu_1", "tpu_2"]}
+
+    response = client.delete("/jobs", params={"min_priority": 9, "tag": "bulk"})
+    assert response.json()["job_ids"] == ["pla_bulk"]
+    assert client.get("/jobs", params={"tag": "bulk"}).json() == []
+
+    assert client.delete("/jobs").status_code == 400
+
+def test_reprioritize_job(client):
+    """Test: PATCH changes the priority of a queued job"""
+    client.post("/jobs", json={"id": "patch_me", "material": "ABS", "est_time": 10.0, "priority": 9})
+    response = client.patch("/jobs/patch_me", json={"priority": 0})
+    assert response.status_code == 200
+    assert response.json()["priority"] == 0
+
+    assert client.patch("/jobs/patch_me", json={"priority": -1}).status_code == 422
+    assert client.patch("/jobs/unknown", json={"priority": 1}).status_code == 404
+
+def _simulation_jobs(count):
+    return [{"id": f"sim_job_{i}", "material": "PLA", "est_time": 5.0 + i, "priority": i % 3, "arrival_time": float(i)}
+            for i in range(count)]
+
+def test_simulation_virtual_engine(client):
+    """Test: A what-if run completes in a worker process and leaves the live queue alone"""
+    response = client.post("/simulations", json={"jobs": _simulation_jobs(20), "num_printers": 2})
+    assert response.status_code == 202
+    simulation = response.json()
+    assert simulation["status"] in ("queued", "running")
+
+    for _ in range(60):
+        simulation = client.get(f"/simulations/{simulation['id']}", params={"wait": 1}).json()
+        if simulation["status"] not in ("queued", "running"):
+            break
+    assert simulation["status"] == "completed", simulation["error"]
+    assert simulation["result"]["completed"] == 20
+    assert simulation["result"]["num_printers"] == 2
+    assert not [j for j in client.get("/jobs").json() if j["id"].startswith("sim_job_")]
+
+    response = client.post("/simulations", json={"jobs": _simulation_jobs(20), "num_printers": 2})
+    assert response.json()["status"] == "completed"
+    assert response.json()["cached"]
+    assert response.json()["result"] == simulation["result"]
+    assert simulation["id"] in [s["id"] for s in client.get("/simulations").json()]
+
+def test_simulation_realtime_stream(client):
+    """Test: The realtime engine runs a fleet, the stream ends with the finished state"""
+    response = client.post("/simulations", json={
+        "jobs": _simulation_jobs(4),
+        "engine": "realtime",
+        "fleet": [{"class": "fast", "speed": 2.0}],
+        "time_scale": 0.001
+    })
+    assert response.status_code == 202
+    with client.stream("GET", f"/simulations/{response.json()['id']}/stream") as stream:
+        states = [json.loads(line) for line in stream.iter_lines() if line]
+    assert states[-1]["status"] == "completed", states[-1]["error"]
+    assert states[-1]["result"]["queue"]["completed"] == 4
+    assert states[-1]["result"]["printer_utilization"][0]["printer_class"] == "fast"
+
+def test_simulation_validation(client):
+    """Test: Bad simulation requests are rejected before they are queued"""
+    assert client.get("/simulations/sim_unknown").status_code == 404
+    assert client.post("/simulations", json={"jobs": []}).status_code == 422
+    assert client.post("/simulations", json={"jobs": _simulation_jobs(2), "policy": "random"}).status_code == 422
+    assert client.post("/simulations", json={"jobs": _simulation_jobs(2), "fleet": [{"count": 1}]}).status_code == 400
+    duplicated = _simulation_jobs(1) * 2
+    assert client.post("/simulations", json={"jobs": duplicated}).status_code == 400
+
+def test_job_eta(client):
+    """Test: A queued job reports its projected start and finish"""
+    client.post("/jobs", json={"id": "eta_job", "material": "PLA", "est_time": 10.0, "priority": 9})
+    response = client.get("/jobs/eta_job/eta")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] in ("queue", "running")
+    assert data["finish_in"] >= data["start_in"] >= 0
+    assert data["finish_at"] > data["start_at"]
+    assert client.get("/jobs/unknown/eta").status_code == 404
+
+def test_add_and_drain_printer(client):
+    """Test: Printers are added with POST /printers and drained with DELETE /printers/{id}"""
+    response = client.post("/printers", json={"printer_class": "fast", "speed": 2.0, "materials": ["PLA"]})
+    assert response.status_code == 201
+    printer = response.json()[0]
+    assert printer["state"] == "online"
+    assert printer["materials"] == ["PLA"]
+
+    response = client.delete(f"/printers/{printer['id']}")
+    assert response.status_code == 202
+    assert response.json()["state"] == "draining"
+    assert client.delete(f"/printers/{printer['id']}").status_code == 404
+    assert client.delete("/printers/999").status_code == 404
+    assert client.post("/printers", json={"speed": 0}).status_code == 422
+
+def test_cached_responses_and_etags(client):
+    """Test: /jobs and /stats carry an ETag, answer 304 until the queue changes"""
+    import api
+    api.sim.cancel_jobs(min_priority=0)
+    deadline = time.monotonic() + 30
+    while client.get("/health").json()["active_jobs"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+    first = client.get("/jobs")
+    etag = first.headers["ETag"]
+    assert first.json() == []
+    hits = api.responses.hits
+    cached = client.get("/jobs", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["ETag"] == etag
+    assert api.responses.hits == hits + 1
+    assert client.get("/jobs", params={"material": "PLA"}).headers["ETag"] == etag # empty list too
+
+    stats = client.get("/stats")
+    assert client.get("/stats", headers={"If-None-Match": stats.headers["ETag"]}).status_code == 304
+    assert client.get("/stats", params={"window": 0}).status_code == 422
+
+    client.post("/jobs", json={"id": "etag_1", "material": "PLA", "est_time": 10.0, "priority": 1})
+    changed = client.get("/jobs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert [job["id"] for job in changed.json()] == ["etag_1"]
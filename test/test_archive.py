@@ -0,0 +1,62 @@
+import math
+import sys
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models import JobRecord
+from database import JobDatabase
+from archive import RunArchive, export_run, write_archive
+
+def _records():
+    return [
+        JobRecord(job_id="J1", start_time=101.0, created_time=100.0, end_time=111.0, duration=11.0, status="completed", priority=1),
+        JobRecord(job_id="peça-2", start_time=103.0, created_time=100.0, end_time=123.0, duration=23.0, status="completed", priority=0),
+        JobRecord(job_id="J3", start_time=0, created_time=100.0, end_time=105.0, duration=5.0, status="cancelled", priority=4),
+    ]
+
+def test_archive_round_trip(tmp_path):
+    """Test: Columns are memory-mapped back with times relative to the run start"""
+    write_archive(_records(), str(tmp_path / "run"), origin=100.0, started_at=1700000000.0, run_id=7)
+    archive = RunArchive(str(tmp_path / "run"))
+
+    assert len(archive) == 3
+    assert archive.manifest["run_id"] == 7
+    assert isinstance(archive["end"], np.memmap)
+    assert archive["priority"].tolist() == [1, 0, 4]
+    assert archive["end"].tolist() == [11.0, 23.0, 5.0]
+    assert math.isnan(archive["start"][2])
+    assert archive.job_ids() == ["J1", "peça-2", "J3"]
+    assert archive.job_id(int(archive["job_index"][1])) == "peça-2"
+    assert (tmp_path / "run" / "end.bin").stat().st_size == 3 * 8
+
+def test_archive_summary(tmp_path):
+    """Test: Aggregates are computed on the columns"""
+    write_archive(_records(), str(tmp_path / "run"), origin=100.0)
+    summary = RunArchive(str(tmp_path / "run")).summary()
+    assert summary["completed"] == 2
+    assert summary["cancelled"] == 1
+    assert summary["avg_wait_time"] == 2.0
+    assert summary["max_wait_time"] == 3.0
+    assert summary["avg_run_time"] == 15.0
+    assert summary["duration"] == 23.0
+
+def test_empty_archive(tmp_path):
+    """Test: An archive without records can still be opened"""
+    write_archive([], str(tmp_path / "run"))
+    archive = RunArchive(str(tmp_path / "run"))
+    assert len(archive) == 0
+    assert archive.job_ids() == []
+    assert archive.summary()["completed"] == 0
+
+def test_export_run_from_database(tmp_path):
+    """Test: A saved run is archived from SQLite"""
+    db = JobDatabase(db_path=str(tmp_path / "history.db"))
+    run_id = db.create_run(num_printers=2, time_scale=0.1, started_at=1700000000.0)
+    db.save_jobs(_records(), simulation_time=23.0, run_id=run_id)
+
+    archive = RunArchive(str(export_run(str(tmp_path / "history.db"), run_id, str(tmp_path / "run"))))
+    assert archive.job_ids() == ["J1", "peça-2", "J3"]
+    assert archive.manifest["started_at"] == 1700000000.0
+    assert archive["created"].tolist() == [0.0, 0.0, 0.0]
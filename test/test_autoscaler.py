@@ -0,0 +1,52 @@
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from autoscaler import Autoscaler, parse_bounds
+from simulator import Simulator
+from models import Job
+
+def test_parse_bounds():
+    """Test: Bounds are MIN:MAX"""
+    assert parse_bounds("2:8") == (2, 8)
+    with pytest.raises(ValueError):
+        parse_bounds("8")
+
+@pytest.mark.asyncio
+async def test_scales_with_queue_depth(tmp_path):
+    """Test: The fleet grows to max_printers under load and shrinks to min_printers once idle"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        Autoscaler(sim, min_printers=1, max_printers=3)
+    autoscaler = Autoscaler(sim, min_printers=1, max_printers=3, target_depth=2, cooldown=0)
+    await sim.start()
+    try:
+        await sim.add_jobs([Job(f"J{i}", "PLA", 20) for i in range(20)])
+        assert [autoscaler.step() for _ in range(3)] == [1, 1, 0]
+        assert sim.num_printers == 3
+
+        sim.cancel_jobs(material="PLA")
+        assert await sim.drain(timeout=5.0)
+        assert [autoscaler.step() for _ in range(3)] == [-1, -1, 0]
+        assert [p.state for p in sim.printers] == ["online", "draining", "draining"]
+        assert autoscaler.added == autoscaler.drained == 2
+    finally:
+        await sim.stop()
+
+@pytest.mark.asyncio
+async def test_scales_with_predicted_wait(tmp_path):
+    """Test: A predicted wait over the target adds a printer, the cooldown holds the next change"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path))
+    autoscaler = Autoscaler(sim, min_printers=1, max_printers=4, target_wait=50, cooldown=60)
+    await sim.start()
+    try:
+        await sim.add_jobs([Job(f"J{i}", "PLA", 30) for i in range(5)])
+        assert autoscaler.predicted_wait() == pytest.approx(120, abs=5)
+        assert autoscaler.step() == 1
+        assert autoscaler.step() == 0 # cooldown
+        assert autoscaler.decide() == 1 # 2 printers still wait 60s for the last job
+    finally:
+        await sim.stop(cancel_running=True)
@@ -0,0 +1,69 @@
+import pytest
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import JobDatabase
+from models import JobRecord
+
+
+def make_record(i: int, wait: float, status: str = "completed") -> JobRecord:
+    start = 100.0 + wait if status == "completed" else 0
+    return JobRecord(
+        job_id=f"J{i}",
+        start_time=start,
+        created_time=100.0,
+        end_time=start + 1.0 if start else 100.0,
+        duration=1.0 if start else 0.0,
+        status=status,
+        priority=1
+    )
+
+
+def test_run_stats_in_sql(tmp_path):
+    """Test: Run aggregates and percentiles are computed per run"""
+    db = JobDatabase(db_path=str(tmp_path / "history.db"))
+    run_id = db.create_run(num_printers=2, time_scale=0.1, started_at=0.0)
+    other_run = db.create_run(num_printers=1, time_scale=0.1, started_at=0.0)
+
+    records = [make_record(i, wait=float(i)) for i in range(1, 101)] + [make_record(200, 0, "cancelled")]
+    db.save_jobs(records, simulation_time=50.0, run_id=run_id)
+    db.save_jobs([make_record(300, wait=1000.0)], simulation_time=1.0, run_id=other_run)
+    db.finish_run(run_id, duration=50.0)
+
+    stats = db.get_run_stats(run_id)
+    assert stats["total_jobs"] == 101
+    assert stats["completed"] == 100
+    assert stats["cancelled"] == 1
+    assert stats["avg_wait_time"] == pytest.approx(50.5)
+    assert stats["p50_wait_time"] == pytest.approx(50.0)
+    assert stats["p95_wait_time"] == pytest.approx(95.0)
+    assert stats["p99_wait_time"] == pytest.approx(99.0)
+    assert stats["throughput"] == pytest.approx(2.0)
+
+    runs = db.list_runs()
+    assert [r["run_id"] for r in runs] == [other_run, run_id]
+    assert runs[1]["job_count"] == 101
+    assert db.get_run_stats(12345) is None
+
+
+def test_migrates_history_without_runs(tmp_path):
+    """Test: Databases created before runs existed get the run_id column and indexes"""
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE job_history (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL,
+                    priority INTEGER, status TEXT, created_time REAL, start_time REAL, end_time REAL,
+                    duration REAL, wait_time REAL, run_time REAL, simulation_timestamp REAL)''')
+    conn.commit()
+    conn.close()
+
+    JobDatabase(db_path=str(path))
+
+    conn = sqlite3.connect(path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(job_history)")]
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list(job_history)")]
+    conn.close()
+    assert "run_id" in columns and "preemptions" in columns
+    assert "idx_job_history_job_id" in indexes
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models import Job, Printer, PrioritizedJob
+from eta import Projection, predict
+from indexed_heap import IndexedHeap
+
+def _entries(*jobs):
+    return [PrioritizedJob(job.priority, i, job) for i, job in enumerate(jobs)]
+
+def test_predict_identical_printers():
+    """Test: Queued jobs go to the printer that frees up first, in priority then FIFO order"""
+    busy = Printer(id=0)
+    busy.start_job(Job("R", "PLA", 10), started_at=0.0)
+    busy.deadline = 4.0
+    printers = [busy, Printer(id=1)]
+    entries = _entries(Job("A", "PLA", 10, priority=1), Job("B", "PLA", 20, priority=0), Job("C", "PLA", 5, priority=1))
+
+    etas = predict(printers, list(reversed(entries)), now=1.0, time_scale=0.1)
+    assert etas["R"].finish == 4.0 and etas["R"].position is None
+    assert (etas["B"].printer_id, etas["B"].start, etas["B"].finish, etas["B"].position) == (1, 1.0, 3.0, 0)
+    assert (etas["A"].printer_id, etas["A"].start, etas["A"].position) == (1, 3.0, 1)
+    assert etas["A"].finish == pytest.approx(4.0)
+    assert etas["C"].printer_id == 0 # both free at 4.0, ties go to the lower id
+    assert etas["C"].finish == pytest.approx(4.5)
+
+def test_predict_fleet_materials_and_speed():
+    """Test: Jobs only go to printers that print their material, at the printer's speed"""
+    printers = [Printer(id=0, materials=frozenset({"PLA"})), Printer(id=1, materials=frozenset({"TPU"}), speed=2.0)]
+    entries = _entries(Job("T1", "TPU", 10), Job("T2", "TPU", 10), Job("P1", "PLA", 10), Job("X", "ABS", 10))
+
+    etas = predict(printers, entries, now=0.0, time_scale=1.0)
+    assert (etas["T1"].printer_id, etas["T1"].finish) == (1, 5.0)
+    assert (etas["T2"].start, etas["T2"].finish) == (5.0, 10.0)
+    assert (etas["P1"].printer_id, etas["P1"].start) == (0, 0.0)
+    assert "X" not in etas # nothing prints ABS
+
+def test_projection_walks_heaps_lazily():
+    """Test: The projection reads the dispatch order off unsorted heaps, as far as asked"""
+    printers = [Printer(id=0, materials=frozenset({"PLA", "PETG"})), Printer(id=1, materials=frozenset({"PLA"}), speed=2.0)]
+    jobs = [Job(f"J{i}", "PLA" if i % 3 else "PETG", 1 + i % 7, priority=(i * 7) % 5) for i in range(300)]
+    heaps = {"PLA": IndexedHeap(), "PETG": IndexedHeap()}
+    entries = _entries(*jobs)
+    for entry in entries:
+        heaps[entry.job.material].push(entry)
+
+    projection = Projection(printers, [heap.entries for heap in heaps.values()], now=0.0, time_scale=1.0)
+    projection.extend(10)
+    assert projection.projected == 10 and len(projection.etas) == 10 and not projection.complete
+    expected = predict(printers, entries, now=0.0, time_scale=1.0)
+    assert projection.find("J299") == expected["J299"]
+    projection.extend(1000)
+    assert projection.complete and projection.etas == expected
+    assert projection.earliest_start("PETG") == max(eta.finish for eta in expected.values() if eta.printer_id == 0)
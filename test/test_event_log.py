@@ -0,0 +1,51 @@
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from event_log import BackgroundLogWriter, _EnqueueHandler, _render_event, LOG_FORMAT
+
+
+class CountingArg:
+    """Argument that counts how many times it is rendered"""
+    def __init__(self):
+        self.renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return "arg"
+
+
+def test_background_writer_batches_and_events(tmp_path):
+    """Test: Records are formatted by the writer, written in batches and events go to NDJSON"""
+    writer = BackgroundLogWriter(batch_size=100, flush_interval=0.05)
+    writer.add_file(tmp_path / "simulation.log", logging.Formatter(LOG_FORMAT).format)
+    writer.add_file(tmp_path / "events.ndjson", _render_event)
+
+    logger = logging.getLogger("test_event_log")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = _EnqueueHandler(writer.records)
+    logger.addHandler(handler)
+    try:
+        arg = CountingArg()
+        logger.info("plain %s", arg)
+        assert arg.renders == 0 # formatting is deferred to the writer
+
+        for i in range(250):
+            logger.info("Printer %s started the job %s", 0, f"J{i}", extra={"event": "job_started", "fields": {"job_id": f"J{i}"}})
+        writer.start()
+        writer.stop()
+    finally:
+        logger.removeHandler(handler)
+
+    lines = (tmp_path / "simulation.log").read_text().splitlines()
+    assert len(lines) == 251
+    assert lines[0].endswith("plain arg")
+    assert arg.renders == 1
+
+    events = [json.loads(line) for line in (tmp_path / "events.ndjson").read_text().splitlines()]
+    assert [e["job_id"] for e in events] == [f"J{i}" for i in range(250)]
+    assert all(e["event"] == "job_started" for e in events)
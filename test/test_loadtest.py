@@ -0,0 +1,31 @@
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from loadtest import LoadTester, in_process_client, parse_mix
+
+
+@pytest.mark.asyncio
+async def test_load_test_in_process(tmp_path, monkeypatch):
+    """Test: Load test drives the mix and reports per endpoint latency"""
+    monkeypatch.setenv("SIMULATOR_OUTPUT_DIR", str(tmp_path))
+    async with in_process_client() as client:
+        tester = LoadTester(client, rate=200, duration=0.5, seed=1)
+        await tester.prefill(20)
+        report = await tester.run()
+
+    endpoints = report['endpoints']
+    assert sum(e['requests'] for e in endpoints.values()) == 100
+    assert endpoints['create']['status_codes'] == {"201": endpoints['create']['requests']}
+    assert endpoints['stats']['p50_ms'] <= endpoints['stats']['p99_ms']
+    assert report['server']['status'] == "healthy"
+    assert report['server']['active_jobs'] >= 20 - endpoints['cancel']['requests']
+
+
+def test_parse_mix():
+    """Test: Mix argument parsing"""
+    assert parse_mix("create=0.7, stats=0.3") == {"create": 0.7, "stats": 0.3}
+    with pytest.raises(ValueError):
+        LoadTester(client=None, rate=10, duration=1, mix={"upload": 1.0})
@@ -0,0 +1,55 @@
+import pytest
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models import Job
+from planner import CapacityPlanner, Workload, simulate_virtual
+
+
+def make_jobs(count: int, est_time: float = 10.0) -> list[Job]:
+    return [Job(id=f"job_{i}", material="PLA", est_time=est_time, priority=i % 3 + 1, arrival_time=float(i)) for i in range(count)]
+
+
+def test_virtual_simulation_waits():
+    """Test: Virtual run matches hand computed waits and cancellations"""
+    jobs = [
+        Job(id="a", material="PLA", est_time=10, priority=2),
+        Job(id="b", material="PLA", est_time=10, priority=1),
+        Job(id="c", material="PLA", est_time=5, priority=3, arrival_time=1),
+        Job(id="d", material="PLA", est_time=5, priority=1, arrival_time=2, cancel_at=3)
+    ]
+    result = simulate_virtual(Workload(jobs), num_printers=1)
+    #b (0-10), a (10-20), c (20-25); d gives up at 3 while queued
+    assert result["completed"] == 3
+    assert result["cancelled"] == 1
+    assert result["max_wait_time"] == 19
+    assert result["makespan"] == 25
+
+    fifo = simulate_virtual(Workload(jobs), num_printers=1, policy="fifo")
+    assert fifo["completed"] == 3 and fifo["p50_wait_time"] == 10 # a, b, c
+
+
+def test_plan_matches_exhaustive_search():
+    """Test: Planner returns the smallest fleet meeting the target"""
+    jobs = make_jobs(200)
+    workload = Workload(jobs)
+    target = 15.0
+    expected = next(p for p in range(1, 201) if simulate_virtual(workload, p)["p95_wait_time"] <= target)
+
+    serial = CapacityPlanner(jobs, workers=1).plan(target_wait=target)
+    assert serial["recommended"]["num_printers"] == expected
+    assert serial["simulations"] < 20
+
+    parallel = CapacityPlanner(jobs, workers=3).plan(target_wait=target, policies=("priority", "fifo", "sjf"))
+    assert parallel["per_policy"]["priority"]["num_printers"] == expected
+    assert parallel["recommended"]["p95_wait_time"] <= target
+
+
+def test_plan_unreachable_target():
+    """Test: Targets no fleet can meet return None"""
+    jobs = make_jobs(10)
+    assert CapacityPlanner(jobs, workers=1).plan(target_wait=-1) is None
+    with pytest.raises(ValueError):
+        CapacityPlanner(jobs, workers=1).plan(target_wait=1, policies=("random",))
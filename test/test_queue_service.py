@@ -0,0 +1,139 @@
+import pytest
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from simulator import Simulator
+from models import Job
+from queue_service import QueueServer, RemoteQueue, QueueClient, QueueServiceError
+from admission import AdmissionControl, Overloaded
+
+def _job(i, **fields):
+    return {"id": f"J{i}", "material": "PLA", "est_time": 100.0, "priority": i % 3, **fields}
+
+@pytest.mark.asyncio
+async def test_remote_queue_batches_calls(tmp_path):
+    """Test: Concurrent calls share round trips, results and errors come back per call"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path), admission=AdmissionControl(max_queue=60))
+    await sim.start()
+    server = QueueServer(sim, str(tmp_path / "queue.sock"))
+    await server.start()
+    remote = RemoteQueue(server.path)
+    try:
+        created = await asyncio.gather(*(remote.add_job(job=_job(i)) for i in range(50)))
+        assert [job["id"] for job in created] == [f"J{i}" for i in range(50)]
+        assert remote.calls == 50
+        assert remote.batches < 50
+
+        with pytest.raises(ValueError):
+            await remote.add_job(job=_job(1))
+        with pytest.raises(Overloaded):
+            await remote.add_jobs(jobs=[_job(i) for i in range(100, 120)])
+        assert await remote.cancel_job(job_id="J49") is True
+        queued = await remote.list_jobs(priority=2)
+        assert {job["id"] for job in queued} == {f"J{i}" for i in range(2, 49, 3)}
+        assert (await remote.health())["active_jobs"] == 49
+        assert (await remote.get_eta(job_id="J10"))["position"] is not None
+    finally:
+        await remote.close()
+        await server.stop()
+        await sim.stop(cancel_running=True)
+
+    with pytest.raises(QueueServiceError): # nothing listens anymore
+        await remote.health()
+
+@pytest.mark.asyncio
+async def test_slow_call_does_not_hold_back_others(tmp_path):
+    """Test: A call blocked by admission control is answered after the calls sent behind it"""
+    admission = AdmissionControl(max_queue=1, policy="block", block_timeout=10)
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path), admission=admission)
+    await sim.start()
+    server = QueueServer(sim, str(tmp_path / "queue.sock"))
+    await server.start()
+    remote = RemoteQueue(server.path)
+    client = QueueClient(server.path)
+    try:
+        await remote.add_job(job=_job(0, est_time=10000.0))
+        await asyncio.sleep(0.1) # J0 runs, J1 fills the queue
+        await remote.add_job(job=_job(1))
+        blocked = asyncio.create_task(remote.add_job(job=_job(2)))
+        await asyncio.sleep(0.1)
+        assert (await asyncio.wait_for(remote.health(), timeout=2))["active_jobs"] == 2
+        assert await asyncio.wait_for(remote.cancel_job(job_id="J1"), timeout=2) is True
+        assert (await asyncio.wait_for(blocked, timeout=5))["id"] == "J2"
+        assert remote.batches == 5
+
+        calls = [("add_jobs", {"jobs": [_job(3)]}), ("health", {})] # health is answered first
+        slow = asyncio.create_task(asyncio.to_thread(client.call_many, calls))
+        await asyncio.sleep(0.1)
+        assert not slow.done()
+        await remote.cancel_job(job_id="J2")
+        jobs, health = await asyncio.wait_for(slow, timeout=5)
+        assert jobs[0]["id"] == "J3" and health["active_jobs"] == 2
+    finally:
+        client.close()
+        await remote.close()
+        await server.stop()
+        await sim.stop(cancel_running=True)
+
+@pytest.mark.asyncio
+async def test_thread_producers(tmp_path):
+    """Test: Threads queue jobs through the blocking client and add_jobs_threadsafe"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path))
+    await sim.start()
+    server = QueueServer(sim, str(tmp_path / "queue.sock"))
+    await server.start()
+    client = QueueClient(server.path)
+
+    def produce():
+        results = client.call_many([("add_job", {"job": _job(i)}) for i in range(10)])
+        sim.add_jobs_threadsafe([Job(**_job(i)) for i in range(10, 20)]).result(timeout=5)
+        with pytest.raises(ValueError):
+            sim.add_jobs_threadsafe([Job(**_job(0))]).result(timeout=5)
+        return results
+
+    try:
+        results = await asyncio.to_thread(produce)
+        assert len(results) == 10
+        assert sim.get_queue_stats()["active_jobs"] == 20
+    finally:
+        client.close()
+        await server.stop()
+        await sim.stop(cancel_running=True)
+
+def test_api_workers_share_the_service(tmp_path):
+    """Test: Two API apps on the queue service see the same jobs"""
+    socket_path = tmp_path / "queue.sock"
+    service = subprocess.Popen(
+        [sys.executable, "src/queue_service.py", "--socket", str(socket_path), "--time-scale", "0.01",
+         "--output-dir", str(tmp_path)],
+        cwd=Path(__file__).parent.parent
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not socket_path.exists():
+            assert service.poll() is None and time.monotonic() < deadline
+            time.sleep(0.1)
+        os.environ["SIMULATOR_QUEUE_SOCKET"] = str(socket_path)
+        os.environ["SIMULATOR_OUTPUT_DIR"] = str(tmp_path)
+        from api import app
+        with TestClient(app) as first:
+            for i in range(3): # two printers, J2 stays queued
+                assert first.post("/jobs", json=_job(i)).status_code == 201
+            assert first.post("/jobs", json=_job(1)).status_code == 400
+            assert first.get("/health").json()["active_jobs"] == 3
+        with TestClient(app) as second:
+            assert sorted(job["id"] for job in second.get("/jobs").json()) == ["J0", "J1", "J2"]
+            assert second.get("/jobs/J2/eta").json()["position"] == 0
+            assert second.delete("/jobs/J2").status_code == 200
+    finally:
+        os.environ.pop("SIMULATOR_QUEUE_SOCKET", None)
+        os.environ.pop("SIMULATOR_OUTPUT_DIR", None)
+        service.terminate()
+        assert service.wait(timeout=30) == 0
@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models import JobRecord
+from record_stats import RecordColumns, breakdown
+
+def _record(i, status="completed", priority=0, material="PLA"):
+    start = 100.0 + i * 2 if status == "completed" else 0
+    return JobRecord(job_id=f"J{i}", start_time=start, created_time=100.0 + i, end_time=100.0 + i * 3 + 1,
+                     duration=0.0, status=status, priority=priority, material=material)
+
+def test_breakdown_matches_numpy():
+    """Test: Percentiles per priority and material match np.percentile over the same rows"""
+    columns = RecordColumns()
+    records = [_record(i, priority=i % 3, material=("PLA", "ABS")[i % 2]) for i in range(200)]
+    records += [_record(200 + i, status="cancelled", priority=2, material="TPU") for i in range(5)]
+    for record in records:
+        columns.append(record)
+    stats = breakdown(columns.arrays(), columns.materials, origin=100.0)
+
+    completed = [r for r in records if r.status == "completed"]
+    waits = np.array([r.start_time - r.created_time for r in completed])
+    assert stats["overall"]["completed"] == 200
+    assert stats["overall"]["cancelled"] == 5
+    for p in (50, 90, 95, 99):
+        assert stats["overall"]["wait_time"][f"p{p}"] == pytest.approx(np.percentile(waits, p))
+
+    assert [g["priority"] for g in stats["by_priority"]] == [0, 1, 2]
+    assert stats["by_priority"][2]["cancelled"] == 5
+    runs = np.array([r.end_time - r.start_time for r in completed if r.priority == 1])
+    assert stats["by_priority"][1]["run_time"]["p90"] == pytest.approx(np.percentile(runs, 90))
+
+    tpu = next(g for g in stats["by_material"] if g["material"] == "TPU")
+    assert tpu["completed"] == 0 and tpu["cancelled"] == 5
+    assert tpu["wait_time"]["p99"] == 0.0
+
+def test_throughput_windows():
+    """Test: Completions are counted per window from the start of the run"""
+    columns = RecordColumns()
+    for i in range(10):
+        columns.append(_record(i))
+    stats = breakdown(columns.arrays(), columns.materials, origin=100.0, window=10.0)
+    # ends at 1, 4, ..., 28 seconds
+    assert [w["completed"] for w in stats["throughput"]] == [3, 4, 3]
+    assert stats["throughput"][1]["throughput"] == 0.4
+    with pytest.raises(ValueError):
+        breakdown(columns.arrays(), columns.materials, origin=100.0, window=1e-9)
+
+def test_record_columns_drop_left():
+    """Test: Dropped rows leave the columns, compaction keeps the live rows"""
+    columns = RecordColumns()
+    for i in range(10):
+        columns.append(_record(i))
+    columns.drop_left(3)
+    assert len(columns) == 7
+    columns.drop_left(3) # compacts
+    columns.append(_record(10))
+    assert len(columns) == 5
+    assert columns.arrays()["created"].tolist() == [106.0, 107.0, 108.0, 109.0, 110.0]
+
+def test_empty_breakdown():
+    """Test: No records gives zeros"""
+    columns = RecordColumns()
+    stats = breakdown(columns.arrays(), columns.materials)
+    assert stats["overall"]["completed"] == 0
+    assert stats["by_priority"] == [] and stats["throughput"] == []
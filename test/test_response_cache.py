@@ -0,0 +1,32 @@
+import time
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from response_cache import ResponseCache, etag_matches
+
+def test_entries_follow_the_version():
+    """Test: A body is served while its version is current and younger than max_age"""
+    cache = ResponseCache(max_entries=2)
+    assert cache.lookup("jobs", (1, 0)) is None
+    body, etag = cache.store("jobs", (1, 0), [{"id": "J1", "priority": 0}])
+    assert body == b'[{"id":"J1","priority":0}]'
+    assert cache.lookup("jobs", (1, 0)) == (body, etag)
+    assert cache.lookup("jobs", (2, 0)) is None
+    assert cache.store("jobs", (2, 0), [{"id": "J1", "priority": 0}])[1] == etag # same body, same tag
+
+    cache.store("stats", (2, 0), {"throughput": 1.0})
+    time.sleep(0.02)
+    assert cache.lookup("stats", (2, 0), max_age=0.01) is None
+    assert cache.lookup("stats", (2, 0)) is not None
+    cache.store("other", (2, 0), {})
+    assert cache.lookup("jobs", (2, 0)) is None # least recently used
+    assert (cache.hits, cache.misses) == (2, 4)
+
+def test_etag_matches():
+    """Test: If-None-Match lists, weak tags and * match"""
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"c"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
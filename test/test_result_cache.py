@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from result_cache import ResultCache, cache_key, file_digest, jobs_digest
+
+CONFIG = {"engine": "realtime", "engine_version": 1, "printers": 2, "fleet": None, "time_scale": 0.1}
+
+def test_cache_key_content_addressed(tmp_path):
+    """Test: The key follows the workload contents and the config, not the file name"""
+    a = tmp_path / "a.json"
+    b = tmp_path / "b.json"
+    a.write_text(json.dumps({"jobs": [{"id": "J1"}]}))
+    b.write_text(json.dumps({"jobs": [{"id": "J1"}]}))
+    assert cache_key(file_digest(a), CONFIG) == cache_key(file_digest(b), CONFIG)
+
+    b.write_text(json.dumps({"jobs": [{"id": "J2"}]}))
+    assert cache_key(file_digest(a), CONFIG) != cache_key(file_digest(b), CONFIG)
+    assert cache_key(file_digest(a), CONFIG) != cache_key(file_digest(a), {**CONFIG, "engine_version": 2})
+    assert jobs_digest([{"id": "J1", "priority": 1}]) == jobs_digest([{"priority": 1, "id": "J1"}])
+
+def test_put_get_restore(tmp_path):
+    """Test: A stored entry returns its result and restores its files"""
+    cache = ResultCache(str(tmp_path / "cache"))
+    report = tmp_path / "job_report_1.json"
+    report.write_text('{"jobs": []}')
+    assert cache.get("k1") is None
+    assert cache.put("k1", {"total_completed": 3}, CONFIG, [report])
+
+    entry = cache.restore("k1", str(tmp_path / "out"))
+    assert entry["result"] == {"total_completed": 3}
+    assert entry["config"] == CONFIG
+    assert (tmp_path / "out" / "job_report_1.json").read_text() == '{"jobs": []}'
+    assert not [p for p in (tmp_path / "cache").iterdir() if p.name.startswith(".tmp")]
+
+def test_lru_eviction(tmp_path):
+    """Test: Past max_bytes the least recently used entries are removed"""
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=2500)
+    payload = tmp_path / "payload.bin"
+    payload.write_bytes(b"x" * 1000)
+    cache.put("old", {}, CONFIG, [payload])
+    cache.put("used", {}, CONFIG, [payload])
+    manifest = tmp_path / "cache" / "old" / "entry.json"
+    os.utime(manifest, (1, 1)) # "old" was used long ago
+    cache.put("new", {}, CONFIG, [payload])
+
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.get("new") is not None
+
+    big = tmp_path / "big.bin"
+    big.write_bytes(b"x" * 5000)
+    assert not cache.put("big", {}, CONFIG, [big])
+    assert cache.get("big") is None
@@ -0,0 +1,58 @@
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from simulation_service import SimulationService, ServiceBusy, run_simulation
+from result_cache import ResultCache
+
+def _request(count, **config):
+    jobs = [{"id": f"J{i}", "material": "PLA", "est_time": 10.0, "priority": i % 2, "arrival_time": float(i)}
+            for i in range(count)]
+    return {"jobs": jobs, **config}
+
+def test_run_simulation_virtual(tmp_path):
+    """Test: The worker entry point runs the virtual engine in process"""
+    result = run_simulation(_request(10, num_printers=10, policy="fifo"), str(tmp_path))
+    assert result["completed"] == 10
+    assert result["max_wait_time"] == 0.0
+
+@pytest.mark.asyncio
+async def test_service_limits_and_results(tmp_path):
+    """Test: Submissions beyond workers + pending are refused, finished runs are kept up to max_results"""
+    service = SimulationService(max_workers=1, max_pending=1, max_results=1, output_dir=str(tmp_path))
+    try:
+        first = service.submit(_request(5))
+        second = service.submit(_request(5, num_printers=3))
+        with pytest.raises(ServiceBusy):
+            service.submit(_request(5))
+        with pytest.raises(ValueError):
+            service.submit(_request(5, engine="quantum"))
+
+        while service.active:
+            await service.wait_change(second["id"], timeout=1.0)
+        assert service.get(first["id"]) is None # evicted, only the last finished run is kept
+        assert service.get(second["id"])["status"] == "completed"
+        assert service.get(second["id"])["result"]["num_printers"] == 3
+    finally:
+        await service.shutdown()
+
+@pytest.mark.asyncio
+async def test_service_cached_results(tmp_path):
+    """Test: A repeated request completes from the cache without running again"""
+    service = SimulationService(max_workers=1, max_pending=0, output_dir=str(tmp_path), cache=ResultCache(str(tmp_path / "cache")))
+    try:
+        first = service.submit(_request(5, num_printers=2))
+        while service.active:
+            await service.wait_change(first["id"], timeout=1.0)
+        assert first["status"] == "completed" and not first["cached"]
+
+        second = service.submit(_request(5, num_printers=2, time_scale=0.5)) # realtime-only field, same virtual run
+        assert second["status"] == "completed"
+        assert second["cached"]
+        assert second["result"] == first["result"]
+        assert not service.submit(_request(5, num_printers=3))["cached"]
+    finally:
+        await service.shutdown()
@@ -1,37 +1,45 @@
 import pytest
 import pytest_asyncio
 import asyncio
+import json
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from models import Job
+from eta import HORIZON
+from models import Job, Printer, PrioritizedJob, build_fleet
+from timeline import BusyTimeline
+from visualizer import Visualizer
 from simulator import Simulator
-from json_manager import load_jobs_from_json
+from queue_manager import ThreadSafePriorityQueue
+from indexed_heap import IndexedHeap
+import indexed_heap
+import simulator
+from json_manager import load_jobs_from_json, load_fleet_from_json
 
 #Tests will folow a 10%
 
 @pytest_asyncio.fixture
-async def one_printer_sim():
+async def one_printer_sim(tmp_path):
     """Fixture for one printer"""
-    sim = Simulator(num_printers=1, time_scale=0.1)
+    sim = Simulator(num_printers=1, time_scale=0.1, output_dir=str(tmp_path))
     await sim.start()
     yield sim
     await sim.stop()
 
 @pytest_asyncio.fixture
-async def two_printer_sim():
+async def two_printer_sim(tmp_path):
     """Fixture for two printer"""
-    sim = Simulator(num_printers=2, time_scale=0.1)
+    sim = Simulator(num_printers=2, time_scale=0.1, output_dir=str(tmp_path))
     await sim.start()
     yield sim
     await sim.stop()
 
 @pytest_asyncio.fixture
-async def three_printer_sim():
+async def three_printer_sim(tmp_path):
     """Fixture for three printer"""
-    sim = Simulator(num_printers=3, time_scale=0.1)
+    sim = Simulator(num_printers=3, time_scale=0.1, output_dir=str(tmp_path))
     await sim.start()
     yield sim
     await sim.stop()
@@ -75,9 +83,9 @@ async def test_cancel_already_cancelled(one_printer_sim):
     assert sim.cancel_job("J1") == False 
 
 @pytest.mark.asyncio
-async def test_load_balancing():
+async def test_load_balancing(tmp_path):
     """Test: balancing a load for 3 printers and FIFO order"""
-    sim = Simulator(num_printers=3, time_scale=0.1)
+    sim = Simulator(num_printers=3, time_scale=0.1, output_dir=str(tmp_path))
     
     jobs = [Job(f"J{i}", "PLA", 10, priority=1) for i in range(12)]
 
@@ -153,9 +161,9 @@ async def test_stats_no_jobs(one_printer_sim):
     assert(all(u == 0 for u in utilization))
 
 @pytest.mark.asyncio
-async def test_bulk_processing():
+async def test_bulk_processing(tmp_path):
     """Test: Simulator in bulk """
-    sim = Simulator(num_printers=3, time_scale=0.01)
+    sim = Simulator(num_printers=3, time_scale=0.01, output_dir=str(tmp_path))
     
     jobs = [Job(f"J{i}", "PLA", 10, priority=1) for i in range(3000)]
 
@@ -217,3 +225,577 @@ async def test_json_error_handling():
 
     jobs = load_jobs_from_json("test.json")
     assert jobs == []
+
+
+def test_printer_timeline_utilization():
+    """Test: Busy intervals are binned into utilization over time"""
+    printer = Printer(id=0)
+    printer.timeline.add(0.0, 5.0)
+    printer.timeline.add(7.5, 10.0)
+
+    utilization = printer.get_utilization_over_time(start=0.0, end=10.0, bins=4)
+
+    assert utilization == pytest.approx([100.0, 100.0, 0.0, 100.0])
+    assert printer.timeline.total_busy_time == pytest.approx(7.5)
+
+
+def test_printer_timeline_chart_large(tmp_path):
+    """Test: Timeline chart stays bounded with many intervals"""
+    timeline = BusyTimeline()
+    for i in range(1000):
+        timeline.add(i * 1.0, i * 1.0 + 0.25)
+
+    starts, _ = timeline.merged(min_gap=1.0)
+    assert len(starts) == 1
+
+    timelines = {i: timeline for i in range(6)} # 6000 segments, drawn as a heatmap
+    filepath = Visualizer(dir=str(tmp_path)).plot_printer_timeline(timelines, start_time=0.0, end_time=1000.0)
+    assert filepath.exists()
+
+
+@pytest.mark.asyncio
+async def test_timed_arrivals(one_printer_sim):
+    """Test: Jobs with an arrival time are released on schedule and cancelled at cancel_at"""
+    sim = one_printer_sim
+
+    jobs = [
+        Job("J1", "PLA", 1, priority=1),
+        Job("J2", "PLA", 3, priority=1, arrival_time=5), # released after 0.5s, runs until 0.8s
+        Job("J3", "PLA", 100, priority=2, arrival_time=5, cancel_at=6), # still queued at 0.6s
+    ]
+    await sim.add_jobs(jobs)
+
+    assert [j.id for j in sim.get_active_jobs()] == ["J1", "J2", "J3"] # queued, then waiting to arrive
+    assert sim.get_queue_stats()['active_jobs'] == 1
+    assert sim.get_queue_stats()['pending_arrivals'] == 2
+
+    await asyncio.sleep(1.0)
+
+    records = {r.job_id: r for r in sim.get_job_records()}
+    assert records["J2"].created_time - records["J1"].created_time == pytest.approx(0.5, abs=0.1)
+    assert records["J2"].status == "completed"
+    assert records["J3"].status == "cancelled"
+    assert sim.get_queue_stats()['pending_arrivals'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_pending_arrival(one_printer_sim):
+    """Test: A job that has not arrived yet can be cancelled and is never released"""
+    sim = one_printer_sim
+
+    await sim.add_job(Job("A", "PLA", 1, priority=1, arrival_time=2))
+    assert sim.cancel_job("A") == True
+    assert sim.cancel_job("A") == False
+    assert sim.get_queue_stats()['pending_arrivals'] == 0
+
+    await asyncio.sleep(0.5)
+
+    assert sim.get_active_jobs() == []
+    assert [(r.job_id, r.status) for r in sim.get_job_records()] == [("A", "cancelled")]
+
+    with pytest.raises(ValueError):
+        Job("B", "PLA", 1, arrival_time=5, cancel_at=2) # cancelled before it arrives
+
+
+def test_load_ndjson_with_arrivals(tmp_path):
+    """Test: NDJSON workloads keep arrival and cancel times"""
+    filepath = tmp_path / "workload.ndjson"
+    filepath.write_text(
+        '{"id": "A", "material": "PLA", "est_time": 10, "priority": 1, "arrival_time": 2.5}\n'
+        '\n'
+        '{"id": "B", "material": "ABS", "est_time": 5, "priority": 0, "cancel_at": 3}\n'
+    )
+    jobs = load_jobs_from_json(str(filepath))
+
+    assert [(j.id, j.arrival_time, j.cancel_at) for j in jobs] == [("A", 2.5, None), ("B", None, 3)]
+
+
+@pytest.mark.asyncio
+async def test_stop_cancel_running(tmp_path):
+    """Test: stop can interrupt running jobs instead of waiting for them"""
+    sim = Simulator(num_printers=1, time_scale=0.1, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job("LONG", "PLA", 10**6, priority=1), Job("NEXT", "PLA", 1, priority=2)])
+    await asyncio.sleep(0.1)
+
+    await asyncio.wait_for(sim.stop(cancel_running=True), timeout=5)
+    await sim.stop() # second stop is a no-op
+
+    records = {r.job_id: r.status for r in sim.get_job_records()}
+    assert records == {"LONG": "cancelled"}
+    assert sim.printers[0].total_busy_time > 0
+
+
+@pytest.mark.asyncio
+async def test_queue_stats_counters(one_printer_sim):
+    """Test: Live status counters follow every transition"""
+    sim = one_printer_sim
+
+    await sim.add_jobs([Job(f"J{i}", "PLA", 1, priority=1) for i in range(4)])
+    await asyncio.sleep(0.05) # J0 is running
+    sim.cancel_job("J3")
+
+    stats = sim.get_queue_stats()
+    assert (stats['queued'], stats['running'], stats['completed'], stats['cancelled']) == (2, 1, 0, 1)
+    assert stats['active_jobs'] == 3
+
+    await asyncio.sleep(0.5)
+    stats = sim.get_queue_stats()
+    assert (stats['queued'], stats['running'], stats['completed'], stats['cancelled']) == (0, 0, 3, 1)
+    assert stats['total_processed'] == 4
+
+
+@pytest.mark.asyncio
+async def test_instrumentation_phases(tmp_path):
+    """Test: Hot-path timers are only collected when enabled and profiles are dumped"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path), instrument=True)
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 1, priority=1) for i in range(5)])
+    filepath = await sim.instrumentation.profile_window("cprofile", 0.2)
+    await sim.stop()
+
+    phases = sim.instrumentation.snapshot()['phases']
+    assert phases['enqueue']['count'] == 5
+    assert phases['completion']['count'] == 5
+    assert {'dequeue', 'dispatch', 'sleep_error', 'logging'} <= set(phases)
+    assert filepath.exists() and filepath.parent == tmp_path
+
+    disabled = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path))
+    await disabled.add_job(Job("J", "PLA", 1))
+    assert disabled.instrumentation.snapshot()['phases'] == {}
+
+
+@pytest.mark.asyncio
+async def test_multi_material_waiter_is_woken_once(tmp_path):
+    """Test: Puts of different materials back to back wake a printer of both materials only once"""
+    queue = ThreadSafePriorityQueue()
+    materials = frozenset({"PLA", "PETG"})
+    waiter = asyncio.create_task(queue.get(materials))
+    timed_out = asyncio.create_task(asyncio.wait_for(queue.get(frozenset({"ABS", "PLA"})), timeout=0.01))
+    await asyncio.sleep(0.05) # the second waiter's future is cancelled but still registered for PLA
+    await queue.put(Job("A", "PLA", 10))
+    await queue.put(Job("B", "PETG", 10))
+    await queue.put_many([Job("C", "PLA", 10), Job("D", "PETG", 10)])
+    assert (await waiter).id == "A"
+    with pytest.raises(asyncio.TimeoutError):
+        await timed_out
+    assert queue.get_status_counts()["queue"] == 3
+
+    sim = Simulator(time_scale=0.01, output_dir=str(tmp_path), fleet=load_fleet_from_json(str(Path(__file__).parent.parent / "test_data" / "sample_fleet.json")))
+    await sim.start()
+    await asyncio.sleep(0.01)
+    await sim.add_jobs([Job("P", "PLA", 10), Job("G", "PETG", 10)])
+    await sim.add_jobs([Job(f"J{i}", ("PLA", "PETG", "TPU")[i % 3], 10, arrival_time=i) for i in range(10)])
+    assert await sim.drain(timeout=5.0)
+    await sim.stop()
+    assert sim.final_stats["total_completed"] == 12
+
+@pytest.mark.asyncio
+async def test_deadline_timing_does_not_drift(tmp_path):
+    """Test: Back to back jobs follow absolute deadlines, so loop overhead does not accumulate"""
+    sim = Simulator(num_printers=1, time_scale=0.001, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 10, priority=1) for i in range(200)]) # 200 * 10ms
+    await asyncio.sleep(2.5)
+    await sim.stop()
+
+    records = sorted(sim.get_job_records(), key=lambda r: r.end_time)
+    assert len(records) == 200
+    span = records[-1].end_time - records[0].start_time
+    assert span == pytest.approx(2.0, abs=0.05)
+
+    timing = sim.get_global_stats()['timing_error']
+    assert timing['jobs'] == 200
+    assert timing['max_abs_error'] < 0.05
+
+@pytest.mark.asyncio
+async def test_busy_intervals_do_not_overlap(tmp_path):
+    """Test: Jobs shorter than the loop overhead keep utilization at or below 100%"""
+    sim = Simulator(num_printers=1, time_scale=0.001, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 1) for i in range(1000)]) # 1000 * 1ms
+    assert await sim.drain(timeout=10.0)
+    live = sim.get_global_stats()["printer_utilization"][0]["utilization_percent"]
+    await sim.stop()
+
+    timeline = sim.printers[0].timeline
+    assert len(timeline) == 1000
+    assert (timeline.starts[1:] >= timeline.ends[:-1]).all()
+    assert live <= 100.0
+    assert sim.final_stats["printer_utilization"][0]["utilization_percent"] <= 100.0
+
+
+@pytest.mark.asyncio
+async def test_heterogeneous_fleet_dispatch(tmp_path):
+    """Test: Printers only take materials they support and run at their own speed"""
+    fleet = [
+        {"class": "fast", "speed": 2.0, "materials": ["PLA"]},
+        {"class": "flex", "materials": ["TPU"]}
+    ]
+    sim = Simulator(time_scale=0.1, output_dir=str(tmp_path), fleet=fleet)
+    await sim.start()
+    jobs = [Job("T1", "TPU", 2, priority=0), Job("T2", "TPU", 2, priority=0), Job("P1", "PLA", 4, priority=5)]
+    await sim.add_jobs(jobs)
+    with pytest.raises(ValueError):
+        await sim.add_job(Job("A1", "ABS", 1))
+    await asyncio.sleep(0.1)
+
+    #P1 has the lowest priority but the TPU printer cannot take it, so it starts at once
+    assert sim.printers[0].current_job.id == "P1"
+    assert sim.printers[1].current_job.id == "T1"
+    await asyncio.sleep(0.5)
+    await sim.stop()
+
+    records = {r.job_id: r for r in sim.get_job_records()}
+    assert records["P1"].duration == pytest.approx(0.2, abs=0.05) # 4 / 2.0 * 0.1
+    assert records["T1"].status == records["T2"].status == "completed"
+    classes = {c["printer_class"]: c for c in sim.get_global_stats()["class_utilization"]}
+    assert set(classes) == {"fast", "flex"} and classes["flex"]["printers"] == 1
+
+
+def test_build_fleet_validation():
+    """Test: Fleet specs are expanded in order and validated"""
+    printers = build_fleet([{"count": 2}, {"class": "fast", "speed": 3, "materials": ["PLA"]}])
+    assert [(p.id, p.printer_class, p.speed) for p in printers] == [(0, "standard", 1.0), (1, "standard", 1.0), (2, "fast", 3)]
+    assert printers[2].can_print("PLA") and not printers[2].can_print("ABS")
+    for spec in ({"speed": 0}, {"count": 0}, {"materials": []}, {"colour": "red"}):
+        with pytest.raises(ValueError):
+            build_fleet([spec])
+
+
+@pytest.mark.asyncio
+async def test_put_many_matches_per_job_order():
+    """Test: Bulk enqueue gives the same dispatch order as one put per job"""
+    def make():
+        return [Job(f"J{i}", ("PLA", "ABS")[i % 2], 1, priority=(i * 7) % 4) for i in range(200)]
+
+    single, bulk = ThreadSafePriorityQueue(), ThreadSafePriorityQueue()
+    for job in make()[:50]:
+        await single.put(job)
+    for job in make()[50:]:
+        await single.put(job)
+    jobs = make()
+    await bulk.put_many(jobs[:50])
+    await bulk.put_many(jobs[50:]) # merged into non-empty heaps
+    bulk.cancel_job("J10")
+    single.cancel_job("J10")
+
+    assert bulk.get_status_counts()["queue"] == single.get_status_counts()["queue"] == 199
+    assert [(await bulk.get()).id for _ in range(199)] == [(await single.get()).id for _ in range(199)]
+    with pytest.raises(ValueError):
+        await bulk.put_many([jobs[10]]) # cancelled jobs cannot be queued again
+
+
+@pytest.mark.asyncio
+async def test_put_many_wakes_each_waiter_once():
+    """Test: A batch wakes only as many idle printers as it can keep busy"""
+    queue = ThreadSafePriorityQueue()
+    getters = [asyncio.create_task(queue.get()) for _ in range(3)]
+    await asyncio.sleep(0)
+    await queue.put_many([Job("A", "PLA", 1), Job("B", "PLA", 1)])
+    await asyncio.sleep(0)
+
+    done = [t for t in getters if t.done()]
+    assert sorted(t.result().id for t in done) == ["A", "B"]
+    assert len(queue._waiters[None]) == 1
+    getters[2].cancel()
+
+
+@pytest.mark.asyncio
+async def test_bulk_cancel_with_indexes(tmp_path):
+    """Test: Bulk cancel matches queued and pending jobs through the secondary indexes"""
+    sim = Simulator(num_printers=1, time_scale=0.1, output_dir=str(tmp_path))
+    jobs = [Job(f"J{i}", ("PLA", "TPU")[i % 2], 1, priority=i % 4, tag=("a", "b")[i % 3 == 0]) for i in range(40)]
+    jobs.append(Job("LATE", "TPU", 1, priority=3, arrival_time=100))
+    await sim.add_jobs(jobs)
+
+    expected = sorted(j.id for j in jobs if j.material == "TPU" and j.priority >= 2)
+    assert sorted(j.id for j in sim.find_jobs(material="TPU", min_priority=2)) == expected
+    assert sorted(sim.cancel_jobs(material="TPU", min_priority=2)) == expected
+    assert sim.find_jobs(material="TPU", min_priority=2) == []
+    assert "LATE" not in sim._pending_jobs
+
+    tagged = sorted(j.id for j in jobs if j.tag == "b" and j.id not in expected)
+    assert sorted(sim.cancel_jobs(tag="b")) == tagged
+    stats = sim.get_queue_stats()
+    assert stats["queued"] == 41 - len(expected) - len(tagged)
+    assert stats["cancelled"] == len(expected) + len(tagged)
+    with pytest.raises(ValueError):
+        sim.cancel_jobs()
+
+    #cancelled jobs are removed from the heaps, the remaining jobs still come out in priority order
+    remaining = []
+    while sim.get_queue_stats()["queued"]:
+        remaining.append(await sim._queue.get())
+    assert [j.priority for j in remaining] == sorted(j.priority for j in remaining)
+
+
+def test_indexed_heap_operations():
+    """Test: Removal and priority changes keep the heap ordered and the positions in sync"""
+    import random
+    rng = random.Random(3)
+    heap = IndexedHeap()
+    entries = {}
+    for i in range(300):
+        entry = PrioritizedJob(rng.randint(0, 5), i, Job(f"J{i}", "PLA", 1))
+        entries[entry.job.id] = entry
+        heap.push(entry)
+    for i in rng.sample(range(300), 100):
+        heap.update_priority(f"J{i}", rng.randint(0, 5))
+    removed = rng.sample(sorted(entries), 50)
+    for job_id in removed[:10]:
+        heap.remove(job_id)
+    heap.remove_many(removed[10:])
+    assert len(heap) == 250 and removed[0] not in heap
+    with pytest.raises(ValueError):
+        heap.push(entries[next(j for j in entries if j not in removed)])
+
+    popped = [heap.pop() for _ in range(250)]
+    assert popped == sorted(e for j, e in entries.items() if j not in removed)
+
+
+@pytest.mark.asyncio
+async def test_reprioritize_in_place():
+    """Test: Reprioritized jobs move without growing the heap and keep their FIFO position"""
+    queue = ThreadSafePriorityQueue()
+    await queue.put_many([Job(f"J{i}", "PLA", 1, priority=5) for i in range(6)])
+    assert queue.reprioritize("J4", 1).priority == 1
+    assert queue.reprioritize("J2", 1) is not None
+    assert queue.reprioritize("J0", 9) is not None
+    assert queue.reprioritize("missing", 1) is None
+    with pytest.raises(ValueError):
+        queue.reprioritize("J1", -1)
+    assert len(queue._heaps["PLA"]) == 6
+    assert [j.id for j in queue.find_queued(priority=1)] == ["J4", "J2"]
+
+    order = [(await queue.get()).id for _ in range(6)]
+    assert order == ["J2", "J4", "J1", "J3", "J5", "J0"]
+    assert queue.reprioritize("J2", 0) is None # running
+
+
+@pytest.mark.asyncio
+async def test_record_retention_spills_to_database(tmp_path):
+    """Test: Only a bounded window of records stays in memory, records and stats read both tiers"""
+    sim = Simulator(num_printers=2, time_scale=0.001, output_dir=str(tmp_path), max_records=10)
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 1, priority=1) for i in range(60)])
+    await sim.add_job(Job("LATE", "PLA", 1, arrival_time=10**6))
+    sim.cancel_job("LATE")
+    await asyncio.sleep(0.5)
+
+    queue_stats = sim.get_queue_stats()
+    assert queue_stats["records_in_memory"] <= 11
+    assert queue_stats["records_in_memory"] + queue_stats["records_spilled"] == 61
+    records = sim.get_job_records()
+    assert sorted(r.job_id for r in records) == sorted([f"J{i}" for i in range(60)] + ["LATE"])
+    stats = sim.get_global_stats()
+    assert stats["total_completed"] == 60
+    assert stats["breakdown"]["overall"]["completed"] == 60 # spilled rows are read back from SQLite
+    assert stats["breakdown"]["by_material"][0]["material"] == "PLA"
+    assert stats["breakdown"]["by_material"][0]["cancelled"] == 1
+
+    await sim.stop()
+    assert sim.database.get_run_stats(sim.run_id)["total_jobs"] == 61 # spilled records are not saved twice
+    report = json.loads(next(f for f in sim.output_files if f.name.startswith("job_report")).read_text())
+    assert sorted(job["job_id"] for job in report["jobs"]) == sorted([f"J{i}" for i in range(60)] + ["LATE"])
+
+
+@pytest.mark.asyncio
+async def test_record_retention_by_age():
+    """Test: Records older than max_record_age are spilled on the next record"""
+    spilled = []
+    queue = ThreadSafePriorityQueue(max_record_age=0.05, spill=spilled.extend)
+    await queue.put_many([Job("A", "PLA", 1), Job("B", "PLA", 1)])
+    queue.cancel_job("A")
+    await asyncio.sleep(0.1)
+    queue.cancel_job("B")
+    assert [r.job_id for r in spilled] == ["A"]
+    assert [r.job_id for r in queue.get_job_records()] == ["B"]
+    assert queue.spilled_count == 1
+    assert len(queue.record_columns) == 1
+
+@pytest.mark.asyncio
+async def test_export_archive(tmp_path):
+    """Test: A finished run is exported as a columnar archive"""
+    from archive import RunArchive
+    sim = Simulator(num_printers=2, time_scale=0.01, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 5, priority=i) for i in range(4)] + [Job("late", "PLA", 5, arrival_time=50)])
+    sim.cancel_job("late")
+    assert await sim.drain(timeout=5)
+    await sim.stop()
+
+    archive = RunArchive(str(sim.export_archive(str(tmp_path / "archive"))))
+    summary = archive.summary()
+    assert summary["completed"] == 4
+    assert summary["cancelled"] == 1
+    assert archive.manifest["run_id"] == sim.run_id
+    assert sorted(archive.job_ids()) == ["J0", "J1", "J2", "J3", "late"]
+    assert (archive["created"] >= 0).all()
+
+@pytest.mark.asyncio
+async def test_export_archive_with_retention(tmp_path):
+    """Test: Records of a run that spilled are archived and counted once after stop"""
+    from archive import RunArchive
+    sim = Simulator(num_printers=2, time_scale=0.001, output_dir=str(tmp_path), max_records=10)
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 1) for i in range(30)])
+    assert await sim.drain(timeout=5)
+    await sim.stop()
+    assert sim.get_queue_stats()["records_spilled"] > 0
+
+    archive = RunArchive(str(sim.export_archive(str(tmp_path / "archive"))))
+    assert sorted(archive.job_ids()) == sorted(f"J{i}" for i in range(30))
+    assert len(sim.get_job_records()) == 30
+    assert sim.get_breakdown_stats()["overall"]["completed"] == 30
+
+@pytest.mark.asyncio
+async def test_eta_follows_queue_changes(tmp_path):
+    """Test: ETAs come from the queue order and are recomputed after a change"""
+    sim = Simulator(num_printers=1, time_scale=0.1, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job("J1", "PLA", 10), Job("J2", "PLA", 10, priority=1), Job("J3", "PLA", 10, priority=2)])
+    await sim.add_job(Job("LATE", "PLA", 10, arrival_time=100))
+    await asyncio.sleep(0.1)
+
+    running, second, third = sim.get_eta("J1"), sim.get_eta("J2"), sim.get_eta("J3")
+    assert running["status"] == "running" and running["position"] is None
+    assert second["position"] == 0 and third["position"] == 1
+    assert second["start_in"] == pytest.approx(running["finish_in"], abs=0.05)
+    assert third["start_in"] == pytest.approx(running["finish_in"] + 1.0, abs=0.05)
+    assert sim.predict_schedule() is sim.predict_schedule() # cached while nothing changes
+    assert sim.get_eta("LATE")["status"] == "pending"
+
+    sim.cancel_job("J2")
+    assert sim.get_eta("J3")["position"] == 0
+    assert sim.get_eta("J2") is None
+    await sim.stop(cancel_running=True)
+
+@pytest.mark.asyncio
+async def test_eta_projects_up_to_the_horizon(tmp_path):
+    """Test: A query only projects as far as its job, jobs past the horizon get a lower bound"""
+    sim = Simulator(num_printers=1, time_scale=0.1, output_dir=str(tmp_path))
+    count = HORIZON + 100
+    await sim.add_jobs([Job(f"J{i}", "PLA", 10, priority=i * 3 // count) for i in range(count)])
+
+    assert sim.get_eta("J0")["position"] == 0
+    assert sim.projection().projected <= 1024
+    last = sim.get_eta(f"J{count - 1}")
+    assert last["beyond_horizon"] and "position" not in last
+    assert sim.projection().projected == HORIZON
+    assert last["start_in"] == pytest.approx(HORIZON * 1.0, abs=1)
+    assert len(sim.predict_schedule(limit=10)) == HORIZON # already projected
+
+@pytest.mark.asyncio
+async def test_add_and_drain_printers(tmp_path):
+    """Test: Printers join and leave a running fleet, utilization covers only their time online"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path))
+    await sim.start()
+    await sim.add_jobs([Job(f"J{i}", "PLA", 10) for i in range(8)])
+    await asyncio.sleep(0.05)
+    added = sim.add_printers({"class": "fast", "speed": 2.0})
+    assert [p.id for p in added] == [1]
+    assert added[0].joined_at is not None
+
+    drained = sim.drain_printer(0)
+    assert drained.state == "draining"
+    assert sim.drain_printer(0) is None
+    with pytest.raises(ValueError):
+        sim.drain_printer(1) # last printer taking jobs
+
+    assert await sim.drain(timeout=5.0)
+    await asyncio.sleep(0.01)
+    assert sim.printers[0].state == "removed"
+    assert sim.num_printers == 1
+    await sim.stop()
+
+    stats = sim.final_stats
+    assert stats["total_completed"] == 8
+    by_id = {p["printer_id"]: p for p in stats["printer_utilization"]}
+    assert by_id[0]["online_time"] < stats["total_simulation_time"]
+    assert by_id[1]["online_time"] < stats["total_simulation_time"]
+    assert 0 < by_id[1]["utilization_percent"] <= 100
+    assert {c["printer_class"] for c in stats["class_utilization"]} == {"standard", "fast"}
+
+@pytest.mark.asyncio
+async def test_drain_keeps_a_printer_per_waiting_material(tmp_path):
+    """Test: A printer cannot leave while it is the only one able to print a waiting job"""
+    sim = Simulator(fleet=[{"materials": ["PLA"]}, {"materials": ["ABS"]}, {}], output_dir=str(tmp_path))
+    await sim.add_jobs([Job("A", "ABS", 10)])
+    assert sim.drain_printer(1).state == "removed" # not started, it never joins
+    with pytest.raises(ValueError):
+        sim.drain_printer(2)
+    assert sim.drain_printer(0).state == "removed"
+    assert sim.num_printers == 1
+    await sim.start()
+    assert sim.predict_schedule()["A"].printer_id == 2
+    await sim.stop(cancel_running=True)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["resume", "restart"])
+async def test_urgent_job_preempts_a_running_job(tmp_path, mode):
+    """Test: An urgent job suspends a less urgent running one, which then resumes or restarts"""
+    sim = Simulator(num_printers=1, time_scale=0.01, output_dir=str(tmp_path), preemption=mode)
+    await sim.start()
+    await sim.add_job(Job("LONG", "PLA", 50, priority=2))
+    await asyncio.sleep(0.2)
+    await sim.add_job(Job("NEXT", "PLA", 10, priority=2)) # not urgent, waits
+    await sim.add_job(Job("URGENT", "PLA", 10, priority=0))
+    await asyncio.sleep(0.05)
+    assert sim.printers[0].current_job.id == "URGENT"
+    assert sim.get_eta("LONG")["position"] == 0 # ahead of NEXT, it started first
+    assert await sim.drain(timeout=5.0)
+    await sim.stop()
+
+    records = {r.job_id: r for r in sim.get_job_records()}
+    assert [r.job_id for r in sim.get_job_records()] == ["URGENT", "LONG", "NEXT"]
+    assert records["LONG"].preemptions == 1 and records["URGENT"].preemptions == 0
+    assert records["URGENT"].start_time - records["URGENT"].created_time < 0.05
+    stats = sim.final_stats["preemption"]
+    assert stats["preemptions"] == 1
+    #the duration spans the 0.1s suspension
+    if mode == "resume": # 0.2s done, 0.3s left
+        assert records["LONG"].duration == pytest.approx(0.6, abs=0.05)
+        assert stats["lost_time"] == 0.0
+    else: # the 0.2s done are lost, 0.5s again
+        assert records["LONG"].duration == pytest.approx(0.8, abs=0.05)
+        assert stats["lost_time"] == pytest.approx(0.2, abs=0.05)
+
+@pytest.mark.asyncio
+async def test_preemption_only_when_no_printer_is_free(tmp_path):
+    """Test: Urgent jobs take idle printers first and never preempt urgent or unsuited jobs"""
+    sim = Simulator(fleet=[{"materials": ["PLA"]}, {"materials": ["ABS"]}], time_scale=0.01, output_dir=str(tmp_path),
+                    preemption="resume", preempt_priority=1)
+    await sim.start()
+    await sim.add_jobs([Job("P", "PLA", 30, priority=1)])
+    await sim.add_jobs([Job("U1", "ABS", 10, priority=0)]) # printer 1 is idle
+    await sim.add_jobs([Job("U2", "PLA", 10, priority=0)]) # P is urgent too
+    await asyncio.sleep(0.05)
+    assert sim.get_queue_stats()["preemptions"] == 0
+    sim.reprioritize("U2", 2)
+    assert await sim.drain(timeout=5.0)
+    await sim.stop()
+    assert sim.final_stats["preemption"]["preemptions"] == 0
+
+@pytest.mark.asyncio
+async def test_preemption_reads_only_the_head_of_the_queue(tmp_path, monkeypatch):
+    """Test: A large urgent backlog is not scanned once no running job can be preempted"""
+    drawn = []
+    def merge_heaps(heaps):
+        for entry in indexed_heap.merge_heaps(heaps):
+            drawn.append(entry.job.id)
+            yield entry
+    monkeypatch.setattr(simulator, "merge_heaps", merge_heaps)
+    sim = Simulator(num_printers=2, time_scale=0.01, output_dir=str(tmp_path), preemption="resume")
+    await sim.start()
+    await sim.add_jobs([Job("A", "PLA", 1000, priority=2), Job("B", "PLA", 1000, priority=2)])
+    await asyncio.sleep(0.05)
+    await sim.add_jobs([Job(f"U{i}", "PLA", 1000, priority=0) for i in range(2000)])
+    assert drawn == ["U0", "U1"] # both printers told to suspend
+    await asyncio.sleep(0.05)
+    assert {p.current_job.id for p in sim.printers} == {"U0", "U1"}
+
+    drawn.clear()
+    await sim.add_jobs([Job("LAST", "PLA", 10, priority=0)])
+    assert drawn == [] # nothing running can be preempted
+    await sim.stop(cancel_running=True)
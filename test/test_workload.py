@@ -0,0 +1,67 @@
+import pytest
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from workload import generate_jobs, write_workload
+from json_manager import load_jobs_from_json
+
+
+def test_workload_is_reproducible():
+    """Test: The same seed generates the same workload"""
+    first = list(generate_jobs(500, seed=42, arrival="bursty", rate=5.0, cancel_fraction=0.1))
+    second = list(generate_jobs(500, seed=42, arrival="bursty", rate=5.0, cancel_fraction=0.1))
+    other = list(generate_jobs(500, seed=43, arrival="bursty", rate=5.0, cancel_fraction=0.1))
+
+    assert first == second
+    assert first != other
+
+
+def test_poisson_arrivals():
+    """Test: Poisson arrivals are ordered and follow the requested rate"""
+    jobs = list(generate_jobs(20000, seed=1, arrival="poisson", rate=4.0))
+    arrivals = [j["arrival_time"] for j in jobs]
+
+    assert arrivals == sorted(arrivals)
+    assert len(jobs) / arrivals[-1] == pytest.approx(4.0, rel=0.05)
+    assert all(j["est_time"] > 0 and 0 <= j["priority"] <= 5 for j in jobs)
+
+
+def test_cancellations_after_arrival():
+    """Test: cancel_at is only set for a share of jobs and always after the arrival"""
+    jobs = list(generate_jobs(10000, seed=3, arrival="poisson", rate=2.0, cancel_fraction=0.2))
+    cancelled = [j for j in jobs if "cancel_at" in j]
+
+    assert 0.15 < len(cancelled) / len(jobs) < 0.25
+    assert all(j["cancel_at"] >= j["arrival_time"] for j in cancelled)
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+def test_write_workload_streams(tmp_path, fmt):
+    """Test: Streamed workload files are valid and loadable"""
+    filepath = tmp_path / f"workload.{fmt}"
+    written = write_workload(generate_jobs(100, seed=5), filepath, fmt=fmt)
+    assert written == 100
+
+    if fmt == "json":
+        assert len(json.loads(filepath.read_text())["jobs"]) == 100
+        assert len(load_jobs_from_json(str(filepath))) == 100
+    else:
+        lines = filepath.read_text().splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [f"P{i}" for i in range(100)]
+
+
+def test_bursty_arrival_rate():
+    """Test: Bursty arrivals keep the requested long run rate"""
+    jobs = list(generate_jobs(200000, seed=2, arrival="bursty", rate=5.0, burst_size=10))
+    assert len(jobs) / jobs[-1]["arrival_time"] == pytest.approx(5.0, rel=0.03)
+
+
+def test_invalid_workload_parameters():
+    """Test: Invalid generator parameters raise ValueError"""
+    with pytest.raises(ValueError):
+        list(generate_jobs(10, cancel_fraction=0.5, mean_patience=0))
+    with pytest.raises(ValueError):
+        list(generate_jobs(10, material_mix={"PLA": 0.5, "NYLON": 0.5}))